@@ -0,0 +1,146 @@
+"""API 用の JWT 認証。
+
+トークンに変わりにくい情報（username / 表示名 / スタッフ権限）を入れておき、
+request.user はそのクレームから作った遅延ユーザーにする。id や権限の判定はクレームで答え、
+それ以外の属性は User（+ Profile）から読む。読み込んだ User は プロセス内で JWT_USER_CACHE_TTL 秒だけ
+使い回し、User / Profile が保存・削除されたら捨てる（accounts.models 参照）。
+
+- スタッフ権限はクレームから読むため、権限を外してもそのトークンの期限（ACCESS_TOKEN_LIFETIME）までは残る。
+- is_active（退会・無効化・削除）はクレームに頼らず、認証のたびに上のキャッシュ経由で確認する。
+  ワーカーごとに TTL 秒に1回のクエリで済む。
+- キャッシュの破棄は保存したプロセスの中だけ。他のワーカーは最大 JWT_USER_CACHE_TTL 秒、
+  古い User（無効化前の is_active や変更前のプロフィール）を使い続ける。
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import LazyObject, empty
+from rest_framework import exceptions
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+User = get_user_model()
+
+_CACHE_MAX = 5000
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _ttl():
+    return getattr(settings, "JWT_USER_CACHE_TTL", 30)
+
+
+def get_cached_user(user_id):
+    """User（profile 付き）をプロセス内キャッシュから。無ければ1クエリで読んで入れる。
+    呼び出し側が書き換えても共有分に響かないようコピーを返す"""
+    now = time.monotonic()
+    entry = _cache.get(user_id)
+    if entry is None or entry[0] < now:
+        user = User.objects.select_related("profile").filter(pk=user_id).first()
+        if user is None:
+            return None
+        with _cache_lock:
+            if len(_cache) >= _CACHE_MAX:
+                for key in [k for k, (expires, _) in _cache.items() if expires < now]:
+                    del _cache[key]
+            _cache[user_id] = (now + _ttl(), user)
+    else:
+        user = entry[1]
+    clone = copy.copy(user)
+    profile = getattr(user, "profile", None)
+    if profile is not None:
+        clone.profile = copy.copy(profile)
+    return clone
+
+
+def invalidate_cached_user(user_id):
+    with _cache_lock:
+        _cache.pop(user_id, None)
+
+
+def clear_user_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """発行時にクレームを足す（リフレッシュで作る access トークンにも引き継がれる）"""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        profile = getattr(user, "profile", None)
+        token["username"] = user.get_username()
+        token["display_name"] = getattr(profile, "display_name", "") or user.get_username()
+        token["is_staff"] = bool(user.is_staff)
+        return token
+
+
+class TokenClaimsUser(LazyObject):
+    """クレームだけで答えられる属性は DB を引かずに返し、それ以外で初めて User を読み込む"""
+
+    def __init__(self, token):
+        super().__init__()
+        self.__dict__["_token"] = token
+
+    def _setup(self):
+        user = get_cached_user(self.id)
+        if user is None or (api_settings.CHECK_USER_IS_ACTIVE and not user.is_active):
+            raise exceptions.AuthenticationFailed("User not found or inactive", code="user_not_found")
+        self._wrapped = user
+
+    def _claim(self, name, default=None):
+        return self.__dict__["_token"].get(name, default)
+
+    @property
+    def id(self):
+        # simplejwt は user_id を文字列で入れるので、owner_id などと比べられる型に戻す
+        return User._meta.pk.to_python(self._claim(api_settings.USER_ID_CLAIM))
+
+    pk = id
+
+    @property
+    def username(self):
+        if self._wrapped is not empty:
+            return self._wrapped.username
+        return self._claim("username") or ""
+
+    def get_username(self):
+        return self.username
+
+    @property
+    def display_name(self):
+        return self._claim("display_name") or self.username
+
+    @property
+    def is_staff(self):
+        if self._wrapped is not empty:
+            return self._wrapped.is_staff
+        return bool(self._claim("is_staff", False))
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __bool__(self):
+        # IsAuthenticated の `request.user and ...` で読み込ませない
+        return True
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication と同じ検証をして、User の読み込みだけ遅らせる。
+    クレームの無い古いトークンは従来どおりその場で User を読む"""
+
+    def get_user(self, validated_token):
+        if "username" not in validated_token:
+            return super().get_user(validated_token)
+        if validated_token.get(api_settings.USER_ID_CLAIM) is None:
+            raise exceptions.AuthenticationFailed("Token contained no recognizable user identification", code="token_not_valid")
+        user = TokenClaimsUser(validated_token)
+        # 無効化・削除されたユーザーを通さない（読み込みはプロセス内キャッシュから。見つからなければ _setup が弾く）
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise exceptions.AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
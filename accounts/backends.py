@@ -0,0 +1,15 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+User = get_user_model()
+
+
+class ProfileModelBackend(ModelBackend):
+    """ModelBackend と同じ認証で、セッションから読む request.user に profile を JOIN しておく。
+    ヘッダー / サイドバーのアイコンや各画面の user.profile が追加クエリ無しで読める"""
+
+    def get_user(self, user_id):
+        user = User._default_manager.select_related("profile").filter(pk=user_id).first()
+        if user is None:
+            return None
+        return user if self.user_can_authenticate(user) else None
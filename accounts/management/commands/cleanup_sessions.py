@@ -0,0 +1,65 @@
+import os
+import pickle
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+DB_ENGINES = (
+    "django.contrib.sessions.backends.db",
+    "django.contrib.sessions.backends.cached_db",
+)
+CACHE_ENGINES = (
+    "django.contrib.sessions.backends.cache",
+    "django.contrib.sessions.backends.cached_db",
+)
+
+
+def _expired(path, now):
+    """FileBasedCache のファイルは先頭に有効期限（None なら無期限）が pickle されている"""
+    try:
+        with open(path, "rb") as f:
+            expires = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return False
+    return expires is not None and expires < now
+
+
+class Command(BaseCommand):
+    help = "期限切れのセッションを掃除する（DB のセッション行 + ファイルキャッシュのセッション）。cron などで定期実行する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="削除せずに件数だけ表示する")
+
+    def handle(self, *args, **opts):
+        dry_run = opts["dry_run"]
+
+        # DB に書かない設定（cache / signed_cookies）に切り替えた後の django_session は誰も読まないので全部消す
+        rows = Session.objects.all()
+        if settings.SESSION_ENGINE in DB_ENGINES:
+            rows = rows.filter(expire_date__lt=timezone.now())
+        db_count = rows.count()
+        if not dry_run and db_count:
+            rows.delete()
+
+        # Redis / LocMem などは期限切れを自分で捨てる。ファイルキャッシュだけは読まれるまで残る
+        file_count = 0
+        alias = getattr(settings, "SESSION_CACHE_ALIAS", "default")
+        if settings.SESSION_ENGINE in CACHE_ENGINES and isinstance(caches[alias], FileBasedCache):
+            now = time.time()
+            for path in Path(settings.CACHES[alias]["LOCATION"]).glob(f"*{FileBasedCache.cache_suffix}"):
+                if not _expired(path, now):
+                    continue
+                file_count += 1
+                if not dry_run:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+        self.stdout.write(f"{'[dry-run] ' if dry_run else ''}db_sessions={db_count} cache_files={file_count}")
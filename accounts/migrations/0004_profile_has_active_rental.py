@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:10
+
+from django.db import migrations, models
+
+
+def backfill_has_active_rental(apps, schema_editor):
+    Profile = apps.get_model("accounts", "Profile")
+    Rental = apps.get_model("marketplace", "Rental")
+    RentalApplication = apps.get_model("marketplace", "RentalApplication")
+
+    user_ids = set(Rental.objects.filter(status="レンタル中").values_list("renter_id", flat=True))
+    user_ids |= set(
+        RentalApplication.objects
+        .filter(order_type="rental", status__iexact="renting")
+        .values_list("renter_id", flat=True)
+    )
+    Profile.objects.filter(user_id__in=user_ids).update(has_active_rental=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_profile_role_alter_profile_is_admin'),
+        ('marketplace', '0023_media_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='has_active_rental',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_has_active_rental, migrations.RunPython.noop),
+    ]
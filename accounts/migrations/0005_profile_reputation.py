@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:58
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_reputation(apps, schema_editor):
+    Profile = apps.get_model("accounts", "Profile")
+    Review = apps.get_model("marketplace", "Review")
+    Rental = apps.get_model("marketplace", "Rental")
+    Purchase = apps.get_model("marketplace", "Purchase")
+    RentalApplication = apps.get_model("marketplace", "RentalApplication")
+
+    stats = {}
+
+    def add(user_id, **values):
+        if user_id:
+            row = stats.setdefault(user_id, {})
+            for k, v in values.items():
+                row[k] = row.get(k, 0) + (v or 0)
+
+    for row in Review.objects.values("product__owner_id").annotate(n=Count("id"), total=Sum("rating")):
+        add(row["product__owner_id"], review_count=row["n"], rating_sum=row["total"])
+    for row in Rental.objects.filter(status="完了").values("product__owner_id").annotate(n=Count("id")):
+        add(row["product__owner_id"], completed_rentals=row["n"])
+    for row in RentalApplication.objects.filter(order_type="rental", status="completed").values("owner_id").annotate(n=Count("id")):
+        add(row["owner_id"], completed_rentals=row["n"])
+    for row in Purchase.objects.filter(status="完了").values("product__owner_id").annotate(n=Count("id")):
+        add(row["product__owner_id"], completed_purchases=row["n"])
+
+    for user_id, values in stats.items():
+        Profile.objects.filter(user_id=user_id).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_profile_has_active_rental'),
+        ('marketplace', '0025_review_eligibility'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='completed_purchases',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='completed_rentals',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_reputation, migrations.RunPython.noop),
+    ]
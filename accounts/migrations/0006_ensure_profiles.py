@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:10
+
+from django.conf import settings
+from django.db import migrations
+
+
+def create_missing_profiles(apps, schema_editor):
+    """Profile の無い古いユーザーに作っておく（以後は各画面で get_or_create しない）"""
+    app_label, model_name = settings.AUTH_USER_MODEL.split(".")
+    User = apps.get_model(app_label, model_name)
+    Profile = apps.get_model("accounts", "Profile")
+    missing = User.objects.filter(profile__isnull=True).values_list("id", "is_staff")
+    Profile.objects.bulk_create(
+        [Profile(user_id=uid, is_admin=bool(is_staff)) for uid, is_staff in missing.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_profile_reputation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_profiles, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 
 User = get_user_model()
@@ -22,24 +22,83 @@ class Profile(models.Model):
     )
 
     is_admin = models.BooleanField(default=False)
+    # レンタル中の取引があるか（Rental / RentalApplication の状態遷移で更新。marketplace.models 参照）
+    has_active_rental = models.BooleanField(default=False)
+
+    # 出品者としての評価・実績（レビューと取引完了のたびに増減させる集計。marketplace.models 参照）
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    completed_rentals = models.PositiveIntegerField(default=0)
+    completed_purchases = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.display_name or self.user.username
 
+    @property
+    def rating(self):
+        """出品している全商品のレビュー平均（レビューがなければ None）"""
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 2)
+
+    def reputation(self):
+        return {
+            "rating": self.rating,
+            "review_count": self.review_count,
+            "completed_rentals": self.completed_rentals,
+            "completed_purchases": self.completed_purchases,
+        }
+
+
+def profile_for(user):
+    """user.profile を返す（request.user なら ProfileModelBackend が JOIN 済みでクエリ無し）。
+    Profile はユーザー作成時に必ず作られるが、万一無ければここで作る"""
+    try:
+        return user.profile
+    except Profile.DoesNotExist:
+        profile, _ = Profile.objects.get_or_create(user_id=user.pk, defaults={"is_admin": bool(user.is_staff)})
+        return profile
+
 
 @receiver(post_save, sender=User)
-def create_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance, is_admin=False)
+def create_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance, defaults={"is_admin": bool(instance.is_staff)})
+
+
+@receiver(post_init, sender=User)
+def _remember_is_staff(sender, instance, **kwargs):
+    # is_staff を読まずに取った User（only / defer）では読まない（遅延読み込みのクエリを出さない）
+    if "is_staff" not in instance.get_deferred_fields():
+        instance._original_is_staff = instance.is_staff
+
 
 @receiver(post_save, sender=User)
-def sync_profile_is_admin(sender, instance, **kwargs):
+def sync_profile_is_admin(sender, instance, created, raw=False, update_fields=None, **kwargs):
     """
-    User.is_staff を Profile.is_admin に常時同期する。
-    管理画面でスタッフ権限を切り替えたときも即反映。
+    User.is_staff を Profile.is_admin に同期する。
+    管理画面でスタッフ権限を切り替えたときも即反映。is_staff が変わった保存のときだけ動くので、
+    ログインごとの last_login 更新などでは何もしない。
     """
-    profile, _ = Profile.objects.get_or_create(user=instance)
+    if created or raw:
+        return
+    if update_fields is not None and "is_staff" not in update_fields:
+        return
     flag = bool(instance.is_staff)
-    if profile.is_admin != flag:
-        profile.is_admin = flag
-        profile.save(update_fields=["is_admin"])
+    if getattr(instance, "_original_is_staff", None) == flag:
+        return
+    instance._original_is_staff = flag
+    Profile.objects.filter(user=instance).exclude(is_admin=flag).update(is_admin=flag)
+    if type(instance).profile.is_cached(instance):
+        instance.profile.is_admin = flag
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_api_user_cache(sender, instance, **kwargs):
+    """API 認証（accounts.authentication）がプロセス内に持っている User / Profile を捨てる"""
+    from accounts.authentication import invalidate_cached_user
+
+    invalidate_cached_user(instance.pk if sender is User else instance.user_id)
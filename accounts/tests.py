@@ -1,3 +1,152 @@
-from django.test import TestCase
+import datetime
+import io
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import (
+    CachedJWTAuthentication, ClaimsTokenObtainPairSerializer, _cache, clear_user_cache, get_cached_user,
+)
+from accounts.backends import ProfileModelBackend
+from accounts.models import Profile
+
+User = get_user_model()
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        clear_user_cache()
+        self.addCleanup(clear_user_cache)
+        self.user = User.objects.create_user("alice", "a@example.com", "pw", is_staff=True)
+        Profile.objects.filter(user=self.user).update(display_name="Alice")
+        self.user.refresh_from_db()
+        self.token = str(ClaimsTokenObtainPairSerializer.get_token(self.user).access_token)
+
+    def authenticate(self, token=None):
+        request = APIRequestFactory().get("/api/", HTTP_AUTHORIZATION=f"Bearer {token or self.token}")
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_claims_answer_without_queries_once_cached(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            self.assertEqual(user.id, self.user.pk)
+            self.assertTrue(user.is_staff)
+            self.assertEqual(user.display_name, "Alice")
+            self.assertEqual(user.profile.display_name, "Alice")
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleted_user_is_rejected(self):
+        self.authenticate()
+        self.user.delete()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_profile_change_reaches_cached_user(self):
+        self.authenticate()
+        profile = Profile.objects.get(user=self.user)
+        profile.display_name = "Alicia"
+        profile.save()
+        self.assertEqual(self.authenticate().profile.display_name, "Alicia")
+
+    def test_token_without_claims_loads_user(self):
+        user = self.authenticate(str(AccessToken.for_user(self.user)))
+        self.assertIsInstance(user, User)
+
+
+class ProfileSyncTests(TestCase):
+    def setUp(self):
+        clear_user_cache()
+        self.addCleanup(clear_user_cache)
+        self.user = User.objects.create_user("bob", "b@example.com", "pw")
+
+    def is_admin(self):
+        return Profile.objects.get(user=self.user).is_admin
+
+    def test_saves_without_is_staff_change_skip_profile(self):
+        self.user.last_login = timezone.now()
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=["last_login"])
+        with self.assertNumQueries(1):
+            self.user.save()
+
+    def test_is_staff_change_reaches_profile(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertTrue(self.is_admin())
+        user = User.objects.get(pk=self.user.pk)
+        user.is_staff = False
+        user.save(update_fields=["is_staff"])
+        self.assertFalse(self.is_admin())
+
+    def test_session_user_comes_with_profile(self):
+        user = ProfileModelBackend().get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(user.profile.is_admin)
+
+    def test_user_and_profile_saves_drop_api_cache(self):
+        get_cached_user(self.user.pk)
+        self.user.save(update_fields=["last_login"])
+        self.assertNotIn(self.user.pk, _cache)
+        get_cached_user(self.user.pk)
+        Profile.objects.get(user=self.user).save()
+        self.assertNotIn(self.user.pk, _cache)
+
+
+class CleanupSessionsTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        Session.objects.create(session_key="old", session_data="", expire_date=now - datetime.timedelta(days=1))
+        Session.objects.create(session_key="new", session_data="", expire_date=now + datetime.timedelta(days=1))
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command("cleanup_sessions", *args, stdout=out)
+        return out.getvalue()
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.db")
+    def test_db_engine_removes_only_expired_rows(self):
+        self.assertIn("[dry-run] db_sessions=1", self.run_command("--dry-run"))
+        self.assertEqual(Session.objects.count(), 2)
+        self.assertIn("db_sessions=1", self.run_command())
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["new"])
+
+    def test_cache_engine_clears_table_and_expired_files(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, True)
+        sessions_cache = {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": location,
+        }
+        with override_settings(
+            SESSION_ENGINE="django.contrib.sessions.backends.cache",
+            SESSION_CACHE_ALIAS="sessions",
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}, "sessions": sessions_cache},
+        ):
+            cache = caches["sessions"]
+            cache.set("fresh", 1, 3600)
+            cache.set("stale", 1, 1)
+            with mock.patch("time.time", return_value=time.time() + 60):
+                output = self.run_command()
+            self.assertIn("db_sessions=2 cache_files=1", output)
+            self.assertFalse(Session.objects.exists())
+            self.assertEqual(len(list(Path(location).glob("*.djcache"))), 1)
+            self.assertEqual(cache.get("fresh"), 1)
@@ -0,0 +1,115 @@
+"""帳票用の最小限の PDF 出力（外部ライブラリなし・ページ単位で逐次出力）。
+
+日本語は PDF 閲覧ソフト内蔵の CID フォント（HeiseiKakuGo-W5）で表示するため、
+フォントファイルを埋め込まずに済む。出力は行を受け取りながら bytes を yield するので、
+StreamingHttpResponse にそのまま渡せる（保持するのはページ番号とオフセットだけ）。
+"""
+
+PAGE_WIDTH = 842   # A4 横
+PAGE_HEIGHT = 595
+MARGIN = 30
+FONT_SIZE = 8
+LINE_HEIGHT = 11
+
+
+def _text_width(text):
+    # 半角は 0.5、全角は 1 文字幅として概算する
+    return sum(0.5 if ord(ch) < 0x80 else 1 for ch in text) * FONT_SIZE
+
+
+def _fit(text, width):
+    text = str(text or "").replace("\n", " ").replace("\r", " ")
+    if _text_width(text) <= width:
+        return text
+    while text and _text_width(text + "…") > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def _hex(text):
+    # UniJIS-UCS2-HW-H は UCS-2（BMP のみ）。範囲外は〓に置き換える
+    safe = "".join(ch if ord(ch) <= 0xFFFF else "〓" for ch in text)
+    return "<" + safe.encode("utf-16-be").hex().upper() + ">"
+
+
+def _line(cells, columns, y):
+    ops = []
+    for (x, width), text in zip(columns, cells):
+        ops.append(f"BT /F1 {FONT_SIZE} Tf {x} {y} Td {_hex(_fit(text, width))} Tj ET")
+    return "\n".join(ops)
+
+
+def stream_table_pdf(title, headers, rows, widths):
+    """headers / rows の表を A4 横の PDF として逐次出力する。widths は各列の幅(pt)"""
+    columns = []
+    x = MARGIN
+    for w in widths:
+        columns.append((x, w - 4))
+        x += w
+
+    offsets = {}
+    position = 0
+    page_ids = []
+    next_id = 4  # 1: Catalog, 2: Pages, 3: Font（Pages は最後に書く）
+
+    def emit(obj_id, body):
+        nonlocal position
+        chunk = f"{obj_id} 0 obj\n".encode() + body + b"\nendobj\n"
+        offsets[obj_id] = position
+        position += len(chunk)
+        return chunk
+
+    def page(lines, number):
+        nonlocal next_id
+        y = PAGE_HEIGHT - MARGIN - FONT_SIZE
+        ops = [_line([f"{title}  ({number})"], [(MARGIN, PAGE_WIDTH - MARGIN * 2)], y)]
+        y -= LINE_HEIGHT * 2
+        ops.append(_line(headers, columns, y))
+        y -= 4
+        ops.append(f"{MARGIN} {y} m {PAGE_WIDTH - MARGIN} {y} l S")
+        for cells in lines:
+            y -= LINE_HEIGHT
+            ops.append(_line(cells, columns, y))
+        content = "\n".join(ops).encode("ascii")
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        page_ids.append(page_id)
+        return emit(content_id, b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream") + emit(
+            page_id,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode(),
+        )
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    yield emit(3, (
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /HeiseiKakuGo-W5 /Encoding /UniJIS-UCS2-HW-H "
+        b"/DescendantFonts [<< /Type /Font /Subtype /CIDFontType0 /BaseFont /HeiseiKakuGo-W5 "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (Japan1) /Supplement 2 >> "
+        b"/FontDescriptor << /Type /FontDescriptor /FontName /HeiseiKakuGo-W5 /Flags 4 "
+        b"/FontBBox [-92 -250 1010 922] /ItalicAngle 0 /Ascent 752 /Descent -221 /CapHeight 737 /StemV 114 >> "
+        b"/DW 1000 /W [1 95 500] >>] >>"
+    ))
+
+    per_page = int((PAGE_HEIGHT - MARGIN * 2 - LINE_HEIGHT * 3) // LINE_HEIGHT)
+    lines = []
+    for cells in rows:
+        lines.append(cells)
+        if len(lines) == per_page:
+            yield page(lines, len(page_ids) + 1)
+            lines = []
+    if lines or not page_ids:
+        yield page(lines, len(page_ids) + 1)
+
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    yield emit(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode())
+
+    xref_at = position
+    size = next_id
+    xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+    for obj_id in range(1, size):
+        xref.append(f"{offsets[obj_id]:010d} 00000 n \n")
+    xref.append(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n")
+    yield "".join(xref).encode()
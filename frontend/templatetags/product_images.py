@@ -0,0 +1,85 @@
+"""一覧ページ用の商品画像タグ。
+
+    {% load product_images %}
+    {% first_image p as img %}
+    {% if img %}{% product_image img "card" alt=p.title class="w-100" %}{% endif %}
+
+どちらも prefetch 済みの images（Prefetch("images", ...)）だけを見るので、カードごとのクエリは出ない。
+prefetch されていない Product は画像なし扱いになる（ビュー側で prefetch すること）。
+"""
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from marketplace.models import Product
+
+register = template.Library()
+
+# 表示枠: (srcset に並べるサイズ名, 既定の sizes)。同じ枠のサイズ名は縦横比をそろえてある
+SLOTS = {
+    "thumb":  (("thumb", "thumb2x"), "200px"),
+    "card":   (("card", "card2x"), "(max-width: 576px) 50vw, 480px"),
+    "detail": (("detail",), "(max-width: 992px) 100vw, 1200px"),
+}
+
+
+@register.simple_tag
+def first_image(product):
+    """prefetch 済みキャッシュから先頭（id が最小）の画像を返す。DB は引かない"""
+    if product is None:
+        return None
+    cached = getattr(product, "_prefetched_objects_cache", {}).get("images")
+    if not cached:
+        return None
+    return min(cached, key=lambda i: i.pk)
+
+
+def _srcset(image, names, fmt):
+    entries = []
+    for name in names:
+        spec = image.rendition(name)
+        if spec and spec.get(fmt):
+            entries.append((default_storage.url(spec[fmt]), spec["width"]))
+    return format_html_join(", ", "{} {}w", entries)
+
+
+@register.simple_tag
+def product_image(image, slot="card", alt="", sizes=None, **attrs):
+    """サイズ別画像の srcset（WebP があれば <picture> で優先）と width / height 付きの遅延読み込み <img>。
+    image は ProductImage か、images を prefetch 済みの Product。"""
+    if isinstance(image, Product):
+        image = first_image(image)
+    if image is None or not image.image:
+        return ""
+    names, default_sizes = SLOTS.get(slot, SLOTS["card"])
+    sizes = sizes or default_sizes
+
+    base = image.rendition(names[0])
+    if base:
+        width, height = base["width"], base["height"]
+    else:
+        # 未生成なら原本をそのまま出す（寸法が分かっていれば付ける）
+        width, height = image.width, image.height
+    src = image.rendition_url(names[0])
+
+    extra = format_html_join("", ' {}="{}"', sorted(attrs.items()))
+    size_attrs = format_html(' width="{}" height="{}"', width, height) if width and height else ""
+    jpeg_srcset = _srcset(image, names, "jpeg")
+    img = format_html(
+        '<img src="{}"{}{} alt="{}" loading="lazy" decoding="async"{}>',
+        src,
+        format_html(' srcset="{}" sizes="{}"', jpeg_srcset, sizes) if jpeg_srcset else "",
+        size_attrs,
+        alt,
+        extra,
+    )
+    webp_srcset = _srcset(image, names, "webp")
+    if not webp_srcset:
+        return img
+    # display:contents で <picture> 自体は箱を作らず、既存の img 向け CSS がそのまま効く
+    return format_html(
+        '<picture style="display:contents"><source type="image/webp" srcset="{}" sizes="{}">{}</picture>',
+        webp_srcset,
+        sizes,
+        img,
+    )
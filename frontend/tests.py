@@ -1,3 +1,418 @@
-from django.test import TestCase
+import base64
+import datetime
+import random
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Profile
+from frontend.pdf import MARGIN, PAGE_WIDTH
+from frontend.templatetags.product_images import first_image, product_image
+from frontend.views import (
+    MANIFEST_COLUMNS,
+    _contact_snapshots,
+    _create_shipment_for_rental,
+    _rental_purchase_pricing,
+    _rental_purchase_pricing_args,
+    _rental_purchase_pricing_many,
+    _user_can_review_product,
+)
+from marketplace.models import (
+    Product, ProductComment, ProductImage, Purchase, Rental, RentalApplication, ReviewEligibility, Shipment,
+)
+from marketplace.testing import MarketplaceTestCase
+
+User = get_user_model()
+
+
+class RentalListPageTests(MarketplaceTestCase):
+    def test_my_rentals_reaches_rows_after_first_page(self):
+        for _ in range(25):
+            self.make_rental()
+        self.client.force_login(self.buyer)
+        url = reverse("frontend:my_rentals")
+
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.context["total_count"], 25)
+        self.assertContains(first, "?page=2")
+        self.assertContains(first, 'name="status"')
+
+        second = self.client.get(url, {"page": 2})
+        self.assertEqual(len(second.context["my_active_rentals"].object_list), 5)
+
+    def test_received_rentals_status_filter_keeps_querystring(self):
+        for _ in range(22):
+            self.make_rental(status=Rental.Status.APPROVED)
+        self.make_rental(status=Rental.Status.SHIPPED)
+        self.client.force_login(self.seller)
+
+        r = self.client.get(reverse("frontend:received_rentals"), {"status": Rental.Status.APPROVED})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.context["page_obj"].paginator.count, 22)
+        self.assertContains(r, "?page=2&status=")
+
+
+class RentalPurchasePricingManyTests(SimpleTestCase):
+    """_rental_purchase_pricing_many は1行ずつ _rental_purchase_pricing を呼んだ結果と一致する"""
+
+    TODAY = datetime.date(2026, 3, 15)
+
+    def random_row(self, rnd):
+        def maybe(value):
+            return value if rnd.random() < 0.8 else None
+
+        base = self.TODAY + datetime.timedelta(days=rnd.randint(-40, 10))
+        start = maybe(base)
+        end = maybe(base + datetime.timedelta(days=rnd.randint(-3, 30)))
+        received = None
+        if rnd.random() < 0.4:
+            received = base + datetime.timedelta(days=rnd.randint(-2, 5))
+            if rnd.random() < 0.5:
+                received = datetime.datetime.combine(received, datetime.time(rnd.randint(0, 23)))
+        product = SimpleNamespace(
+            price_buy=maybe(rnd.choice([0, 1, 980, 5000, 123457])),
+            price_per_day=maybe(rnd.choice([0, 1, 100, 2500])),
+        )
+        return SimpleNamespace(
+            product=product,
+            quantity=maybe(rnd.randint(0, 5)),
+            start_date=start,
+            end_date=end,
+            rental_start_date=received,
+            total_price=maybe(rnd.choice([0, 300, 1001, 99999])),
+            total_days=maybe(rnd.randint(-1, 30)),
+        )
+
+    def test_matches_single_row_pricing(self):
+        rnd = random.Random(20260315)
+        for _ in range(50):
+            rows = [self.random_row(rnd) for _ in range(rnd.randint(0, 40))]
+            with mock.patch("django.utils.timezone.localdate", return_value=self.TODAY):
+                batch = _rental_purchase_pricing_many(rows)
+                single = [_rental_purchase_pricing(**_rental_purchase_pricing_args(row)) for row in rows]
+            self.assertEqual(batch, single)
+
+
+class ShipmentFilterTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user("staff", "st@example.com", "pw", is_staff=True)
+        self.make_shipment(tracking_no="TN-1")
+        self.client.force_login(self.staff)
+
+    def test_impossible_date_is_ignored(self):
+        r = self.client.get(reverse("frontend:admin_shipping"), {"date_from": "2024-02-30", "date_to": "2024-13-01"})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.context["selected"]["date_from"], "")
+        self.assertEqual(r.context["page_obj"].paginator.count, 1)
+
+    def test_keyword_matches_product_title(self):
+        r = self.client.get(reverse("frontend:admin_shipping"), {"q": "cam"})
+        self.assertEqual(r.context["page_obj"].paginator.count, 1)
+
+    def count(self, q):
+        return self.client.get(reverse("frontend:admin_shipping"), {"q": q}).context["page_obj"].paginator.count
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite の FTS5 経路")
+    def test_sqlite_keyword_search_uses_fts_and_follows_edits(self):
+        s = self.make_shipment(tracking_no="AB-123456", to_name="山田花子")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.count("ab-1234"), 1)
+        self.assertTrue(any("MATCH" in q["sql"] for q in ctx.captured_queries))
+        self.assertEqual(self.count("山田花"), 1)
+        self.assertEqual(self.count('"x'), 0)  # 引用符を含んでも FTS の構文エラーにしない
+        self.assertEqual(self.count("AB"), 1)  # 3文字未満は icontains
+        self.assertEqual(self.count("cam"), 2)
+
+        s.tracking_no = "ZZ-999999"
+        s.save(update_fields=["tracking_no"])
+        self.product.title = "Tripod"
+        self.product.save(update_fields=["title"])
+        self.assertEqual((self.count("ab-1234"), self.count("zz-999"), self.count("cam")), (0, 1, 0))
+        self.assertEqual(self.count("tripod"), 2)
+        s.delete()
+        self.assertEqual(self.count("zz-999"), 0)
+
+
+class ShippingImportTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user("staff", "st@example.com", "pw", is_staff=True)
+        self.shipment = self.make_shipment(tracking_no="TN-1", status=Shipment.Status.IN_TRANSIT)
+        self.url = reverse("frontend:shipping_import")
+
+    def post(self, name, data):
+        return self.client.post(self.url, {"file": SimpleUploadedFile(name, data)})
+
+    def test_import_reports_and_updates(self):
+        self.client.force_login(self.staff)
+        r = self.post("s.csv", "\ufefftracking_no,status\nTN-1,delivered\nTN-9,delivered\n".encode("utf-8"))
+        self.assertRedirects(r, reverse("frontend:admin_shipping"), fetch_redirect_response=False)
+        self.shipment.refresh_from_db()
+        self.assertEqual(self.shipment.status, Shipment.Status.DELIVERED)
+        self.assertIn("未登録 1 件", [str(m) for m in get_messages(r.wsgi_request)][0])
+
+    def test_undecodable_file_is_rejected(self):
+        self.client.force_login(self.staff)
+        r = self.post("s.csv", "tracking_no,status\nTN-1,配達完了\n".encode("shift_jis"))
+        self.assertEqual(r.status_code, 302)
+        self.assertIn("読み込めません", str(list(get_messages(r.wsgi_request))[0]))
+        self.shipment.refresh_from_db()
+        self.assertEqual(self.shipment.status, Shipment.Status.IN_TRANSIT)
+
+    def test_decode_error_after_first_batch_applies_nothing(self):
+        self.client.force_login(self.staff)
+        lines = ["TN-1,delivered"] + [f"TN-X{i},delivered" for i in range(5000)]
+        data = ("tracking_no,status\n" + "\n".join(lines) + "\n").encode("utf-8") + b"TN-Y,\xff\n"
+        r = self.post("s.csv", data)
+        self.assertIn("読み込めません", str(list(get_messages(r.wsgi_request))[0]))
+        self.shipment.refresh_from_db()
+        self.assertEqual(self.shipment.status, Shipment.Status.IN_TRANSIT)
+
+    def test_staff_only(self):
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.post("s.csv", b"tracking_no,status\n").status_code, 403)
+
+
+class ShipmentSnapshotTests(MarketplaceTestCase):
+    def profile_queries(self, ctx):
+        return [q["sql"] for q in ctx.captured_queries if Profile._meta.db_table in q["sql"]]
+
+    def test_snapshots_fetch_both_profiles_once_per_request(self):
+        request = SimpleNamespace()
+        with CaptureQueriesContext(connection) as ctx:
+            snaps = _contact_snapshots([self.seller, self.buyer], request=request)
+            again = _contact_snapshots([self.buyer, self.seller], request=request)
+        self.assertEqual(len(self.profile_queries(ctx)), 1)
+        self.assertEqual(snaps, again)
+        self.assertEqual((snaps[self.seller.pk]["name"], snaps[self.seller.pk]["address"]), ("Seller", "Tokyo"))
+        self.assertEqual(snaps[self.buyer.pk]["name"], "buyer")  # 表示名が無ければユーザー名
+
+    def test_upsert_snapshots_once_and_then_updates_tracking_only(self):
+        rental = self.make_rental(shipping_address="Osaka")
+        shipment = _create_shipment_for_rental(rental, Shipment.Direction.OUTBOUND)
+        self.assertEqual(
+            (shipment.from_name, shipment.from_address, shipment.to_name, shipment.to_address),
+            ("Seller", "Tokyo", "buyer", "Osaka"),
+        )
+        Profile.objects.filter(user=self.seller).update(display_name="Renamed")
+        with CaptureQueriesContext(connection) as ctx:
+            again = _create_shipment_for_rental(
+                rental, Shipment.Direction.OUTBOUND, tracking_no="TN-9", status=Shipment.Status.IN_TRANSIT,
+            )
+        self.assertEqual(self.profile_queries(ctx), [])
+        self.assertEqual(again.pk, shipment.pk)
+        again.refresh_from_db()
+        self.assertEqual((again.tracking_no, again.status, again.from_name), ("TN-9", Shipment.Status.IN_TRANSIT, "Seller"))
+
+
+class ShippingExportTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user("staff", "st@example.com", "pw", is_staff=True)
+        self.make_shipment(tracking_no="TN-1", to_name="=HYPERLINK(\"http://x\")", to_phone="+81-3-0000")
+        self.client.force_login(self.staff)
+
+    def export(self, **params):
+        r = self.client.get(reverse("frontend:shipping_export"), params)
+        self.assertEqual(r.status_code, 200)
+        return b"".join(r.streaming_content)
+
+    def test_csv_escapes_formula_cells(self):
+        body = self.export(fmt="csv").decode("utf-8")
+        self.assertIn("'=HYPERLINK", body)
+        self.assertIn("'+81-3-0000", body)
+        self.assertIn("TN-1", body)
+
+    def test_impossible_date_is_ignored(self):
+        body = self.export(fmt="csv", date_to="2024-02-30").decode("utf-8")
+        self.assertIn("TN-1", body)
+
+    def test_pdf_columns_fit_page(self):
+        self.assertLessEqual(sum(c[2] for c in MANIFEST_COLUMNS), PAGE_WIDTH - 2 * MARGIN)
+        self.assertTrue(self.export(fmt="pdf").startswith(b"%PDF"))
+
+
+class ProductImageTagTests(SimpleTestCase):
+    def setUp(self):
+        self.image = ProductImage(pk=2, image="products/a.jpg", width=1600, height=1200, renditions={
+            "card": {"width": 480, "height": 360, "jpeg": "r/a_card.jpg", "webp": "r/a_card.webp"},
+            "card2x": {"width": 960, "height": 720, "jpeg": "r/a_card2x.jpg", "webp": "r/a_card2x.webp"},
+        })
+
+    def test_card_has_srcset_size_and_lazy_loading(self):
+        html = product_image(self.image, "card", alt="Cam")
+        self.assertIn('srcset="/media/r/a_card.jpg 480w, /media/r/a_card2x.jpg 960w"', html)
+        self.assertIn('<source type="image/webp" srcset="/media/r/a_card.webp 480w, /media/r/a_card2x.webp 960w"', html)
+        self.assertIn('width="480" height="360"', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_missing_renditions_fall_back_to_original(self):
+        self.image.renditions = {}
+        html = product_image(self.image, "thumb")
+        self.assertIn('src="/media/products/a.jpg"', html)
+        self.assertIn('width="1600" height="1200"', html)
+        self.assertNotIn("srcset", html)
+
+    def test_first_image_reads_only_prefetched_images(self):
+        product = Product(pk=1)
+        self.assertIsNone(first_image(product))  # SimpleTestCase なのでクエリが出れば失敗する
+        product._prefetched_objects_cache = {"images": [self.image, ProductImage(pk=1, image="products/b.jpg")]}
+        self.assertEqual(first_image(product).pk, 1)
+        self.assertEqual(product_image(Product(pk=3)), "")
+
+
+class ProfileTabTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(11):
+            Product.objects.create(owner=self.seller, title=f"P{i}", category="その他", price_per_day=100)
+        self.client.force_login(self.seller)
+
+    def tab(self, tab, **params):
+        return self.client.get(reverse("frontend:profile_tab", args=[tab]), params)
+
+    def test_posts_tab_json_is_paginated(self):
+        first = self.tab("posts", format="json").json()
+        self.assertEqual(len(first["items"]), 10)
+        self.assertEqual(first["page"], {"number": 1, "num_pages": 2, "count": 12, "has_next": True})
+        self.assertEqual(first["items"][0]["title"], "P10")
+        last = self.tab("posts", format="json", page=2).json()
+        self.assertEqual([item["title"] for item in last["items"]], ["P0", "Cam"])
+
+    def test_fragment_and_unknown_tab(self):
+        r = self.tab("posts")
+        self.assertEqual(r.status_code, 200)
+        self.assertTemplateUsed(r, "frontend/profile/_tab_posts.html")
+        self.assertEqual(self.tab("settings").status_code, 404)
+
+    def test_rentals_tab_follows_cached_rental_flag(self):
+        rental = self.make_rental()
+        self.assertFalse(Profile.objects.get(user=self.buyer).has_active_rental)
+        rental.status = Rental.Status.RENTING
+        rental.save()
+        self.assertTrue(Profile.objects.get(user=self.buyer).has_active_rental)
+        self.client.force_login(self.buyer)
+        items = self.tab("rentals", format="json").json()["items"]
+        self.assertEqual([item["rental_id"] for item in items], [rental.pk])
+        rental.status = Rental.Status.RETURNED
+        rental.save()
+        self.assertFalse(Profile.objects.get(user=self.buyer).has_active_rental)
+
+
+class ReviewEligibilityTests(MarketplaceTestCase):
+    """完了した購入・レンタル・申請の借り手／購入者だけがレビューできる（3つの EXISTS だった頃と同じ判定）"""
+
+    def setUp(self):
+        super().setUp()
+        self.stranger = User.objects.create_user("stranger", "x@example.com", "pw")
+
+    def assert_completion_grants(self, tx, completed):
+        self.assertFalse(_user_can_review_product(self.buyer, self.product))
+        tx.status = completed
+        tx.save()
+        self.assertTrue(_user_can_review_product(self.buyer, self.product))
+        self.assertTrue(ReviewEligibility.allows(self.buyer, self.product))
+        self.assertFalse(_user_can_review_product(self.stranger, self.product))
+        self.assertFalse(_user_can_review_product(self.seller, self.product))
+
+    def test_purchase(self):
+        purchase = Purchase.objects.create(product=self.product, buyer=self.buyer, seller=self.seller)
+        self.assert_completion_grants(purchase, Purchase.Status.COMPLETED)
+
+    def test_rental(self):
+        self.assert_completion_grants(self.make_rental(), Rental.Status.COMPLETED)
+
+    def test_application(self):
+        app = RentalApplication.objects.create(
+            product=self.product, owner=self.seller, renter=self.buyer,
+            order_type=RentalApplication.OrderType.RENTAL, payment_method="card",
+        )
+        self.assert_completion_grants(app, RentalApplication.Status.COMPLETED)
+
+    def test_cancelled_transactions_do_not_grant(self):
+        Purchase.objects.create(product=self.product, buyer=self.buyer, seller=self.seller, status=Purchase.Status.CANCELED)
+        self.make_rental(status=Rental.Status.CANCELED)
+        self.assertFalse(_user_can_review_product(self.buyer, self.product))
+
+    def test_owner_cannot_review_own_product(self):
+        Purchase.objects.create(product=self.product, buyer=self.seller, seller=self.seller, status=Purchase.Status.COMPLETED)
+        self.assertFalse(_user_can_review_product(self.seller, self.product))
+
+
+class CommentKeysetPageTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("frontend:product_comments_page", args=[self.product.pk])
+        for i in range(23):
+            ProductComment.objects.create(product=self.product, user=self.buyer, body=f"c{i}")
+        # 同じ時刻の行が多くても id で順序が決まり、ページの境目で重複・欠落しない
+        ProductComment.objects.update(created_at=timezone.now())
+
+    def test_pages_cover_every_comment_once(self):
+        seen, cursor = [], None
+        while True:
+            data = self.client.get(self.url, {"cursor": cursor} if cursor else {}).json()
+            seen += [item["id"] for item in data["items"]]
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        ids = list(ProductComment.objects.order_by("-id").values_list("id", flat=True))
+        self.assertEqual(seen, ids)
+
+    def test_broken_cursors_are_bad_requests(self):
+        def encode(raw):
+            return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+        for cursor in ("zzz", encode("not-a-date|1"), encode("2026-01-01T00:00:00+00:00|x"), encode("no-separator")):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(self.url, {"cursor": cursor}).status_code, 400)
+
+    def test_unknown_product_is_404(self):
+        self.assertEqual(self.client.get(reverse("frontend:product_comments_page", args=[999999])).status_code, 404)
+
+
+class ProductDetailBundleTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.url = reverse("frontend:product_detail", args=[self.product.pk])
+
+    def version(self):
+        return Product.objects.values_list("detail_version", flat=True).get(pk=self.product.pk)
+
+    def test_version_lives_on_the_product_row(self):
+        self.client.get(self.url)
+        before = self.version()
+        # 別プロセスでの投稿と同じく、このプロセスのキャッシュを経由せずに DB の版だけが上がる
+        ProductComment.objects.create(product=self.product, user=self.buyer, body="hello")
+        self.assertEqual(self.version(), before + 1)
+        r = self.client.get(self.url)
+        self.assertEqual(r.context["comment_count"], 1)
+
+    def test_author_rename_rebuilds_bundle(self):
+        ProductComment.objects.create(product=self.product, user=self.buyer, body="hello")
+        self.assertContains(self.client.get(self.url), "buyer")
+        profile = Profile.objects.get(user=self.buyer)
+        profile.display_name = "Renamed"
+        profile.save()
+        self.assertContains(self.client.get(self.url), "Renamed")
+
+    def test_unrelated_profile_save_keeps_version(self):
+        ProductComment.objects.create(product=self.product, user=self.buyer, body="hello")
+        before = self.version()
+        profile = Profile.objects.get(user=self.buyer)
+        profile.address = "Osaka"
+        profile.save()
+        self.assertEqual(self.version(), before)
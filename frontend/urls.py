@@ -14,6 +14,8 @@ urlpatterns = [
     path("products/<int:pk>/", views.ProductDetailView.as_view(), name="product_detail"),
     path("products/<int:pk>/comments/", views.product_comment_create, name="product_comment_create"),
     path("products/<int:pk>/comments/<int:comment_id>/delete/", views.product_comment_delete, name="product_comment_delete"),
+    path("products/<int:pk>/comments/more/", views.product_comments_page, name="product_comments_page"),
+    path("products/<int:pk>/reviews/more/", views.product_reviews_page, name="product_reviews_page"),
     path("products/<int:product_id>/review/", views.review_create, name="product_review_create"),
     # frontend/urls.py
     path('products/<int:pk>/favorite/toggle/', views.product_favorite_toggle, name='product_favorite_toggle'),
@@ -37,6 +39,7 @@ urlpatterns = [
     path("purchases/received/", views.received_purchases, name="received_purchases"),
     path("purchases/<int:purchase_id>/hide_mine/", views.purchase_hide_mine, name="purchase_hide_mine"),
     path("purchases/<int:purchase_id>/hide_received/", views.purchase_hide_received, name="purchase_hide_received"),
+    path("rentals/mine/", views.my_rentals, name="my_rentals"),
     path("rentals/received/", views.received_rentals, name="received_rentals"),
     path("rentals/", views.rentals_index, name="rentals"),
 
@@ -48,9 +51,14 @@ urlpatterns = [
     path("messages/",  views.MessagesPage.as_view(),     name="messages"),
     path("notifications/", views.my_notifications, name="notifications"),
     path("profile/", views.profile, name="profile"),
+    path("profile/tabs/<str:tab>/", views.profile_tab, name="profile_tab"),
 
     path("docs/",      views.DocumentationView.as_view(),name="docs"),
     path("admin/shipping/", views.AdminShippingView.as_view(), name="admin_shipping"),
+    path("admin/shipping/update/", views.shipping_update, name="shipping_update"),
+    path("admin/shipping/bulk/", views.shipping_bulk_update, name="shipping_bulk_update"),
+    path("admin/shipping/import/", views.shipping_import, name="shipping_import"),
+    path("admin/shipping/export/", views.shipping_export, name="shipping_export"),
 
     # 認証
     path("login/",  auth_views.LoginView.as_view(template_name="registration/login.html"), name="login"),
@@ -6,26 +6,38 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import EmailMessage
-from django.db import transaction
-from django.db.models import Q, Prefetch, Exists, OuterRef, Value, BooleanField, Count, Subquery, Avg, FloatField
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import (
+    Q, Prefetch, Exists, OuterRef, Value, BooleanField, Count, Subquery, Avg, FloatField, ExpressionWrapper,
+)
+from django.db.models.expressions import RawSQL
 from django.db.models.functions import Coalesce
 from django.http import (
-    JsonResponse, HttpResponseBadRequest, HttpResponseForbidden, Http404
+    JsonResponse, HttpResponseBadRequest, HttpResponseForbidden, Http404, StreamingHttpResponse
 )
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib import messages
-from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.views.generic import ListView, DetailView, TemplateView
 
+import base64
+import csv
+import io
+import itertools
 import re
+from datetime import datetime, time, timedelta
 
-from accounts.models import Profile
+from accounts.models import Profile, profile_for
 from .models import ContactInquiry
+from .pdf import stream_table_pdf
 from chat.models import ChatRoom, ChatMessage
 from chat.utils import is_purchase_chat_available
 from marketplace.models import (
@@ -38,7 +50,13 @@ from marketplace.models import (
     Shipment,
     ProductComment,
     Review,
+    ReviewEligibility,
+    TransactionEvent,
+    record_transaction_events,
+    refresh_active_rental,
+    set_favorite,
 )
+from marketplace.utils import apply_status_rows, iter_status_rows, set_shipment_status
 
 # 通知アプリが無い環境でも落ちないように
 try:
@@ -56,6 +74,37 @@ CATEGORIES = [
 
 COMPLETED_STATUSES = ("完了", "キャンセル")
 
+# 申請一覧の絞り込み候補（"renting" は画面側で使う実ステータスのため追加）
+APPLICATION_STATUS_CHOICES = list(RentalApplication.Status.choices) + [("renting", "レンタル中")]
+
+# 申請（RentalApplication）一覧の表示ラベル / バッジ色
+APPLICATION_STATUS_LABELS = {
+    "PENDING": "申請中",
+    "APPROVED": "承認済み",
+    "SHIPPED": "発送済み",
+    "RECEIVED": "受取済み",
+    "RENTING": "レンタル中",
+    "RETURN_SHIPPED": "返却発送済み",
+    "COMPLETED": "完了",
+    "REJECTED": "却下",
+    "CANCELLED": "キャンセル",
+}
+APPLICATION_BADGE_CLASSES = {
+    "PENDING": "secondary",
+    "APPROVED": "primary",
+    "SHIPPED": "info",
+    "RECEIVED": "success",
+    "RENTING": "success",
+    "RETURN_SHIPPED": "dark",
+    "COMPLETED": "secondary",
+    "REJECTED": "danger",
+    "CANCELLED": "dark",
+}
+
+# 取引管理系ページの1ページあたり件数
+TRANSACTION_PAGE_SIZE = 20
+SHIPPING_PAGE_SIZE = 50
+
 MAX_UPLOAD_MB = 5
 ALLOWED_CONTENT_TYPES = {
     "image/jpeg", "image/png", "image/gif",
@@ -191,6 +240,59 @@ def _strip_return_tracking_line(message):
     return "\n".join(lines).strip()
 
 
+def _paginate(request, qs, per_page=TRANSACTION_PAGE_SIZE):
+    """一覧を DB 側の LIMIT/OFFSET でページ単位に切り出す"""
+    return Paginator(qs, per_page).get_page(request.GET.get("page"))
+
+
+def _status_filter(request, qs, choices, field="status"):
+    """?status= を SQL の WHERE に寄せる（choices に無い値は無視）"""
+    selected = (request.GET.get("status") or "").strip()
+    if selected and selected in {value for value, _ in choices}:
+        return qs.filter(**{field: selected}), selected
+    return qs, ""
+
+
+def _list_querystring(request):
+    params = request.GET.copy()
+    params.pop("page", None)
+    return params.urlencode()
+
+
+def _paginated_list(request, qs, choices, field="status", prepare=None):
+    """ステータス絞り込み + ページングした一覧と、テンプレ用の共通コンテキストを返す"""
+    filtered, selected = _status_filter(request, qs, choices, field)
+    page = _paginate(request, filtered)
+    if prepare is not None:
+        page.object_list = prepare(page.object_list)
+    total = page.paginator.count if not selected else qs.count()
+    return page, total, {
+        "page_obj": page,
+        "status_choices": choices,
+        "selected_status": selected,
+        "querystring": _list_querystring(request),
+    }
+
+
+def _paginated_tabs(request, mine_qs, received_qs, choices, field="status", prepare=None):
+    """「自分 / 受け取った」タブ構成の一覧。表示中タブのみページングし、もう片方は件数だけ取る"""
+    active_tab = "received" if request.GET.get("tab") == "received" else "mine"
+    if active_tab == "received":
+        page, received_count, ctx = _paginated_list(request, received_qs, choices, field, prepare)
+        mine_count = mine_qs.count()
+    else:
+        page, mine_count, ctx = _paginated_list(request, mine_qs, choices, field, prepare)
+        received_count = received_qs.count()
+    ctx.update({
+        "active_tab": active_tab,
+        "mine": page if active_tab == "mine" else [],
+        "received": page if active_tab == "received" else [],
+        "mine_count": mine_count,
+        "received_count": received_count,
+    })
+    return ctx
+
+
 def _handle_rental_action(request, user, redirect_name):
     action = request.POST.get("action")
     rental_id = request.POST.get("rental_id")
@@ -217,6 +319,7 @@ def _handle_rental_action(request, user, redirect_name):
             _create_shipment_for_rental(
                 rental,
                 getattr(Shipment.Direction, "OUTBOUND", "outbound"),
+                request=request,
             )
 
             _create_notification(
@@ -242,28 +345,15 @@ def _handle_rental_action(request, user, redirect_name):
             rental.tracking_number_to_renter = tracking_number
             rental.save(update_fields=["status", "shipped_date_to_renter", "tracking_number_to_renter"])
 
-            # ▼ 追加: 配送(往路)レコードを起票
-            owner_p  = Profile.objects.filter(user=rental.product.owner).first()
-            renter_p = Profile.objects.filter(user=rental.renter).first()
-            Shipment.objects.update_or_create(
-                rental=rental,
-                direction=getattr(Shipment.Direction, "OUTBOUND", "outbound"),
-                defaults={
-                    "kind": getattr(Shipment.Kind, "RENTAL", "rental"),
-                    "product": rental.product,
-                    "from_name":  (getattr(owner_p,  "display_name", "") or rental.product.owner.username)[:120],
-                    "from_phone": getattr(owner_p,  "phone", "")[:40],
-                    "from_address": getattr(owner_p, "address", "")[:255],
-                    "to_name":    (getattr(renter_p, "display_name", "") or rental.renter.username)[:120],
-                    "to_phone":   getattr(renter_p, "phone", "")[:40],
-                    "to_address": (rental.shipping_address or getattr(renter_p, "address", ""))[:255],
-                    "tracking_no": tracking_number,
-                    "status": getattr(Shipment.Status, "IN_TRANSIT", "in_transit"),
-                    "is_platform_intermediated": True,
-                }
+            # ▼ 配送(往路)レコード（承認時に作成済みなら追跡番号と状態だけ更新）
+            _create_shipment_for_rental(
+                rental,
+                getattr(Shipment.Direction, "OUTBOUND", "outbound"),
+                tracking_no=tracking_number,
+                status=getattr(Shipment.Status, "IN_TRANSIT", "in_transit"),
+                request=request,
             )
 
-
             _create_notification(
                 rental.renter,
                 "商品発送のお知らせ",
@@ -313,28 +403,15 @@ def _handle_rental_action(request, user, redirect_name):
             rental.tracking_number_return = tracking_number
             rental.save(update_fields=["status", "shipped_date_return", "tracking_number_return"])
 
-            # ▼ 追加: 配送(返却)レコードを起票
-            owner_p  = Profile.objects.filter(user=rental.product.owner).first()
-            renter_p = Profile.objects.filter(user=rental.renter).first()
-            Shipment.objects.update_or_create(
-                rental=rental,
-                direction=getattr(Shipment.Direction, "RETURN", "return"),
-                defaults={
-                    "kind": getattr(Shipment.Kind, "RENTAL", "rental"),
-                    "product": rental.product,
-                    "from_name":  (getattr(renter_p, "display_name", "") or rental.renter.username)[:120],
-                    "from_phone": getattr(renter_p, "phone", "")[:40],
-                    "from_address": getattr(renter_p, "address", "")[:255],
-                    "to_name":    (getattr(owner_p,  "display_name", "") or rental.product.owner.username)[:120],
-                    "to_phone":   getattr(owner_p,  "phone", "")[:40],
-                    "to_address": getattr(owner_p,  "address", "")[:255],
-                    "tracking_no": tracking_number,
-                    "status": getattr(Shipment.Status, "IN_TRANSIT", "in_transit"),
-                    "is_platform_intermediated": True,
-                }
+            # ▼ 配送(返却)レコードを起票
+            _create_shipment_for_rental(
+                rental,
+                getattr(Shipment.Direction, "RETURN", "return"),
+                tracking_no=tracking_number,
+                status=getattr(Shipment.Status, "IN_TRANSIT", "in_transit"),
+                request=request,
             )
 
-
             _create_notification(
                 rental.product.owner,
                 "商品返却発送のお知らせ",
@@ -469,6 +546,7 @@ def _handle_purchase_action(request, redirect_name):
                     _create_shipment_for_purchase(
                         purchase,
                         getattr(Shipment.Direction, "OUTBOUND", "outbound"),
+                        request=request,
                     )
                     from django.contrib import messages
                     messages.success(request, "承認しました。追跡番号入力が有効になりました。")
@@ -493,37 +571,15 @@ def _handle_purchase_action(request, redirect_name):
 
                 purchase.save(update_fields=update_fields)
 
-                # ▼ 配送(往路)レコードを作成/更新
-                seller_p = Profile.objects.filter(user=purchase.product.owner).first()
-                buyer_p  = Profile.objects.filter(user=purchase.buyer).first()
-
-                from_name  = (getattr(seller_p, "display_name", "") or purchase.product.owner.username)[:120]
-                from_phone = (getattr(seller_p, "phone", "") or "")[:40]
-                from_addr  = (getattr(seller_p, "address", "") or "")[:255]
-
-                ship_addr  = (getattr(purchase, "shipping_address", "") or getattr(buyer_p, "address", "") or "")[:255]
-                to_name    = (getattr(buyer_p, "display_name", "") or purchase.buyer.username)[:120]
-                to_phone   = (getattr(buyer_p, "phone", "") or "")[:40]
-
-                Shipment.objects.update_or_create(
-                    purchase=purchase,
-                    direction=getattr(Shipment.Direction, "OUTBOUND", "outbound"),
-                    defaults={
-                        "kind": getattr(Shipment.Kind, "PURCHASE", "purchase"),
-                        "product": purchase.product,
-                        "from_name": from_name,
-                        "from_phone": from_phone,
-                        "from_address": from_addr,
-                        "to_name": to_name,
-                        "to_phone": to_phone,
-                        "to_address": ship_addr,
-                        "tracking_no": tracking,
-                        "status": getattr(Shipment.Status, "IN_TRANSIT", "in_transit"),
-                        "is_platform_intermediated": True,
-                    }
+                # ▼ 配送(往路)レコード（承認時に作成済みなら追跡番号と状態だけ更新）
+                _create_shipment_for_purchase(
+                    purchase,
+                    getattr(Shipment.Direction, "OUTBOUND", "outbound"),
+                    tracking_no=tracking,
+                    status=getattr(Shipment.Status, "IN_TRANSIT", "in_transit"),
+                    request=request,
                 )
 
-
                 from django.contrib import messages
                 messages.success(request, "発送済みに更新しました。")
 
@@ -596,46 +652,13 @@ def _purchase_completed_statuses():
 
 
 
-def _rental_completed_statuses():
-    return {
-        getattr(Rental.Status, "COMPLETED", "COMPLETED"),
-        "COMPLETED",
-        "completed",
-    }
-
-
-def _rental_app_completed_statuses():
-    return {
-        getattr(RentalApplication.Status, "COMPLETED", "completed"),
-        "COMPLETED",
-        "completed",
-    }
-
-
 def _user_can_review_product(user, product):
+    """借り手・購入者として取引を完了した商品か（ReviewEligibility の1行を見るだけ）"""
     if not user or not product:
         return False
     if getattr(product, "owner_id", None) == getattr(user, "id", None):
         return False
-    if Purchase.objects.filter(
-        product_id=product.id,
-        buyer_id=user.id,
-        status__in=_purchase_completed_statuses(),
-    ).exists():
-        return True
-    if Rental.objects.filter(
-        product_id=product.id,
-        renter_id=user.id,
-        status__in=_rental_completed_statuses(),
-    ).exists():
-        return True
-    if RentalApplication.objects.filter(
-        product_id=product.id,
-        renter_id=user.id,
-        status__in=_rental_app_completed_statuses(),
-    ).exists():
-        return True
-    return False
+    return ReviewEligibility.allows(user, product)
 
 
 def _purchase_return_in_progress(purchase):
@@ -668,6 +691,9 @@ def _prepare_purchase_items(qs):
 def _purchase_completed_for_app(app):
     if not app or not app.product_id or not app.renter_id:
         return False
+    # 一覧側で EXISTS 注釈済みならクエリを打たない
+    if hasattr(app, "has_completed_purchase"):
+        return bool(app.has_completed_purchase)
     qs = Purchase.objects.filter(
         product_id=app.product_id,
         buyer_id=app.renter_id,
@@ -681,6 +707,60 @@ def _purchase_completed_for_app(app):
     return qs.exists()
 
 
+def _with_app_purchase_completed(qs):
+    """申請一覧に「購入手続き完了」フラグを EXISTS で付与する（_purchase_completed_for_app と同条件）"""
+    completed = Purchase.objects.filter(
+        product_id=OuterRef("product_id"),
+        buyer_id=OuterRef("renter_id"),
+        status__in=_purchase_completed_statuses(),
+    ).filter(Q(from_rental=True) | Q(created_at__gte=OuterRef("created_at")))
+    return qs.annotate(has_completed_purchase=Exists(completed))
+
+
+def _decorate_applications(apps, with_message=False):
+    """申請一覧の表示用属性（金額・日数・ステータス表示・購入可否）をまとめて付与する"""
+    items = list(apps)
+    rental_type = RentalApplication.OrderType.RENTAL
+    purchase_type = RentalApplication.OrderType.PURCHASE
+    for a in items:
+        a.calc_days = None
+        a.calc_price = None
+        qty = (getattr(a, "quantity", 1) or 1)
+        try:
+            if a.order_type == rental_type and a.start_date and a.end_date:
+                a.calc_days = (a.end_date - a.start_date).days + 1
+                daily = getattr(a.product, "price_per_day", 0) or 0
+                a.calc_price = daily * (a.calc_days or 0) * qty
+            elif a.order_type == purchase_type:
+                price_buy = getattr(a.product, "price_buy", 0) or 0
+                a.calc_price = price_buy * qty
+        except Exception:
+            pass
+
+        s = str(getattr(a, "status", "")).upper()
+        a.status_code = s
+        a.status_label = APPLICATION_STATUS_LABELS.get(s, s)
+        a.badge_class = APPLICATION_BADGE_CLASSES.get(s, "secondary")
+        a.purchase_completed = False
+        a.can_purchase = False
+        if a.order_type == rental_type and _purchase_completed_for_app(a):
+            a.purchase_completed = True
+            a.status_label = "購入手続き完了"
+            a.badge_class = "secondary"
+        if (
+            not a.purchase_completed
+            and a.order_type == rental_type
+            and _allow_purchase_for_product(a.product)
+        ):
+            a.can_purchase = s.lower() in ("renting", "received")
+        if with_message:
+            a.display_message = _strip_return_tracking_line(getattr(a, "message", ""))
+    buyable = [a for a in items if a.can_purchase]
+    for a, pricing in zip(buyable, _rental_purchase_pricing_many(buyable)):
+        a.buyout = pricing
+    return items
+
+
 def _has_open_purchase(product, buyer):
     if not product or not buyer:
         return False
@@ -721,27 +801,36 @@ def _close_active_rental_for_purchase(purchase):
     if not purchase or not purchase.product_id or not purchase.buyer_id:
         return
     now = timezone.now()
-    Rental.objects.filter(
-        product_id=purchase.product_id,
-        renter_id=purchase.buyer_id,
-        status=Rental.Status.RENTING,
-    ).update(
+    rental_rows = list(
+        Rental.objects.filter(
+            product_id=purchase.product_id,
+            renter_id=purchase.buyer_id,
+            status=Rental.Status.RENTING,
+        ).values_list("id", "product_id", "renter_id", "seller_id")
+    )
+    Rental.objects.filter(id__in=[r[0] for r in rental_rows]).update(
         status=Rental.Status.COMPLETED,
         completed_date=now,
     )
 
-    app_qs = RentalApplication.objects.filter(
-        product_id=purchase.product_id,
-        renter_id=purchase.buyer_id,
-        order_type=RentalApplication.OrderType.RENTAL,
-        status__in=["renting", "received"],
+    app_rows = list(
+        RentalApplication.objects.filter(
+            product_id=purchase.product_id,
+            renter_id=purchase.buyer_id,
+            order_type=RentalApplication.OrderType.RENTAL,
+            status__in=["renting", "received"],
+        ).values_list("id", "product_id", "renter_id", "owner_id")
     )
-    if app_qs.exists():
+    if app_rows:
         update_fields = {"status": RentalApplication.Status.COMPLETED}
         app_field_names = {f.name for f in RentalApplication._meta.get_fields()}
         if "completed_date" in app_field_names:
             update_fields["completed_date"] = now
-        app_qs.update(**update_fields)
+        RentalApplication.objects.filter(id__in=[a[0] for a in app_rows]).update(**update_fields)
+    # update() ではシグナルが飛ばないので取引イベントとレンタル中フラグをここで残す
+    record_transaction_events(TransactionEvent.Kind.RENTAL, rental_rows, Rental.Status.COMPLETED, now)
+    record_transaction_events(TransactionEvent.Kind.APPLICATION, app_rows, RentalApplication.Status.COMPLETED, now)
+    refresh_active_rental({purchase.buyer_id})
 
 
 def _create_purchase_from_rental(
@@ -754,38 +843,18 @@ def _create_purchase_from_rental(
     message_txt="",
     purchase_price=None,
 ):
-    try:
-        initial_status = Purchase.Status.PENDING
-    except Exception:
-        initial_status = getattr(Purchase.Status, "REQUESTED", "REQUESTED")
-
-    create_kwargs = {
-        "product": product,
-        "buyer": buyer,
-        "quantity": quantity or 1,
-        "status": initial_status,
-    }
-    if hasattr(Purchase, "product_title"):
-        create_kwargs["product_title"] = getattr(product, "title", "")
-    if hasattr(Purchase, "buyer_email"):
-        create_kwargs["buyer_email"] = getattr(buyer, "email", "")
-    if hasattr(Purchase, "seller_email"):
-        owner = getattr(product, "owner", None)
-        create_kwargs["seller_email"] = getattr(owner, "email", "") if owner else ""
-    if hasattr(Purchase, "shipping_address"):
-        create_kwargs["shipping_address"] = shipping_address or ""
-    if hasattr(Purchase, "shipping_postal_code"):
-        create_kwargs["shipping_postal_code"] = shipping_postal_code or ""
-    if hasattr(Purchase, "payment_method"):
-        create_kwargs["payment_method"] = payment_method or ""
-    if hasattr(Purchase, "message"):
-        create_kwargs["message"] = message_txt or ""
-    if hasattr(Purchase, "from_rental"):
-        create_kwargs["from_rental"] = True
-    if purchase_price is not None and hasattr(Purchase, "purchase_price"):
-        create_kwargs["purchase_price"] = max(int(purchase_price), 0)
-
-    return Purchase.objects.create(**create_kwargs)
+    return Purchase.objects.create_for(
+        product,
+        buyer,
+        quantity=quantity or 1,
+        status=Purchase.Status.REQUESTED,
+        shipping_address=shipping_address or "",
+        shipping_postal_code=shipping_postal_code or "",
+        payment_method=payment_method or "",
+        message=message_txt or "",
+        from_rental=True,
+        purchase_price=max(int(purchase_price), 0) if purchase_price is not None else 0,
+    )
 
 
 def _rental_purchase_pricing(
@@ -796,6 +865,7 @@ def _rental_purchase_pricing(
     rental_start_date=None,
     total_price=None,
     total_days=None,
+    today=None,
 ):
     qty = quantity or 1
     purchase_price = (getattr(product, "price_buy", 0) or 0) * qty
@@ -814,7 +884,7 @@ def _rental_purchase_pricing(
 
     days_used = None
     if start:
-        today = timezone.localdate()
+        today = today or timezone.localdate()
         days_used = (today - start).days + 1
         if days_used < 1:
             days_used = 1
@@ -848,6 +918,29 @@ def _rental_purchase_pricing(
     }
 
 
+def _rental_purchase_pricing_args(obj):
+    """Rental / RentalApplication から _rental_purchase_pricing の引数を取り出す"""
+    return {
+        "product": obj.product,
+        "quantity": getattr(obj, "quantity", 1) or 1,
+        "start_date": getattr(obj, "start_date", None),
+        "end_date": getattr(obj, "end_date", None),
+        "rental_start_date": getattr(obj, "rental_start_date", None) or getattr(obj, "received_date_by_renter", None),
+        "total_price": getattr(obj, "total_price", None),
+        "total_days": getattr(obj, "total_days", None),
+    }
+
+
+def _rental_purchase_pricing_many(objs):
+    """一覧向け: 買い取り価格をまとめて計算する（本日の日付は1回だけ取得し、DBアクセスはしない）。
+    product は select_related 済みで渡すこと。結果は objs と同じ順の dict のリスト。"""
+    today = timezone.localdate()
+    return [
+        _rental_purchase_pricing(today=today, **_rental_purchase_pricing_args(obj))
+        for obj in objs
+    ]
+
+
 @login_required
 def rental_purchase(request, rental_id):
     rental = get_object_or_404(
@@ -877,18 +970,9 @@ def rental_purchase(request, rental_id):
 
     shipping_address = (getattr(rental, "shipping_address", "") or "").strip()
     if not shipping_address:
-        profile = Profile.objects.filter(user=request.user).first()
-        shipping_address = (getattr(profile, "address", "") or "").strip()
+        shipping_address = (profile_for(request.user).address or "").strip()
 
-    pricing = _rental_purchase_pricing(
-        product=product,
-        quantity=getattr(rental, "quantity", 1) or 1,
-        start_date=getattr(rental, "start_date", None),
-        end_date=getattr(rental, "end_date", None),
-        rental_start_date=getattr(rental, "rental_start_date", None) or getattr(rental, "received_date_by_renter", None),
-        total_price=getattr(rental, "total_price", None),
-        total_days=getattr(rental, "total_days", None),
-    )
+    pricing = _rental_purchase_pricing(**_rental_purchase_pricing_args(rental))
 
     if request.method == "GET":
         return render(request, "frontend/purchases/rental_confirm.html", {
@@ -958,16 +1042,9 @@ def rental_app_purchase(request, app_id):
 
     shipping_address = (getattr(app, "address", "") or "").strip()
     if not shipping_address:
-        profile = Profile.objects.filter(user=request.user).first()
-        shipping_address = (getattr(profile, "address", "") or "").strip()
+        shipping_address = (profile_for(request.user).address or "").strip()
 
-    pricing = _rental_purchase_pricing(
-        product=product,
-        quantity=getattr(app, "quantity", 1) or 1,
-        start_date=getattr(app, "start_date", None),
-        end_date=getattr(app, "end_date", None),
-        rental_start_date=getattr(app, "rental_start_date", None) or getattr(app, "received_date_by_renter", None),
-    )
+    pricing = _rental_purchase_pricing(**_rental_purchase_pricing_args(app))
 
     if request.method == "GET":
         return render(request, "frontend/purchases/rental_confirm.html", {
@@ -1047,6 +1124,10 @@ class ProductListView(ListView):
             qs = qs.order_by("-avg_rating", "-review_count", "-id")
         elif sort == "rating_low":
             qs = qs.order_by("avg_rating", "review_count", "-id")
+        elif sort == "popular":
+            qs = qs.order_by("-favorite_count", "-id")
+        elif sort == "trending":
+            qs = qs.order_by("-trending_score", "-favorite_count", "-id")
         else:
             qs = qs.order_by("-id")
 
@@ -1057,7 +1138,8 @@ class ProductListView(ListView):
         else:
             qs = qs.annotate(is_favorited=Value(False, output_field=BooleanField()))
 
-        return qs
+        # カードの画像タグ（product_images）は prefetch 済みの images だけを見る
+        return qs.prefetch_related(Prefetch("images", queryset=ProductImage.objects.order_by("id")))
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -1089,12 +1171,14 @@ class ProductDetailView(DetailView):
     model = Product
     template_name = "frontend/products/detail.html"
     context_object_name = "product"
+    queryset = Product.objects.select_related("owner", "owner__profile")
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         p = self.object
 
-        ctx["images"] = p.images.all() if hasattr(p, "images") else ProductImage.objects.none()
+        # 商品ごとに共通の部分はキャッシュから。ユーザーごとの値（is_owner など）だけ毎回計算する
+        ctx.update(_product_detail_bundle(p))
 
         user = self.request.user
         is_owner = user.is_authenticated and getattr(p, "owner_id", None) == user.id
@@ -1106,26 +1190,144 @@ class ProductDetailView(DetailView):
         ctx["allow_rental"] = allow_rental
         ctx["allow_purchase"] = allow_purchase
 
-        ctx["comments"] = (
-            ProductComment.objects
-            .select_related("user", "user__profile")
-            .filter(product=p)
-            .order_by("-created_at")
-        )
-        review_qs = (
-            Review.objects
-            .select_related("user", "user__profile")
-            .filter(product=p)
-            .order_by("-created_at")
-        )
-        review_stats = review_qs.aggregate(avg=Avg("rating"), count=Count("id"))
-        ctx["reviews"] = review_qs
-        ctx["review_count"] = review_stats.get("count") or 0
-        ctx["average_rating"] = review_stats.get("avg")
-
         return ctx
 
 
+PRODUCT_DETAIL_CACHE_TIMEOUT = getattr(settings, "PRODUCT_DETAIL_CACHE_TIMEOUT", 600)
+
+
+def _product_detail_bundle(product):
+    """詳細ページのうち見る人によらない部分。キーに商品の版番号（Product.detail_version）を含めるので、
+    画像・コメント・レビュー・投稿者の表示名が変わると（marketplace.models._invalidate_product_detail など）
+    次の表示で作り直される"""
+    key = f"product:{product.pk}:detail:v{product.detail_version}"
+    bundle = cache.get(key)
+    if bundle is not None:
+        return bundle
+
+    # 1ページ目だけ描画し、続きは「もっと見る」で product_comments_page / product_reviews_page から取る
+    comments, comments_next = _keyset_page(_product_comment_qs(product), None)
+    reviews, reviews_next = _keyset_page(_product_review_qs(product), None)
+    review_stats = Review.objects.filter(product=product).aggregate(avg=Avg("rating"), count=Count("id"))
+    bundle = {
+        "images": list(product.images.order_by("id")),
+        "comments": comments,
+        "comments_next": comments_next,
+        "comment_count": product.comments.count(),
+        "reviews": reviews,
+        "reviews_next": reviews_next,
+        "review_count": review_stats.get("count") or 0,
+        "average_rating": review_stats.get("avg"),
+    }
+    cache.set(key, bundle, PRODUCT_DETAIL_CACHE_TIMEOUT)
+    return bundle
+
+
+# ========= 商品詳細のコメント / レビュー（キーセットページング） =========
+
+DETAIL_PAGE_SIZE = 10
+
+
+def _product_comment_qs(product):
+    return ProductComment.objects.select_related("user", "user__profile").filter(product=product)
+
+
+def _product_review_qs(product):
+    return Review.objects.select_related("user", "user__profile").filter(product=product)
+
+
+def _encode_cursor(obj):
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    """(created_at, id) を返す。壊れていれば ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created, pk = raw.rsplit("|", 1)
+        created_at = parse_datetime(created)
+        pk = int(pk)
+    except Exception as exc:
+        raise ValueError("invalid cursor") from exc
+    if created_at is None:
+        raise ValueError("invalid cursor")
+    return created_at, pk
+
+
+def _keyset_page(qs, cursor, size=DETAIL_PAGE_SIZE):
+    """新しい順に (created_at, id) の cursor より後ろを size 件。OFFSET を使わないので
+    何ページ目でも (product, created_at) インデックスの範囲走査で済む。
+    戻り値は (行のリスト, 次の cursor または None)"""
+    if cursor:
+        created_at, pk = _decode_cursor(cursor)
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    rows = list(qs.order_by("-created_at", "-id")[:size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, _encode_cursor(rows[-1])
+
+
+def _author_json(user):
+    profile = getattr(user, "profile", None)
+    return {
+        "id": user.id,
+        "name": getattr(profile, "display_name", "") or user.username,
+    }
+
+
+def _comment_json(c):
+    return {
+        "id": c.id,
+        "user": _author_json(c.user),
+        "body": c.body,
+        "image_url": c.image.url if c.image else None,
+        "created_at": c.created_at.isoformat(),
+    }
+
+
+def _review_json(r):
+    return {
+        "id": r.id,
+        "user": _author_json(r.user),
+        "rating": r.rating,
+        "comment": r.comment,
+        "created_at": r.created_at.isoformat(),
+    }
+
+
+def _detail_page_response(request, product, qs, template, to_json, ctx_name):
+    try:
+        rows, next_cursor = _keyset_page(qs, request.GET.get("cursor"))
+    except ValueError:
+        return HttpResponseBadRequest("invalid cursor")
+    html = render_to_string(template, {ctx_name: rows, "product": product}, request=request)
+    return JsonResponse({
+        "items": [to_json(row) for row in rows],
+        "html": html,
+        "next_cursor": next_cursor,
+    })
+
+
+def product_comments_page(request, pk):
+    """コメントの続き。?cursor= は前回の next_cursor"""
+    product = get_object_or_404(Product.objects.only("id", "owner_id"), pk=pk)
+    return _detail_page_response(
+        request, product, _product_comment_qs(product),
+        "frontend/products/_comments.html", _comment_json, "comments",
+    )
+
+
+def product_reviews_page(request, pk):
+    """レビューの続き。?cursor= は前回の next_cursor"""
+    product = get_object_or_404(Product.objects.only("id", "owner_id"), pk=pk)
+    return _detail_page_response(
+        request, product, _product_review_qs(product),
+        "frontend/products/_reviews.html", _review_json, "reviews",
+    )
+
+
 @login_required
 @require_POST
 def product_comment_create(request, pk):
@@ -1189,13 +1391,13 @@ class MessagesPage(LoginRequiredMixin, TemplateView):
         purchases = (
             Purchase.objects
             .select_related("product", "buyer", "product__owner", "buyer__profile", "product__owner__profile")
-            .filter(Q(buyer=user) | Q(product__owner=user))
+            .filter(Q(buyer=user) | Q(seller=user))
             .order_by("-created_at")
         )
         rentals = (
             Rental.objects
             .select_related("product", "renter", "product__owner", "renter__profile", "product__owner__profile")
-            .filter(Q(renter=user) | Q(product__owner=user))
+            .filter(Q(renter=user) | Q(seller=user))
             .order_by("-created_at")
         )
         applications = (
@@ -1368,31 +1570,34 @@ class DocumentationView(TemplateView):
 @require_POST
 def product_favorite_toggle(request, pk):
     product = get_object_or_404(Product, pk=pk)
-    fav, created = ProductFavorite.objects.get_or_create(user=request.user, product=product)
-    if created:
-        return JsonResponse({"ok": True, "favorited": True})
-    fav.delete()
-    return JsonResponse({"ok": True, "favorited": False})
+    # 画面は押した後の状態（favorited=1/0）を送ってくるので、連打しても同じ結果になる。
+    # 指定が無い古いクライアントだけ現在の状態を反転する
+    wanted = request.POST.get("favorited")
+    if wanted in ("0", "1"):
+        favorited = wanted == "1"
+    else:
+        favorited = not ProductFavorite.objects.filter(user=request.user, product=product).exists()
+    # favorite_count は ProductFavorite のシグナルが F() で増減する
+    set_favorite(request.user, product.pk, favorited)
+    count = Product.objects.filter(pk=product.pk).values_list("favorite_count", flat=True).first() or 0
+    return JsonResponse({"ok": True, "favorited": favorited, "favorite_count": count})
 
 
 # ========= レンタル/購入 — 一覧系 =========
 
 @login_required
 def rentals_index(request):
-    tab = request.GET.get("tab", "mine")
     qs = (
         Rental.objects
         .select_related("product", "renter", "product__owner")
         .order_by("-id")
     )
-    mine = qs.filter(renter=request.user)
-    received = qs.filter(product__owner=request.user)
-
-    context = {
-        "active_tab": "received" if tab == "received" else "mine",
-        "mine": mine,
-        "received": received,
-    }
+    context = _paginated_tabs(
+        request,
+        qs.filter(renter=request.user),
+        qs.filter(seller=request.user),
+        Rental.Status.choices,
+    )
     return render(request, "frontend/rentals/index.html", context)
 
 
@@ -1405,10 +1610,12 @@ def my_rentals(request):
         Rental.objects
         .select_related("product", "renter", "product__owner")
         .filter(renter=user)
+        .exclude(status__in=COMPLETED_STATUSES)
         .order_by("-id")
     )
-    my_active_rentals = [r for r in rentals if r.status not in COMPLETED_STATUSES]
-    return render(request, "frontend/rentals/my_rentals.html", {"my_active_rentals": my_active_rentals})
+    page, total, ctx = _paginated_list(request, rentals, Rental.Status.choices)
+    ctx.update({"my_active_rentals": page, "total_count": total})
+    return render(request, "frontend/rentals/my_rentals.html", ctx)
 
 
 @login_required
@@ -1419,26 +1626,27 @@ def received_rentals(request):
     rentals = (
         Rental.objects
         .select_related("product", "renter", "product__owner")
-        .filter(product__owner=user)
+        .filter(seller=user)
+        .exclude(status__in=COMPLETED_STATUSES)
         .order_by("-id")
     )
-    received_active_rentals = [r for r in rentals if r.status not in COMPLETED_STATUSES]
-    return render(request, "frontend/rentals/received_rentals.html", {"received_active_rentals": received_active_rentals})
+    page, total, ctx = _paginated_list(request, rentals, Rental.Status.choices)
+    ctx.update({"received_active_rentals": page, "total_count": total})
+    return render(request, "frontend/rentals/received_rentals.html", ctx)
 
 
 @login_required
 def purchases_index(request):
-    tab = request.GET.get("tab", "mine")
     qs = (Purchase.objects
           .select_related("product", "buyer", "product__owner")
           .order_by("-id"))
-    mine = _prepare_purchase_items(qs.filter(buyer=request.user, hidden_by_buyer=False))
-    received = _prepare_purchase_items(qs.filter(product__owner=request.user, hidden_by_seller=False))
-    context = {
-        "active_tab": "received" if tab == "received" else "mine",
-        "mine": mine,
-        "received": received,
-    }
+    context = _paginated_tabs(
+        request,
+        qs.filter(buyer=request.user, hidden_by_buyer=False),
+        qs.filter(seller=request.user, hidden_by_seller=False),
+        Purchase.Status.choices,
+        prepare=_prepare_purchase_items,
+    )
     return render(request, "frontend/purchases/index.html", context)
 
 
@@ -1446,28 +1654,34 @@ def purchases_index(request):
 def my_purchases(request):
     if request.method == "POST":
         return _handle_purchase_action(request, redirect_name="frontend:my_purchases")
-    items = _prepare_purchase_items(
+    page, total, ctx = _paginated_list(
+        request,
         Purchase.objects
         .select_related("product", "buyer", "product__owner")
         .filter(buyer=request.user, hidden_by_buyer=False)
-        .order_by("-id")
+        .order_by("-id"),
+        Purchase.Status.choices,
+        prepare=_prepare_purchase_items,
     )
-    return render(request, "frontend/purchases/my_purchases.html",
-                  {"my_purchases": items, "items": items, "mode": "mine"})
+    ctx.update({"my_purchases": page, "items": page, "mode": "mine", "total_count": total})
+    return render(request, "frontend/purchases/my_purchases.html", ctx)
 
 
 @login_required
 def received_purchases(request):
     if request.method == "POST":
         return _handle_purchase_action(request, redirect_name="frontend:received_purchases")
-    items = _prepare_purchase_items(
+    page, total, ctx = _paginated_list(
+        request,
         Purchase.objects
         .select_related("product", "buyer", "product__owner")
-        .filter(product__owner=request.user, hidden_by_seller=False)
-        .order_by("-id")
+        .filter(seller=request.user, hidden_by_seller=False)
+        .order_by("-id"),
+        Purchase.Status.choices,
+        prepare=_prepare_purchase_items,
     )
-    return render(request, "frontend/purchases/received_purchases.html",
-                  {"received_purchases": items, "items": items, "mode": "received"})
+    ctx.update({"received_purchases": page, "items": page, "mode": "received", "total_count": total})
+    return render(request, "frontend/purchases/received_purchases.html", ctx)
 
 
 @login_required
@@ -1486,7 +1700,7 @@ def purchase_hide_mine(request, purchase_id):
 @login_required
 @require_POST
 def purchase_hide_received(request, purchase_id):
-    purchase = get_object_or_404(Purchase, id=purchase_id, product__owner=request.user)
+    purchase = get_object_or_404(Purchase, id=purchase_id, seller=request.user)
     if not _purchase_can_hide(purchase):
         messages.warning(request, "完了した取引のみ非表示にできます。")
         return redirect(request.POST.get("next") or request.META.get("HTTP_REFERER") or "frontend:purchases")
@@ -1501,177 +1715,77 @@ def purchase_hide_received(request, purchase_id):
 @login_required
 def rental_manage(request):
     """出品者が受け取った申請一覧（レンタル/購入とも）"""
-    apps = list(RentalApplication.objects.filter(
-        owner=request.user,
-        hidden_by_owner=False,
-    ).select_related("product", "renter").order_by("-created_at"))
-    STATUS_LABELS = {
-        "PENDING": "申請中",
-        "APPROVED": "承認済み",
-        "SHIPPED": "発送済み",
-        "RECEIVED": "受取済み",
-        "RENTING": "レンタル中",
-        "RETURN_SHIPPED": "返却発送済み",
-        "COMPLETED": "完了",
-        "REJECTED": "却下",
-        "CANCELLED": "キャンセル",
-    }
-    BADGE_CLASS = {
-        "PENDING": "secondary",
-        "APPROVED": "primary",
-        "SHIPPED": "info",
-        "RECEIVED": "success",
-        "RENTING": "success",
-        "RETURN_SHIPPED": "dark",
-        "COMPLETED": "secondary",
-        "REJECTED": "danger",
-        "CANCELLED": "dark",
-    }
-    for a in apps:
-        a.calc_days = None
-        a.calc_price = None
-        if a.order_type == RentalApplication.OrderType.RENTAL and a.start_date and a.end_date:
-            a.calc_days = (a.end_date - a.start_date).days + 1
-            daily = getattr(a.product, "price_per_day", 0) or 0
-            a.calc_price = daily * (a.calc_days or 0) * (a.quantity or 1)
-        elif a.order_type == RentalApplication.OrderType.PURCHASE:
-            price_buy = getattr(a.product, "price_buy", 0) or 0
-            a.calc_price = price_buy * (a.quantity or 1)
-        s = str(getattr(a, "status", "")).upper()
-        a.status_code = s
-        a.status_label = STATUS_LABELS.get(s, s)
-        a.badge_class = BADGE_CLASS.get(s, "secondary")
-        a.purchase_completed = False
-        a.can_purchase = False
-        if (
-            getattr(a, "order_type", None) == RentalApplication.OrderType.RENTAL
-            and _purchase_completed_for_app(a)
-        ):
-            a.purchase_completed = True
-            a.status_label = "購入手続き完了"
-            a.badge_class = "secondary"
-        if (
-            not a.purchase_completed
-            and getattr(a, "order_type", None) == RentalApplication.OrderType.RENTAL
-            and _allow_purchase_for_product(a.product)
-        ):
-            status_lower = str(getattr(a, "status", "")).lower()
-            a.can_purchase = status_lower in ("renting", "received")
-        a.display_message = _strip_return_tracking_line(getattr(a, "message", ""))
-        a.display_message = _strip_return_tracking_line(getattr(a, "message", ""))
-    ctx = {
-        "applications": apps,
+    page, received_count, ctx = _paginated_list(
+        request,
+        _with_app_purchase_completed(
+            RentalApplication.objects.filter(
+                owner=request.user,
+                hidden_by_owner=False,
+            ).select_related("product", "renter").order_by("-created_at")
+        ),
+        APPLICATION_STATUS_CHOICES,
+        prepare=lambda apps: _decorate_applications(apps, with_message=True),
+    )
+    ctx.update({
+        "applications": page,
         "active_tab": "received",
-        "received_count": len(apps),
+        "received_count": received_count,
         "mine_count": RentalApplication.objects.filter(
             renter=request.user,
             hidden_by_renter=False,
         ).count(),
-    }
+    })
     return render(request, "frontend/rentals/manage.html", ctx)
 
 
 @login_required
 def purchase_manage(request):
     """出品者が受け取った【購入】申請のみの一覧"""
-    apps = list(RentalApplication.objects.filter(
-        owner=request.user,
-        order_type=RentalApplication.OrderType.PURCHASE
-    ).select_related("product", "renter").order_by("-created_at"))
-
-    for a in apps:
-        a.calc_days = None
-        price_buy = getattr(a.product, "price_buy", 0) or 0
-        a.calc_price = price_buy * (a.quantity or 1)
-
-    return render(request, "frontend/purchases/applications.html", {
-        "applications": apps,
+    page, received_count, ctx = _paginated_list(
+        request,
+        RentalApplication.objects.filter(
+            owner=request.user,
+            order_type=RentalApplication.OrderType.PURCHASE
+        ).select_related("product", "renter").order_by("-created_at"),
+        APPLICATION_STATUS_CHOICES,
+        prepare=_decorate_applications,
+    )
+    ctx.update({
+        "applications": page,
         "active_tab": "received",
-        "received_count": len(apps),
+        "received_count": received_count,
         "mine_count": RentalApplication.objects.filter(
             renter=request.user,
             order_type=RentalApplication.OrderType.PURCHASE,
             hidden_by_renter=False,
         ).count(),
     })
+    return render(request, "frontend/purchases/applications.html", ctx)
 
 
 @login_required
 def my_applications(request):
     """借り手（自分）が送ったレンタル/購入の申請一覧を表示"""
-    apps = (RentalApplication.objects
+    page, mine_count, ctx = _paginated_list(
+        request,
+        _with_app_purchase_completed(
+            RentalApplication.objects
             .filter(renter=request.user, hidden_by_renter=False)
             .select_related("product", "owner")
-            .order_by("-created_at"))
-
-    STATUS_LABELS = {
-        "PENDING": "申請中",
-        "APPROVED": "承認済み",
-        "SHIPPED": "発送済み",
-        "RECEIVED": "受取済み",
-        "RENTING": "レンタル中",
-        "RETURN_SHIPPED": "返却発送済み",
-        "COMPLETED": "完了",
-        "REJECTED": "却下",
-        "CANCELLED": "キャンセル",
-    }
-    BADGE_CLASS = {
-        "PENDING": "secondary",
-        "APPROVED": "primary",
-        "SHIPPED": "info",
-        "RECEIVED": "success",
-        "RENTING": "success",
-        "RETURN_SHIPPED": "dark",
-        "COMPLETED": "secondary",
-        "REJECTED": "danger",
-        "CANCELLED": "dark",
-    }
-
-    for a in apps:
-        a.calc_days = None
-        a.calc_price = None
-        qty = (getattr(a, "quantity", 1) or 1)
-        try:
-            if a.order_type == RentalApplication.OrderType.RENTAL and a.start_date and a.end_date:
-                a.calc_days = (a.end_date - a.start_date).days + 1
-                daily = getattr(a.product, "price_per_day", 0) or 0
-                a.calc_price = daily * (a.calc_days or 0) * qty
-            elif a.order_type == RentalApplication.OrderType.PURCHASE:
-                price_buy = getattr(a.product, "price_buy", 0) or 0
-                a.calc_price = price_buy * qty
-        except Exception:
-            pass
-
-        s = str(getattr(a, "status", "")).upper()
-        a.status_code = s
-        a.status_label = STATUS_LABELS.get(s, s)
-        a.badge_class = BADGE_CLASS.get(s, "secondary")
-        a.purchase_completed = False
-        a.can_purchase = False
-        if (
-            getattr(a, "order_type", None) == RentalApplication.OrderType.RENTAL
-            and _purchase_completed_for_app(a)
-        ):
-            a.purchase_completed = True
-            a.status_label = "購入手続き完了"
-            a.badge_class = "secondary"
-        if (
-            not a.purchase_completed
-            and getattr(a, "order_type", None) == RentalApplication.OrderType.RENTAL
-            and _allow_purchase_for_product(a.product)
-        ):
-            status_lower = str(getattr(a, "status", "")).lower()
-            a.can_purchase = status_lower in ("renting", "received")
-
-    ctx = {
-        "applications": apps,
+            .order_by("-created_at")
+        ),
+        APPLICATION_STATUS_CHOICES,
+        prepare=_decorate_applications,
+    )
+    ctx.update({
+        "applications": page,
         "active_tab": "mine",
-        "mine_count": apps.count(),
+        "mine_count": mine_count,
         "received_count": RentalApplication.objects.filter(
             owner=request.user,
             hidden_by_owner=False,
         ).count(),
-    }
+    })
     return render(request, "frontend/rentals/my_applications.html", ctx)
 
 
@@ -1687,6 +1801,7 @@ def rental_app_approve(request, app_id):
             app,
             getattr(Shipment.Direction, "OUTBOUND", "outbound"),
             status=getattr(Shipment.Status, "CREATED", "created"),
+            request=request,
         )
         from django.contrib import messages
         messages.success(request, "申請を承認しました。")
@@ -1995,32 +2110,31 @@ def review_create(request, product_id):
 
 @login_required
 def returns_index(request):
-    tab = request.GET.get("tab", "mine")
-
     mine_qs = (Purchase.objects
                .select_related("product", "buyer", "product__owner")
-               .filter(buyer=request.user, hidden_by_buyer=False))
-
-    mine = _prepare_purchase_items(
-        mine_qs.filter(
-        Q(status__in=[getattr(Purchase.Status, "COMPLETED", "COMPLETED"), "完了"])
-        | Q(return_status__in=["REQUESTED", "APPROVED", "SHIPPED", "RECEIVED", "REJECTED"])
-        ).order_by("-id")
-    )
-
-    received = _prepare_purchase_items(
-        Purchase.objects
-        .select_related("product", "buyer", "product__owner")
-        .filter(product__owner=request.user,
-                hidden_by_seller=False,
-                return_status__in=["REQUESTED", "APPROVED", "SHIPPED"])
-        .order_by("-id")
+               .filter(buyer=request.user, hidden_by_buyer=False)
+               .filter(
+                   Q(status__in=[getattr(Purchase.Status, "COMPLETED", "COMPLETED"), "完了"])
+                   | Q(return_status__in=["REQUESTED", "APPROVED", "SHIPPED", "RECEIVED", "REJECTED"])
+               )
+               .order_by("-id"))
+
+    received_qs = (Purchase.objects
+                   .select_related("product", "buyer", "product__owner")
+                   .filter(seller=request.user,
+                           hidden_by_seller=False,
+                           return_status__in=["REQUESTED", "APPROVED", "SHIPPED"])
+                   .order_by("-id"))
+
+    context = _paginated_tabs(
+        request,
+        mine_qs,
+        received_qs,
+        Purchase.ReturnStatus.choices,
+        field="return_status",
+        prepare=_prepare_purchase_items,
     )
-
-    return render(request, "frontend/returns/index.html", {
-        "active_tab": "received" if tab == "received" else "mine",
-        "mine": mine, "received": received,
-    })
+    return render(request, "frontend/returns/index.html", context)
 
 
 @login_required
@@ -2110,37 +2224,15 @@ def return_action(request):
                 f"追跡番号: {tracking}",
                 purchase.id, "frontend:returns", kind="purchase")
 
-            # ▼ 返送（購入者→出品者）の配送レコードを作成/更新
-            buyer_p  = Profile.objects.filter(user=purchase.buyer).first()
-            seller_p = Profile.objects.filter(user=purchase.product.owner).first()
-
-            from_name  = (getattr(buyer_p, "display_name", "") or purchase.buyer.username)[:120]
-            from_phone = (getattr(buyer_p, "phone", "") or "")[:40]
-            from_addr  = (getattr(buyer_p, "address", "") or getattr(purchase, "shipping_address", "") or "")[:255]
-
-            to_name    = (getattr(seller_p, "display_name", "") or purchase.product.owner.username)[:120]
-            to_phone   = (getattr(seller_p, "phone", "") or "")[:40]
-            to_addr    = (getattr(seller_p, "address", "") or "")[:255]
-
-            Shipment.objects.update_or_create(
-                purchase=purchase,
-                direction=getattr(Shipment.Direction, "INBOUND", "inbound"),  # 返品の受領側ルート
-                defaults={
-                    "kind": getattr(Shipment.Kind, "PURCHASE", "purchase"),
-                    "product": purchase.product,
-                    "from_name": from_name,
-                    "from_phone": from_phone,
-                    "from_address": from_addr,
-                    "to_name": to_name,
-                    "to_phone": to_phone,
-                    "to_address": to_addr,
-                    "tracking_no": tracking,
-                    "status": getattr(Shipment.Status, "IN_TRANSIT", "in_transit"),
-                    "is_platform_intermediated": True,
-                }
+            # ▼ 返送（購入者→出品者）の配送レコードを作成/更新（返品の受領側ルート）
+            _create_shipment_for_purchase(
+                purchase,
+                getattr(Shipment.Direction, "INBOUND", "inbound"),
+                tracking_no=tracking,
+                status=getattr(Shipment.Status, "IN_TRANSIT", "in_transit"),
+                request=request,
             )
 
-
             messages.success(request, "返送情報を登録しました。")
 
         elif action == "receive_back":
@@ -2176,37 +2268,22 @@ def return_action(request):
         return redirect(next_url)
     return redirect("frontend:returns")
 
-def _create_shipment_for_application(app, direction, tracking_no="", status=None):
+def _create_shipment_for_application(app, direction, tracking_no="", status=None, request=None):
+    # 往路: 出品者→借り手 / 返送: 借り手→出品者
     if status is None:
         status = Shipment.Status.IN_TRANSIT
-    # 往路: 出品者→借り手 / 返送: 借り手→出品者
     if direction == Shipment.Direction.OUTBOUND:
-        frm = _contact_snapshot(app.owner)
-        to  = _contact_snapshot(app.renter, fallback_address=getattr(app, "address", ""))
+        sender, receiver = app.owner, app.renter
+        addresses = {"receiver_address": getattr(app, "address", "")}
     else:
-        frm = _contact_snapshot(app.renter, fallback_address=getattr(app, "address", ""))
-        to  = _contact_snapshot(app.owner)
-
-    Shipment.objects.update_or_create(
-        application=app,
-        direction=direction,
-        defaults={
-            "kind": Shipment.Kind.RENTAL,
-            "product": app.product,
-            "rental": None,          # 今回はRentalモデルじゃなく申請側で運用
-            "purchase": None,
-            "from_name": frm["name"],
-            "from_phone": frm["phone"],
-            "from_postal": frm["postal"],
-            "from_address": frm["address"],
-            "to_name": to["name"],
-            "to_phone": to["phone"],
-            "to_postal": to["postal"],
-            "to_address": to["address"],
-            "tracking_no": tracking_no or "",
-            "status": status,
-            "is_platform_intermediated": True,
-        }
+        sender, receiver = app.renter, app.owner
+        addresses = {"sender_address": getattr(app, "address", "")}
+    return _upsert_shipment(
+        "application", app, Shipment.Kind.RENTAL, direction, sender, receiver,
+        tracking_no=tracking_no, status=status, request=request,
+        # 今回はRentalモデルじゃなく申請側で運用
+        extra={"rental": None, "purchase": None},
+        **addresses,
     )
 
 def rental_app_ship(request, app_id):
@@ -2227,7 +2304,7 @@ def rental_app_ship(request, app_id):
     app.save()
 
     # ★ ここ追加：配送管理へ出す
-    _create_shipment_for_application(app, Shipment.Direction.OUTBOUND, tracking)
+    _create_shipment_for_application(app, Shipment.Direction.OUTBOUND, tracking, request=request)
 
     messages.success(request, "商品を配送しました。相手の受取をお待ちください。")
     return redirect("frontend:rental_manage")
@@ -2251,7 +2328,7 @@ def rental_app_return_ship(request, app_id):
     app.save()
 
     # ★ ここ追加：返送を配送管理へ出す
-    _create_shipment_for_application(app, Shipment.Direction.RETURN, tracking)
+    _create_shipment_for_application(app, Shipment.Direction.RETURN, tracking, request=request)
 
     messages.success(request, "返却を発送しました。出品者の受領をお待ちください。")
     return redirect("frontend:my_applications")
@@ -2261,7 +2338,7 @@ def rental_app_return_ship(request, app_id):
 
 @login_required
 def rental_apply(request, pk):
-    product = get_object_or_404(Product, pk=pk)
+    product = get_object_or_404(Product.objects.select_related("owner"), pk=pk)
     if getattr(product, "owner_id", None) == request.user.id:
         from django.contrib import messages
         messages.error(request, "自分が出品した商品には申請できません。")
@@ -2305,33 +2382,17 @@ def rental_apply(request, pk):
             messages.error(request, "在庫が不足しています。")
             return redirect("frontend:product_detail", pk=pk)
 
-        try:
-            initial_status = Purchase.Status.PENDING
-        except Exception:
-            initial_status = getattr(Purchase.Status, "REQUESTED", "REQUESTED")
-
-        create_kwargs = dict(
-            product=product,
-            buyer=request.user,
-            quantity=quantity,
-            status=initial_status,
-        )
-        if hasattr(Purchase, "product_title"):
-            create_kwargs["product_title"] = getattr(product, "title", "")
-        if hasattr(Purchase, "buyer_email"):
-            create_kwargs["buyer_email"] = getattr(request.user, "email", "")
-        if hasattr(Purchase, "seller_email"):
-            create_kwargs["seller_email"] = getattr(product.owner, "email", "") if getattr(product, "owner", None) else ""
-        if hasattr(Purchase, "shipping_address"):
-            create_kwargs["shipping_address"] = address if not postal_code else f"{address}（〒{postal_code}）"
-        if hasattr(Purchase, "payment_method"):
-            create_kwargs["payment_method"] = payment_method
-        if hasattr(Purchase, "message"):
-            create_kwargs["message"] = message_txt
-
         with transaction.atomic():
             _adjust_available_quantity(product, -(quantity or 0))
-            purchase = Purchase.objects.create(**create_kwargs)
+            purchase = Purchase.objects.create_for(
+                product,
+                request.user,
+                quantity=quantity,
+                status=Purchase.Status.REQUESTED,
+                shipping_address=address if not postal_code else f"{address}（〒{postal_code}）",
+                payment_method=payment_method,
+                message=message_txt,
+            )
         try:
             _create_notification(
                 product.owner,
@@ -2409,10 +2470,7 @@ def rental_apply(request, pk):
 @login_required
 def product_create(request):
     user = request.user
-    profile, _ = Profile.objects.get_or_create(
-        user=request.user,
-        defaults={"is_admin": False}
-    )
+    profile = profile_for(user)
 
     from django.contrib import messages
     if not profile.address:
@@ -2649,224 +2707,239 @@ def product_delete_api(request, pk: int):
 
 @login_required
 def my_products(request):
-    items = Product.objects.filter(owner=request.user).order_by("-id")
+    items = (
+        Product.objects.filter(owner=request.user)
+        .prefetch_related(Prefetch("images", queryset=ProductImage.objects.order_by("id")))
+        .order_by("-id")
+    )
     return render(request, "frontend/products/my_products.html", {"products": items})
 
 
 # ========= プロフィール / 取引履歴 =========
 
+PROFILE_PAGE_SIZE = 10
+PROFILE_TABS = ("posts", "favorites", "rentals", "history")
+_IMAGES_PREFETCH = Prefetch("images", queryset=ProductImage.objects.order_by("id"))
+_PRODUCT_IMAGES_PREFETCH = Prefetch("product__images", queryset=ProductImage.objects.order_by("id"))
+
+
+def _profile_posts(user, page=1):
+    qs = Product.objects.filter(owner=user).prefetch_related(_IMAGES_PREFETCH).order_by("-id")
+    page_obj = Paginator(qs, PROFILE_PAGE_SIZE).get_page(page)
+    return {"my_products": page_obj.object_list, "page_obj": page_obj}
+
+
+def _profile_favorites(user, page=1):
+    favorites = (
+        ProductFavorite.objects
+        .filter(user=user)
+        .select_related("product")
+        .prefetch_related(_PRODUCT_IMAGES_PREFETCH)
+        .order_by("-created_at")
+    )
+    return {"favorites": favorites}
+
+
+def _profile_rentals(user, page=1):
+    app_qs = (
+        RentalApplication.objects
+        .filter(order_type=RentalApplication.OrderType.RENTAL)
+        .filter(status__iexact="renting")
+        .filter(renter=user)
+        .select_related("product", "product__owner")
+        .prefetch_related(_PRODUCT_IMAGES_PREFETCH)
+    )
+    rental_qs = (
+        Rental.objects
+        .filter(status=Rental.Status.RENTING.value)
+        .filter(renter=user)
+        .select_related("product", "product__owner")
+        .prefetch_related(_PRODUCT_IMAGES_PREFETCH)
+    )
+    app_list = [app for app in app_qs if app.product]
+    rental_list = [r for r in rental_qs if r.product]
+    items = []
+    for app, pricing in zip(app_list, _rental_purchase_pricing_many(app_list)):
+        items.append({
+            "product": app.product,
+            "start_date": app.start_date,
+            "end_date": app.end_date,
+            "quantity": app.quantity or 1,
+            "started_at": app.created_at,
+            "application_id": app.id,
+            "pricing": pricing,
+        })
+    for r, pricing in zip(rental_list, _rental_purchase_pricing_many(rental_list)):
+        items.append({
+            "product": r.product,
+            "start_date": r.start_date,
+            "end_date": r.end_date,
+            "quantity": r.quantity or 1,
+            "started_at": r.rental_start_date or r.received_date_by_renter or r.created_at,
+            "rental_id": r.id,
+            "pricing": pricing,
+        })
+    items.sort(key=lambda x: x["started_at"] or timezone.now(), reverse=True)
+    return {"renting_products": items}
+
+
+def _profile_history(user, page=1):
+    """完了した取引（レンタル/購入/レンタル申請）を TransactionEvent から新しい順に1ページ分。
+    レビュー済みか・レビューできるかも同じクエリで付ける。"""
+    reviews = Review.objects.filter(user=user, product_id=OuterRef("product_id")).order_by("-created_at")
+    eligible = ReviewEligibility.objects.filter(user=user, product_id=OuterRef("product_id"))
+    events = (
+        TransactionEvent.objects
+        .filter(user=user, event=TransactionEvent.COMPLETED)
+        .annotate(
+            review_rating=Subquery(reviews.values("rating")[:1]),
+            review_comment=Subquery(reviews.values("comment")[:1]),
+            can_review=ExpressionWrapper(
+                Q(role__in=[TransactionEvent.Role.RENTER, TransactionEvent.Role.BUYER])
+                & Exists(eligible) & ~Exists(reviews),
+                output_field=BooleanField(),
+            ),
+        )
+        .select_related("product", "product__owner")
+        .prefetch_related(_PRODUCT_IMAGES_PREFETCH)
+        .order_by("-occurred_at", "-id")
+    )
+    page_obj = Paginator(events, PROFILE_PAGE_SIZE).get_page(page)
+
+    items = []
+    for ev in page_obj.object_list:
+        if not ev.product:
+            continue
+        items.append({
+            "kind": "purchase" if ev.kind == TransactionEvent.Kind.PURCHASE else "rental",
+            "completed_at": ev.occurred_at,
+            "product": ev.product,
+            "review": (
+                {"rating": ev.review_rating, "comment": ev.review_comment}
+                if ev.review_rating is not None else None
+            ),
+            "can_review": ev.can_review,
+        })
+    return {"transactions": items, "page_obj": page_obj}
+
+
+_PROFILE_TAB_BUILDERS = {
+    "posts": _profile_posts,
+    "favorites": _profile_favorites,
+    "rentals": _profile_rentals,
+    "history": _profile_history,
+}
+
+
+def _profile_tab_context(user, tab, page=1):
+    ctx = {"my_products": [], "favorites": [], "renting_products": [], "transactions": [], "page_obj": None}
+    builder = _PROFILE_TAB_BUILDERS.get(tab)
+    if builder:
+        ctx.update(builder(user, page))
+    return ctx
+
+
+def _product_json(p):
+    return {
+        "id": p.id,
+        "title": p.title,
+        "url": reverse("frontend:product_detail", args=[p.id]),
+        "thumb_url": p.thumb_url,
+        "price_per_day": p.price_per_day,
+        "price_buy": p.price_buy,
+    }
+
+
+def _profile_tab_json(tab, ctx):
+    if tab == "posts":
+        items = [dict(_product_json(p), status=p.status) for p in ctx["my_products"]]
+    elif tab == "favorites":
+        items = [_product_json(f.product) for f in ctx["favorites"] if f.product]
+    elif tab == "rentals":
+        items = [{
+            "product": _product_json(it["product"]),
+            "start_date": it["start_date"],
+            "end_date": it["end_date"],
+            "quantity": it["quantity"],
+            "application_id": it.get("application_id"),
+            "rental_id": it.get("rental_id"),
+            "payable": (it.get("pricing") or {}).get("payable"),
+        } for it in ctx["renting_products"]]
+    else:
+        items = [{
+            "kind": it["kind"],
+            "completed_at": it["completed_at"],
+            "product": _product_json(it["product"]),
+            "review": it["review"],
+            "can_review": it["can_review"],
+        } for it in ctx["transactions"]]
+    data = {"tab": tab, "items": items}
+    page_obj = ctx.get("page_obj")
+    if page_obj is not None:
+        data["page"] = {
+            "number": page_obj.number,
+            "num_pages": page_obj.paginator.num_pages,
+            "count": page_obj.paginator.count,
+            "has_next": page_obj.has_next(),
+        }
+    return data
+
+
 @login_required
 def profile(request):
     user = request.user
-    profile, _ = Profile.objects.get_or_create(user=user, defaults={"is_admin": False})
+    profile = profile_for(user)
 
     active_tab = request.GET.get("tab", "info")
     editing = request.GET.get("edit") == "1"
 
     if request.method == "POST":
+        original_address = profile.address
         profile.display_name = (request.POST.get("display_name") or "").strip()
         profile.phone        = (request.POST.get("phone") or "").strip()
         profile.address      = (request.POST.get("address") or "").strip()
         if "profile_image" in request.FILES:
             profile.profile_image = request.FILES["profile_image"]
         profile.save()
-        from django.contrib import messages
-        messages.success(request, "プロフィールを更新しました。")
+        if not original_address and profile.address:
+            messages.success(request, "住所を登録しました。これで商品の投稿・レンタル・購入が可能になりました。")
+        else:
+            messages.success(request, "プロフィールを更新しました。")
         return redirect(f"{reverse('frontend:profile')}?tab=info")
 
-    my_products = []
-    favorites = []
-    renting_products = []
-    transactions = []
-    has_active_rental = (
-        Rental.objects
-        .filter(status=Rental.Status.RENTING.value, renter=user)
-        .exists()
-        or
-        RentalApplication.objects
-        .filter(order_type=RentalApplication.OrderType.RENTAL)
-        .filter(status__iexact="renting")
-        .filter(renter=user)
-        .exists()
-    )
-    if active_tab == "posts":
-        my_products = Product.objects.filter(owner=user).order_by("-id")
-    elif active_tab == "favorites":
-        favorites = (ProductFavorite.objects
-                    .filter(user=user)
-                    .select_related("product")
-                    .order_by("-created_at"))
-    
-    elif active_tab == "rentals":
-        renting_items = []
-        app_qs = (
-            RentalApplication.objects
-            .filter(order_type=RentalApplication.OrderType.RENTAL)
-            .filter(status__iexact="renting")
-            .filter(renter=user)
-            .select_related("product", "product__owner")
-            .prefetch_related(Prefetch("product__images", queryset=ProductImage.objects.order_by("id")))
-        )
-        rental_qs = (
-            Rental.objects
-            .filter(status=Rental.Status.RENTING.value)
-            .filter(renter=user)
-            .select_related("product", "product__owner")
-            .prefetch_related(Prefetch("product__images", queryset=ProductImage.objects.order_by("id")))
-        )
-        for app in app_qs:
-            if app.product:
-                renting_items.append({
-                    "product": app.product,
-                    "start_date": app.start_date,
-                    "end_date": app.end_date,
-                    "quantity": app.quantity or 1,
-                    "started_at": app.created_at,
-                    "application_id": app.id,
-                })
-        for r in rental_qs:
-            if r.product:
-                renting_items.append({
-                    "product": r.product,
-                    "start_date": r.start_date,
-                    "end_date": r.end_date,
-                    "quantity": r.quantity or 1,
-                    "started_at": r.rental_start_date or r.received_date_by_renter or r.created_at,
-                    "rental_id": r.id,
-                })
-        renting_items.sort(
-            key=lambda x: x["started_at"] or timezone.now(),
-            reverse=True,
-        )
-        renting_products = renting_items
-    elif active_tab == "history":
-        # ▼ ここが肝。完了したレンタル/購入を混在で集約
-        rentals = (
-            Rental.objects
-            .filter(status=Rental.Status.COMPLETED.value)  # "完了"
-            .filter(Q(renter=user) | Q(product__owner=user))
-            .select_related("product", "product__owner")
-            .prefetch_related(Prefetch("product__images", queryset=ProductImage.objects.order_by("id")))
-        )
-        purchases = (
-            Purchase.objects
-            .filter(status=Purchase.Status.COMPLETED.value)  # "完了"
-            .filter(Q(buyer=user) | Q(product__owner=user))
-            .select_related("product", "product__owner")
-            .prefetch_related(Prefetch("product__images", queryset=ProductImage.objects.order_by("id")))
-        )
-        rental_apps = (
-            RentalApplication.objects
-            .filter(order_type=RentalApplication.OrderType.RENTAL)
-            .filter(status=RentalApplication.Status.COMPLETED)
-            .filter(Q(renter=user) | Q(owner=user))
-            .select_related("product", "product__owner")
-            .prefetch_related(Prefetch("product__images", queryset=ProductImage.objects.order_by("id")))
-        )
-
-        items = []
-        for r in rentals:
-            if r.product:
-                items.append({
-                    "kind": "rental",
-                    "completed_at": r.completed_date or r.returned_date or r.created_at,
-                    "product": r.product,
-                    "reviewable": r.renter_id == user.id,
-                })
-        for app in rental_apps:
-            if app.product:
-                items.append({
-                    "kind": "rental",
-                    "completed_at": getattr(app, "completed_date", None) or app.created_at,
-                    "product": app.product,
-                    "reviewable": app.renter_id == user.id,
-                })
-        for p in purchases:
-            if p.product:
-                items.append({
-                    "kind": "purchase",
-                    "completed_at": p.completed_date or p.shipped_at or p.created_at,
-                    "product": p.product,
-                    "reviewable": p.buyer_id == user.id,
-                })
-
-        items.sort(key=lambda x: x["completed_at"] or timezone.now(), reverse=True)
-        product_ids = [item["product"].id for item in items if item.get("product")]
-        review_by_product = {}
-        if product_ids:
-            review_qs = (
-                Review.objects
-                .filter(user=user, product_id__in=product_ids)
-                .order_by("-created_at")
-            )
-            for rv in review_qs:
-                if rv.product_id not in review_by_product:
-                    review_by_product[rv.product_id] = rv
-        for item in items:
-            product = item.get("product")
-            if not product:
-                item["review"] = None
-                item["can_review"] = False
-                continue
-            item["review"] = review_by_product.get(product.id)
-            item["can_review"] = bool(item.get("reviewable")) and item["review"] is None
-        transactions = items
-
-    ctx = {
+    ctx = _profile_tab_context(user, active_tab, request.GET.get("page"))
+    params = request.GET.copy()
+    params.pop("page", None)
+    ctx.update({
         "user_obj": user,
         "profile": profile,
         "active_tab": active_tab,
         "editing": editing,
-        "my_products": my_products,
-        "favorites": favorites,
-        "renting_products": renting_products,
-        "transactions": transactions,
-        "has_active_rental": has_active_rental,
-    }
+        "has_active_rental": profile.has_active_rental,
+        "querystring": params.urlencode(),
+    })
     return render(request, "frontend/profile/index.html", ctx)
 
 
 @login_required
-def profile_history(request):
-    user = request.user
-
-    rentals = (
-        Rental.objects
-        .filter(status=Rental.Status.COMPLETED.value) 
-        .filter(Q(renter=user) | Q(product__owner=user))
-        .select_related("product", "product__owner")
-        .prefetch_related(Prefetch("product__images", queryset=ProductImage.objects.order_by("id")))
-        
-    )
-
-    purchases = (
-        Purchase.objects
-        .filter(status=Purchase.Status.COMPLETED.value) 
-        .filter(Q(buyer=user) | Q(product__owner=user))
-        .select_related("product", "product__owner")
-        .prefetch_related(Prefetch("product__images", queryset=ProductImage.objects.order_by("id")))
-    )
-
-    items = []
-    for r in rentals:
-        if r.product:  
-            items.append({
-                "kind": "rental",
-                "completed_at": r.completed_date or r.returned_date or r.created_at,
-                "product": r.product,
-            })
-    for p in purchases:
-        if p.product:
-            items.append({
-                "kind": "purchase",
-                "completed_at": p.completed_date or p.shipped_at or p.created_at,
-                "product": p.product,
-            })
+def profile_tab(request, tab):
+    """プロフィールのタブ1つ分。?format=json なら JSON、それ以外はタブ部分の HTML 断片を返す"""
+    if tab not in PROFILE_TABS:
+        raise Http404
+    ctx = _profile_tab_context(request.user, tab, request.GET.get("page"))
+    if request.GET.get("format") == "json":
+        return JsonResponse(_profile_tab_json(tab, ctx))
+    ctx["querystring"] = f"tab={tab}"
+    return render(request, f"frontend/profile/_tab_{tab}.html", ctx)
 
-    items.sort(key=lambda x: x["completed_at"] or timezone.now(), reverse=True)
 
-    return render(request, "frontend/profile/history.html", {
-        "transactions": items,
+@login_required
+def profile_history(request):
+    ctx = _profile_history(request.user, request.GET.get("page"))
+    return render(request, "frontend/profile/profile_history.html", {
+        "history_items": ctx["transactions"],
+        "page_obj": ctx["page_obj"],
+        "querystring": "",
     })
 
 
@@ -2993,188 +3066,366 @@ class AdminShippingView(AdminRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        q = (self.request.GET.get("q") or "").strip().lower()
-        shipments = (Shipment.objects
-            .select_related(
-                "product",
-                "product__owner",
-                "rental",
-                "rental__renter",
-                "purchase",
-                "purchase__buyer",
-                "application",
-                "application__owner",
-                "application__renter",
-            )
-            .order_by("-created_at"))
-        if q:
-            shipments = shipments.filter(
-                Q(product__title__icontains=q) |
-                Q(tracking_no__icontains=q) |
-                Q(from_name__icontains=q) | Q(to_name__icontains=q)
-            )
-        shipments = list(shipments)
-        user_ids = set()
-        for s in shipments:
-            if s.rental_id and s.rental:
-                if s.rental.renter_id:
-                    user_ids.add(s.rental.renter_id)
-                if s.product and s.product.owner_id:
-                    user_ids.add(s.product.owner_id)
-            if s.purchase_id and s.purchase:
-                if s.purchase.buyer_id:
-                    user_ids.add(s.purchase.buyer_id)
-                if s.product and s.product.owner_id:
-                    user_ids.add(s.product.owner_id)
-            if s.application_id and s.application:
-                if s.application.renter_id:
-                    user_ids.add(s.application.renter_id)
-                if s.application.owner_id:
-                    user_ids.add(s.application.owner_id)
-        profiles = {p.user_id: p for p in Profile.objects.filter(user_id__in=user_ids)}
-
-        def _contact_for(user, fallback_address=""):
-            if not user:
-                return {"name": "", "address": fallback_address or "", "phone": ""}
-            prof = profiles.get(user.id)
-            name = (getattr(prof, "display_name", "") or getattr(user, "username", ""))[:120]
-            phone = (getattr(prof, "phone", "") or "")[:40]
-            addr = (fallback_address or getattr(prof, "address", "") or "")[:255]
-            return {"name": name, "address": addr, "phone": phone}
-
-        for s in shipments:
-            is_purchase = str(getattr(s, "kind", "")) == getattr(Shipment.Kind, "PURCHASE", "purchase")
-            s.seller_label = "出品者" if is_purchase else "貸し手"
-            s.buyer_label = "購入者" if is_purchase else "借り手"
-
-            seller_user = None
-            buyer_user = None
-            buyer_addr = ""
-            if s.rental_id and s.rental:
-                seller_user = getattr(s.product, "owner", None)
-                buyer_user = s.rental.renter
-                buyer_addr = getattr(s.rental, "shipping_address", "") or ""
-            elif s.purchase_id and s.purchase:
-                seller_user = getattr(s.product, "owner", None)
-                buyer_user = s.purchase.buyer
-                buyer_addr = getattr(s.purchase, "shipping_address", "") or ""
-            elif s.application_id and s.application:
-                seller_user = s.application.owner
-                buyer_user = s.application.renter
-                buyer_addr = getattr(s.application, "address", "") or ""
-
-            seller = _contact_for(seller_user)
-            buyer = _contact_for(buyer_user, fallback_address=buyer_addr)
-            is_outbound = s.direction == getattr(Shipment.Direction, "OUTBOUND", "outbound")
-
-            if not seller["name"]:
-                seller["name"] = s.from_name if is_outbound else s.to_name
-            if not seller["address"]:
-                seller["address"] = s.from_address if is_outbound else s.to_address
-            if not buyer["name"]:
-                buyer["name"] = s.to_name if is_outbound else s.from_name
-            if not buyer["address"]:
-                buyer["address"] = s.to_address if is_outbound else s.from_address
-
-            s.seller_name = seller["name"]
-            s.seller_address = seller["address"]
-            s.buyer_name = buyer["name"]
-            s.buyer_address = buyer["address"]
-            if s.rental_id and s.rental:
-                s.return_tracking_no = getattr(s.rental, "tracking_number_return", "") or ""
-            elif s.purchase_id and s.purchase:
-                s.return_tracking_no = getattr(s.purchase, "return_tracking_number", "") or ""
-            elif s.application_id and s.application:
-                s.return_tracking_no = getattr(s.application, "return_tracking_number", "") or ""
-            else:
-                s.return_tracking_no = ""
-
-        ctx["shipments"] = shipments
+        shipments, selected = _filter_shipments(self.request.GET)
+        shipments = (shipments
+            .select_related("product", "rental", "purchase", "application")
+            .order_by("-created_at", "-id"))
+        page = Paginator(shipments, SHIPPING_PAGE_SIZE).get_page(self.request.GET.get("page"))
+        page.object_list = _attach_shipment_contacts(page.object_list)
+
+        ctx.update({
+            "shipments": page,
+            "page_obj": page,
+            "selected": selected,
+            "querystring": _list_querystring(self.request),
+            "status_choices": Shipment.Status.choices,
+            "kind_choices": Shipment.Kind.choices,
+            "direction_choices": Shipment.Direction.choices,
+        })
         return ctx
 
 
-from marketplace.models import Shipment
-from accounts.models import Profile
-
-def _contact_snapshot(user, fallback_address=""):
-    # 表示名/電話/住所を Profile 優先で固定値化
-    prof = None
+def _date_param(params, name):
+    """YYYY-MM-DD の日付パラメータ。空・形式違い・存在しない日付（2024-02-30 など）は None"""
     try:
-        prof = Profile.objects.get(user=user)
-    except Profile.DoesNotExist:
-        pass
-    name  = getattr(prof, "display_name", "") or getattr(user, "username", "")
-    phone = getattr(prof, "phone", "") or ""
-    addr  = getattr(prof, "address", "") or ""
-    return {
-        "name":  name[:120],
-        "phone": phone[:40],
-        "postal": "",  # 必要なら住所から分離保存に拡張
-        "address": (fallback_address or addr)[:255],
+        return parse_date((params.get(name) or "").strip())
+    except ValueError:
+        return None
+
+
+_SEARCH_FTS_TABLES = None
+
+
+def _search_fts_tables():
+    """marketplace 0030 が SQLite に作った FTS5 表の名前（無ければ空）。1プロセスで1回だけ調べる"""
+    global _SEARCH_FTS_TABLES
+    if _SEARCH_FTS_TABLES is None:
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cur:
+                cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'marketplace_%_fts'")
+                _SEARCH_FTS_TABLES = {row[0] for row in cur.fetchall()}
+        else:
+            _SEARCH_FTS_TABLES = set()
+    return _SEARCH_FTS_TABLES
+
+
+def _shipment_keyword_q(q):
+    """キーワード検索の条件。SQLite で FTS5 表があり3文字以上なら trigram 索引を引き、
+    それ以外（PostgreSQL は 0020 / 0028 の索引が icontains に効く）は icontains のまま"""
+    tables = _search_fts_tables()
+    if len(q) >= 3 and {"marketplace_shipment_fts", "marketplace_product_title_fts"} <= tables:
+        phrase = '"%s"' % q.replace('"', '""')
+        return Q(id__in=RawSQL(
+            "SELECT rowid FROM marketplace_shipment_fts WHERE marketplace_shipment_fts MATCH %s", [phrase]
+        )) | Q(product_id__in=RawSQL(
+            "SELECT rowid FROM marketplace_product_title_fts WHERE marketplace_product_title_fts MATCH %s", [phrase]
+        ))
+    return (
+        Q(tracking_no__icontains=q) |
+        Q(from_name__icontains=q) | Q(to_name__icontains=q) |
+        Q(product__title__icontains=q)
+    )
+
+
+def _filter_shipments(params):
+    """配送管理の絞り込み（キーワード / 状態 / 種別 / 方向 / 作成日）をすべて SQL の WHERE に寄せる"""
+    q = (params.get("q") or "").strip()
+    status = (params.get("status") or "").strip()
+    kind = (params.get("kind") or "").strip()
+    direction = (params.get("direction") or "").strip()
+    date_from = _date_param(params, "date_from")
+    date_to = _date_param(params, "date_to")
+
+    qs = Shipment.objects.all()
+    if q:
+        qs = qs.filter(_shipment_keyword_q(q))
+    if status not in {c[0] for c in Shipment.Status.choices}:
+        status = ""
+    if kind not in {c[0] for c in Shipment.Kind.choices}:
+        kind = ""
+    if direction not in {c[0] for c in Shipment.Direction.choices}:
+        direction = ""
+    if status:
+        qs = qs.filter(status=status)
+    if kind:
+        qs = qs.filter(kind=kind)
+    if direction:
+        qs = qs.filter(direction=direction)
+    # created_at__date だと索引が効かないので、日付は日時の範囲に直して比較する
+    if date_from:
+        qs = qs.filter(created_at__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        qs = qs.filter(created_at__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+
+    return qs, {
+        "q": q,
+        "status": status,
+        "kind": kind,
+        "direction": direction,
+        "date_from": date_from.isoformat() if date_from else "",
+        "date_to": date_to.isoformat() if date_to else "",
     }
 
-def _create_shipment_for_rental(rental, direction, tracking_no=""):
-    kind = Shipment.Kind.RENTAL
+
+# 配送マニフェスト（CSV / PDF 出力）の列。幅の合計は PDF の本文幅（842 - 余白 30 x 2 = 782pt）に収める
+MANIFEST_COLUMNS = [
+    ("created_at", "作成日時", 70),
+    ("kind", "種別", 40),
+    ("direction", "方向", 40),
+    ("tracking_no", "追跡番号", 80),
+    ("product__title", "商品", 88),
+    ("from_name", "差出人", 70),
+    ("from_phone", "差出人電話", 60),
+    ("to_name", "届け先", 70),
+    ("to_postal", "〒", 40),
+    ("to_address", "届け先住所", 124),
+    ("to_phone", "届け先電話", 60),
+    ("status", "状態", 40),
+]
+EXPORT_CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """csv.writer の書き込み先。書いた1行をそのまま返す（StreamingHttpResponse 用）"""
+
+    def write(self, value):
+        return value
+
+
+# Excel 等で数式として解釈される先頭文字（CSV インジェクション対策）
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@")
+
+
+def _csv_safe(row):
+    """数式として開かれないよう、該当する値の先頭に ' を付ける"""
+    return ["'" + v if isinstance(v, str) and v.startswith(CSV_FORMULA_PREFIXES) else v for v in row]
+
+
+def _manifest_rows(shipments):
+    """表示名に置き換えた1行ずつのリストを返す。サーバーサイドカーソルで chunk ずつ読む"""
+    kinds = dict(Shipment.Kind.choices)
+    directions = dict(Shipment.Direction.choices)
+    statuses = dict(Shipment.Status.choices)
+    fields = [c[0] for c in MANIFEST_COLUMNS]
+    for row in shipments.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        rec = dict(zip(fields, row))
+        rec["created_at"] = timezone.localtime(rec["created_at"]).strftime("%Y-%m-%d %H:%M")
+        rec["kind"] = kinds.get(rec["kind"], rec["kind"])
+        rec["direction"] = directions.get(rec["direction"], rec["direction"])
+        rec["status"] = statuses.get(rec["status"], rec["status"])
+        yield [rec[f] or "" for f in fields]
+
+
+@login_required
+def shipping_export(request):
+    """配送管理: 絞り込み中の配送を CSV / PDF のマニフェストとして逐次出力する"""
+    if not request.user.is_staff:
+        return HttpResponseForbidden("forbidden")
+    fmt = request.GET.get("fmt", "csv")
+    if fmt not in ("csv", "pdf"):
+        return HttpResponseBadRequest("invalid format")
+
+    shipments, _selected = _filter_shipments(request.GET)
+    shipments = shipments.order_by("created_at", "id")
+    headers = [c[1] for c in MANIFEST_COLUMNS]
+    filename = f"shipments_{timezone.localdate():%Y%m%d}.{fmt}"
+
+    if fmt == "pdf":
+        body = stream_table_pdf(
+            f"配送マニフェスト {timezone.localtime():%Y-%m-%d %H:%M}",
+            headers,
+            _manifest_rows(shipments),
+            [c[2] for c in MANIFEST_COLUMNS],
+        )
+        response = StreamingHttpResponse(body, content_type="application/pdf")
+    else:
+        writer = csv.writer(_Echo())
+        rows = (_csv_safe(r) for r in _manifest_rows(shipments))
+        body = (writer.writerow(r) for r in itertools.chain([headers], rows))
+        # Excel で文字化けしないよう BOM を先頭に付ける
+        response = StreamingHttpResponse(
+            itertools.chain(["\ufeff"], body), content_type="text/csv; charset=utf-8"
+        )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _shipment_parties(s):
+    """(出品者/貸し手の user_id, 購入者/借り手の user_id, 取引側の配送先住所)"""
+    if s.rental_id and s.rental:
+        return (s.rental.seller_id or s.product.owner_id,
+                s.rental.renter_id,
+                getattr(s.rental, "shipping_address", "") or "")
+    if s.purchase_id and s.purchase:
+        return (s.purchase.seller_id or s.product.owner_id,
+                s.purchase.buyer_id,
+                getattr(s.purchase, "shipping_address", "") or "")
+    if s.application_id and s.application:
+        return (s.application.owner_id,
+                s.application.renter_id,
+                getattr(s.application, "address", "") or "")
+    return (getattr(s.product, "owner_id", None), None, "")
+
+
+def _attach_shipment_contacts(shipments):
+    """表示中の行だけに当事者の表示用属性を付ける。
+    氏名・住所はスナップショット列を使い、欠けている行の当事者だけ User/Profile をまとめて引く。"""
+    rows = list(shipments)
+    outbound = getattr(Shipment.Direction, "OUTBOUND", "outbound")
+    missing_user_ids = set()
+    for s in rows:
+        is_purchase = str(getattr(s, "kind", "")) == getattr(Shipment.Kind, "PURCHASE", "purchase")
+        s.seller_label = "出品者" if is_purchase else "貸し手"
+        s.buyer_label = "購入者" if is_purchase else "借り手"
+
+        is_outbound = s.direction == outbound
+        s.seller_name = s.from_name if is_outbound else s.to_name
+        s.seller_address = s.from_address if is_outbound else s.to_address
+        s.buyer_name = s.to_name if is_outbound else s.from_name
+        s.buyer_address = s.to_address if is_outbound else s.from_address
+
+        s.seller_user_id, s.buyer_user_id, s.buyer_fallback_address = _shipment_parties(s)
+        if s.buyer_fallback_address and not s.buyer_address:
+            s.buyer_address = s.buyer_fallback_address[:255]
+        if s.seller_user_id and not (s.seller_name and s.seller_address):
+            missing_user_ids.add(s.seller_user_id)
+        if s.buyer_user_id and not (s.buyer_name and s.buyer_address):
+            missing_user_ids.add(s.buyer_user_id)
+
+        if s.rental_id and s.rental:
+            s.return_tracking_no = getattr(s.rental, "tracking_number_return", "") or ""
+        elif s.purchase_id and s.purchase:
+            s.return_tracking_no = getattr(s.purchase, "return_tracking_number", "") or ""
+        elif s.application_id and s.application:
+            s.return_tracking_no = getattr(s.application, "return_tracking_number", "") or ""
+        else:
+            s.return_tracking_no = ""
+
+    if missing_user_ids:
+        users = {
+            u.id: u
+            for u in get_user_model().objects.filter(id__in=missing_user_ids).select_related("profile")
+        }
+        for s in rows:
+            for role in ("seller", "buyer"):
+                u = users.get(getattr(s, f"{role}_user_id"))
+                if not u:
+                    continue
+                prof = getattr(u, "profile", None)
+                if not getattr(s, f"{role}_name"):
+                    setattr(s, f"{role}_name", (getattr(prof, "display_name", "") or u.username)[:120])
+                if not getattr(s, f"{role}_address"):
+                    setattr(s, f"{role}_address", (getattr(prof, "address", "") or "")[:255])
+    return rows
+
+
+# ========= 配送スナップショット =========
+
+def _profile_cache(request):
+    """1リクエスト内で読んだ Profile を使い回す（request に保持。request が無ければ使い捨て）"""
+    if request is None:
+        return {}
+    cache = getattr(request, "_profile_cache", None)
+    if cache is None:
+        cache = request._profile_cache = {}
+    return cache
+
+
+def _contact_snapshots(users, request=None):
+    """表示名/電話/住所を Profile 優先で固定値化し {user_id: dict} で返す。
+    未読の Profile は user_id__in の1クエリでまとめて引く。"""
+    users = [u for u in users if u]
+    cache = _profile_cache(request)
+    missing = {u.id for u in users if u.id not in cache}
+    if missing:
+        found = {p.user_id: p for p in Profile.objects.filter(user_id__in=missing)}
+        for uid in missing:
+            cache[uid] = found.get(uid)
+    snaps = {}
+    for u in users:
+        prof = cache.get(u.id)
+        snaps[u.id] = {
+            "name":  (getattr(prof, "display_name", "") or getattr(u, "username", ""))[:120],
+            "phone": (getattr(prof, "phone", "") or "")[:40],
+            "postal": "",  # 必要なら住所から分離保存に拡張
+            "address": (getattr(prof, "address", "") or "")[:255],
+        }
+    return snaps
+
+
+def _upsert_shipment(link, obj, kind, direction, sender, receiver,
+                     sender_address="", receiver_address="", tracking_no="",
+                     status=None, request=None, extra=None):
+    """配送レコードの作成/更新の共通処理。link は "rental" / "purchase" / "application"。
+    氏名・住所をスナップショット済みの行は追跡番号と状態だけ更新し、Profile は読み直さない。"""
+    if status is None:
+        status = Shipment.Status.CREATED
+    lookup = {link: obj, "direction": direction}
+
+    shipment = Shipment.objects.filter(**lookup).first()
+    if shipment and shipment.from_name and shipment.to_name:
+        shipment.tracking_no = tracking_no or shipment.tracking_no
+        shipment.status = status
+        shipment.save(update_fields=["tracking_no", "status", "updated_at"])
+        return shipment
+
+    snaps = _contact_snapshots([sender, receiver], request=request)
+    frm = snaps.get(getattr(sender, "id", None)) or {"name": "", "phone": "", "postal": "", "address": ""}
+    to  = snaps.get(getattr(receiver, "id", None)) or {"name": "", "phone": "", "postal": "", "address": ""}
+    defaults = {
+        "kind": kind,
+        "product": obj.product,
+        "from_name": frm["name"],
+        "from_phone": frm["phone"],
+        "from_postal": frm["postal"],
+        "from_address": (sender_address or frm["address"])[:255],
+        "to_name": to["name"],
+        "to_phone": to["phone"],
+        "to_postal": to["postal"],
+        "to_address": (receiver_address or to["address"])[:255],
+        "tracking_no": tracking_no or "",
+        "status": status,
+        "is_platform_intermediated": True,
+    }
+    defaults.update(extra or {})
+    shipment, _ = Shipment.objects.update_or_create(**lookup, defaults=defaults)
+    return shipment
+
+
+def _create_shipment_for_rental(rental, direction, tracking_no="", status=None, request=None):
+    owner = rental.product.owner
     if direction == Shipment.Direction.OUTBOUND:
         # 貸し手 → 借り手
-        frm = _contact_snapshot(rental.product.owner)
-        to  = _contact_snapshot(rental.renter, fallback_address=rental.shipping_address)
-    else:
-        # 借り手 → 貸し手（返却）
-        frm = _contact_snapshot(rental.renter)
-        to  = _contact_snapshot(rental.product.owner)
-    Shipment.objects.update_or_create(
-        rental=rental,
-        direction=direction,
-        defaults={
-            "kind": kind,
-            "product": rental.product,
-            "from_name": frm["name"],
-            "from_phone": frm["phone"],
-            "from_postal": frm["postal"],
-            "from_address": frm["address"],
-            "to_name": to["name"],
-            "to_phone": to["phone"],
-            "to_postal": to["postal"],
-            "to_address": to["address"],
-            "tracking_no": tracking_no or "",
-            "status": Shipment.Status.CREATED,
-            "is_platform_intermediated": True,
-        },
+        return _upsert_shipment(
+            "rental", rental, Shipment.Kind.RENTAL, direction, owner, rental.renter,
+            receiver_address=getattr(rental, "shipping_address", "") or "",
+            tracking_no=tracking_no, status=status, request=request,
+        )
+    # 借り手 → 貸し手（返却）
+    return _upsert_shipment(
+        "rental", rental, Shipment.Kind.RENTAL, direction, rental.renter, owner,
+        tracking_no=tracking_no, status=status, request=request,
     )
 
-def _create_shipment_for_purchase(purchase, direction, tracking_no=""):
-    kind = Shipment.Kind.PURCHASE
+
+def _create_shipment_for_purchase(purchase, direction, tracking_no="", status=None, request=None):
+    owner = purchase.product.owner
+    ship_addr = getattr(purchase, "shipping_address", "") or ""
     if direction == Shipment.Direction.OUTBOUND:
-        # 出品者 → 買い手
-        frm = _contact_snapshot(purchase.product.owner)
-        # Purchase.shipping_address に郵便含んでるならそれを優先
-        to_addr = getattr(purchase, "shipping_address", "") or ""
-        to  = _contact_snapshot(purchase.buyer, fallback_address=to_addr)
-    else:
-        # 返品: 買い手 → 出品者
-        frm = _contact_snapshot(purchase.buyer)
-        to  = _contact_snapshot(purchase.product.owner)
-    Shipment.objects.update_or_create(
-        purchase=purchase,
-        direction=direction,
-        defaults={
-            "kind": kind,
-            "product": purchase.product,
-            "from_name": frm["name"],
-            "from_phone": frm["phone"],
-            "from_postal": frm["postal"],
-            "from_address": frm["address"],
-            "to_name": to["name"],
-            "to_phone": to["phone"],
-            "to_postal": to["postal"],
-            "to_address": to["address"],
-            "tracking_no": tracking_no or "",
-            "status": Shipment.Status.CREATED,
-            "is_platform_intermediated": True,
-        },
+        # 出品者 → 買い手（Purchase.shipping_address を優先）
+        return _upsert_shipment(
+            "purchase", purchase, Shipment.Kind.PURCHASE, direction, owner, purchase.buyer,
+            receiver_address=ship_addr,
+            tracking_no=tracking_no, status=status, request=request,
+        )
+    # 返品: 買い手 → 出品者
+    return _upsert_shipment(
+        "purchase", purchase, Shipment.Kind.PURCHASE, direction, purchase.buyer, owner,
+        sender_address=ship_addr,
+        tracking_no=tracking_no, status=status, request=request,
     )
 
+
 @login_required
 @require_POST
 def shipping_update(request):
@@ -3182,15 +3433,68 @@ def shipping_update(request):
         return HttpResponseForbidden("forbidden")
     sid = request.POST.get("shipment_id")
     st  = request.POST.get("status")
-    s = get_object_or_404(Shipment, id=sid)
+    get_object_or_404(Shipment, id=sid)
     valid = {c[0] for c in Shipment.Status.choices}
     if st not in valid:
         return HttpResponseBadRequest("invalid status")
-    s.status = st
-    s.save(update_fields=["status", "updated_at"])
+    set_shipment_status([sid], st)
     messages.success(request, "配送ステータスを更新しました。")
-    return redirect("frontend:admin_shipping")
+    return redirect(request.META.get("HTTP_REFERER") or "frontend:admin_shipping")
+
 
+def _shipping_report_message(request, report, dry_run):
+    t = report["transitions"]
+    text = (
+        f"{'【確認のみ】' if dry_run else ''}"
+        f"対象 {report['rows']} 件 / 一致 {report['matched']} 件 / 更新 {report['updated']} 件 / "
+        f"変更なし {report['unchanged']} 件 / 未登録 {len(report['unknown'])} 件 / 不正 {len(report['invalid'])} 件"
+        f"（取引の進行: レンタル {t['rental']}・購入 {t['purchase']}・申請 {t['application']}）"
+    )
+    if report["unknown"] or report["invalid"]:
+        messages.warning(request, text)
+    else:
+        messages.success(request, text)
+
+
+@login_required
+@require_POST
+def shipping_bulk_update(request):
+    """配送管理: チェックした配送をまとめて同じステータスにする"""
+    if not request.user.is_staff:
+        return HttpResponseForbidden("forbidden")
+    ids = request.POST.getlist("shipment_ids")
+    st = request.POST.get("status")
+    if st not in {c[0] for c in Shipment.Status.choices}:
+        return HttpResponseBadRequest("invalid status")
+    if not ids:
+        messages.warning(request, "更新する配送を選択してください。")
+    else:
+        dry_run = bool(request.POST.get("dry_run"))
+        _shipping_report_message(request, set_shipment_status(ids, st, dry_run=dry_run), dry_run)
+    return redirect(request.META.get("HTTP_REFERER") or "frontend:admin_shipping")
+
+
+@login_required
+@require_POST
+def shipping_import(request):
+    """配送管理: 配送会社の CSV / JSONL（tracking_no, status）を取り込む"""
+    if not request.user.is_staff:
+        return HttpResponseForbidden("forbidden")
+    upload = request.FILES.get("file")
+    if not upload:
+        messages.error(request, "取り込むファイルを選択してください。")
+        return redirect("frontend:admin_shipping")
+
+    fmt = "jsonl" if upload.name.lower().endswith((".jsonl", ".ndjson")) else "csv"
+    dry_run = bool(request.POST.get("dry_run"))
+    stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    try:
+        report = apply_status_rows(iter_status_rows(stream, fmt), dry_run=dry_run)
+    except (UnicodeDecodeError, csv.Error):
+        messages.error(request, "ファイルを読み込めませんでした（UTF-8 の CSV / JSONL を指定してください）。")
+        return redirect("frontend:admin_shipping")
+    _shipping_report_message(request, report, dry_run)
+    return redirect("frontend:admin_shipping")
 
 
 # ========= エラー =========
@@ -1,6 +1,21 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 
 
 class MarketplaceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'marketplace'
+
+    def ready(self):
+        from marketplace.models import (
+            _counted_file_fields, _release_deleted_files, _release_replaced_files,
+            _remember_replaced_files, _remember_stored_files,
+        )
+
+        # 参照数を数えるファイル列を持つモデルだけに接続する（他のモデルの保存・削除ではレシーバを呼ばない）
+        for model in apps.get_models():
+            if _counted_file_fields(model):
+                post_init.connect(_remember_stored_files, sender=model)
+                pre_save.connect(_remember_replaced_files, sender=model)
+                post_save.connect(_release_replaced_files, sender=model)
+                post_delete.connect(_release_deleted_files, sender=model)
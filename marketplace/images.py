@@ -0,0 +1,147 @@
+"""商品画像のリサイズ（サムネイル / カード / 詳細）。
+
+アップロード時（ProductImage の post_save）と process_product_images コマンドから使う。
+EXIF の向きを反映してから再エンコードするので、生成物には EXIF などのメタデータは残らない。
+原本も公開 URL で配信されるため、EXIF（位置情報など）や ICC を含む原本は向きを反映して保存し直し、差し替える。
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+
+# 名前: (幅, 高さ, 切り抜くか)。切り抜かないものは枠内に収める
+# *2x は高解像度ディスプレイ向け（srcset で同じ縦横比の 1x と並べる）
+RENDITIONS = {
+    "thumb":   (200, 200, True),
+    "thumb2x": (400, 400, True),
+    "card":    (480, 360, True),
+    "card2x":  (960, 720, True),
+    "detail":  (1200, 1200, False),
+}
+RENDITION_DIR = "products/renditions"
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+# 原本を保存し直すときの画質（原本として残すので高めにする）
+SOURCE_JPEG_QUALITY = 95
+# 原本から落とすメタデータ（PNG のテキストチャンクなどは info に任意のキーで入るので、これ以外も含め info ごと捨てる）
+METADATA_KEYS = ("exif", "icc_profile", "xmp", "XML:com.adobe.xmp", "comment", "photoshop")
+# 形式ごとの再保存先（拡張子, 保存形式）。それ以外の形式は PNG にする
+SOURCE_FORMATS = {"JPEG": (".jpg", "JPEG"), "PNG": (".png", "PNG"), "WEBP": (".webp", "WEBP")}
+
+
+def webp_supported():
+    return features.check("webp")
+
+
+def _encode(img, fmt):
+    buf = BytesIO()
+    if fmt == "webp":
+        img.save(buf, "WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        img.save(buf, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def _resize(img, width, height, crop):
+    if crop:
+        return ImageOps.fit(img, (width, height), Image.LANCZOS)
+    resized = img.copy()
+    resized.thumbnail((width, height), Image.LANCZOS)
+    return resized
+
+
+def _has_metadata(img):
+    return bool(img.getexif()) or any(key in img.info for key in METADATA_KEYS)
+
+
+def _strip_source(img, fmt, name):
+    """向きを反映済みの img をメタデータ無しで保存し直し、(保存名の候補, bytes) を返す"""
+    ext, save_as = SOURCE_FORMATS.get(fmt, (".png", "PNG"))
+    if save_as == "JPEG" and img.mode not in ("RGB", "L", "CMYK"):
+        img = img.convert("RGB")
+    img.info = {}
+    buf = BytesIO()
+    if save_as == "JPEG":
+        img.save(buf, "JPEG", quality=SOURCE_JPEG_QUALITY, optimize=True)
+    elif save_as == "WEBP":
+        img.save(buf, "WEBP", lossless=True)
+    else:
+        img.save(buf, "PNG", optimize=True)
+    return os.path.splitext(name)[0] + ext, buf.getvalue()
+
+
+def rendition_paths(renditions):
+    return {
+        spec[key]
+        for spec in (renditions or {}).values() if isinstance(spec, dict)
+        for key in ("jpeg", "webp") if spec.get(key)
+    }
+
+
+def delete_renditions(renditions):
+    for path in rendition_paths(renditions):
+        default_storage.delete(path)
+
+
+def build_renditions(product_image):
+    """原本を読み込み、各サイズの JPEG / WebP を保存して (幅, 高さ, renditions) を返す。
+    原本にメタデータがあれば保存し直し、renditions["source"] を新しい原本名にする"""
+    with product_image.image.open("rb") as f:
+        original = Image.open(f)
+        source = product_image.image.name
+        img = ImageOps.exif_transpose(original)
+        if _has_metadata(original):
+            name, data = _strip_source(img.copy(), original.format, source)
+            source = product_image.image.storage.save(name, ContentFile(data))
+        if img.mode not in ("RGB", "L"):
+            # 透過は白背景に合成（JPEG は透過を持てないため）
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            rgba = img.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+        else:
+            img = img.convert("RGB")
+        width, height = img.size
+
+        stem = os.path.splitext(os.path.basename(product_image.image.name))[0]
+        renditions = {"source": source}
+        formats = ["jpeg", "webp"] if webp_supported() else ["jpeg"]
+        for name, (w, h, crop) in RENDITIONS.items():
+            resized = _resize(img, w, h, crop)
+            spec = {"width": resized.width, "height": resized.height}
+            for fmt in formats:
+                ext = "jpg" if fmt == "jpeg" else fmt
+                path = f"{RENDITION_DIR}/{name}/{stem}.{ext}"
+                spec[fmt] = default_storage.save(path, ContentFile(_encode(resized, fmt)))
+            renditions[name] = spec
+    return width, height, renditions
+
+
+def process_product_image(product_image):
+    """ProductImage の寸法とサイズ別画像を作り直して保存する。失敗時は False"""
+    if not product_image.image:
+        return False
+    # 作り直す前に古いサイズ別画像を手放す（内容ハッシュ名のストレージでは参照数が減るだけ）
+    delete_renditions(product_image.renditions)
+    try:
+        width, height, renditions = build_renditions(product_image)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        product_image.width, product_image.height, product_image.renditions = None, None, {}
+        product_image.save(update_fields=["width", "height", "renditions"])
+        return False
+    fields = ["width", "height", "renditions"]
+    if renditions["source"] != product_image.image.name:
+        # メタデータを落とした原本に差し替える（古い原本は pre_save / post_save の受信側が手放す）
+        product_image.image.name = renditions["source"]
+        fields.append("image")
+    product_image.width, product_image.height, product_image.renditions = width, height, renditions
+    product_image.save(update_fields=fields)
+    return True
+
+
+def process_on_upload():
+    return getattr(settings, "PRODUCT_IMAGE_PROCESS_ON_UPLOAD", True)
@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Coalesce
+
+from accounts.models import Profile
+from marketplace.models import (
+    Purchase, Rental, RentalApplication, TransactionEvent,
+    build_transaction_events, count_seller_completions, grant_review_eligibility, transaction_event_code,
+)
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "既存の Rental / Purchase / RentalApplication から TransactionEvent（取引履歴）を作り、"
+        "ReviewEligibility と出品者の完了件数をイベントから作り直す"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="件数だけ数えて書き込まない")
+
+    def handle(self, *args, **opts):
+        Kind = TransactionEvent.Kind
+        sources = [
+            # 完了日時は旧 profile_history と同じ優先順（完了日 → 返却日/発送日 → 作成日）
+            (Kind.RENTAL, Rental.objects.annotate(
+                seller_or_owner=Coalesce("seller_id", "product__owner_id"),
+                done_at=Coalesce("completed_date", "returned_date", "created_at"),
+            ).values_list("id", "product_id", "renter_id", "seller_or_owner", "status", "done_at", "created_at")),
+            (Kind.PURCHASE, Purchase.objects.annotate(
+                done_at=Coalesce("completed_date", "shipped_at", "created_at"),
+            ).values_list("id", "product_id", "buyer_id", "seller_id", "status", "done_at", "created_at")),
+            (Kind.APPLICATION, RentalApplication.objects.annotate(
+                done_at=F("created_at"),
+            ).values_list("id", "product_id", "renter_id", "owner_id", "status", "done_at", "created_at")),
+        ]
+
+        total = 0
+        for kind, qs in sources:
+            # イベントが1件もない取引だけ（何度流しても重複しない）
+            recorded = TransactionEvent.objects.filter(kind=kind, source_id=OuterRef("pk"))
+            qs = qs.filter(~Exists(recorded)).order_by("id")
+            events = []
+            count = 0
+            for source_id, product_id, client_id, seller_id, status, done_at, created_at in qs.iterator(chunk_size=BATCH_SIZE):
+                completed = transaction_event_code(kind, status) == TransactionEvent.COMPLETED
+                occurred_at = done_at if completed else created_at
+                events.extend(build_transaction_events(
+                    kind, [(source_id, product_id, client_id, seller_id)], status, occurred_at,
+                ))
+                count += 1
+                if len(events) >= BATCH_SIZE:
+                    self._flush(events, opts["dry_run"])
+                    events = []
+            self._flush(events, opts["dry_run"])
+            self.stdout.write(f"{kind}: {count}")
+            total += count
+        self.stdout.write(f"total={total}{' (dry-run)' if opts['dry_run'] else ''}")
+        if not opts["dry_run"]:
+            self._rebuild_derived()
+
+    @transaction.atomic
+    def _rebuild_derived(self):
+        """レビュー資格と完了件数を、通常の遷移と同じ関数（record_transaction_events と同じ規則）で
+        完了イベント全体から作り直す。件数は 0 に戻してから数えるので、何度流しても同じ値になる"""
+        Profile.objects.update(completed_rentals=0, completed_purchases=0)
+        events = (
+            TransactionEvent.objects.filter(event=TransactionEvent.COMPLETED)
+            .only("user_id", "role", "kind", "product_id", "event", "occurred_at")
+            .order_by("id")
+        )
+        chunk = []
+        for ev in events.iterator(chunk_size=BATCH_SIZE):
+            chunk.append(ev)
+            if len(chunk) >= BATCH_SIZE:
+                grant_review_eligibility(chunk)
+                count_seller_completions(chunk)
+                chunk = []
+        grant_review_eligibility(chunk)
+        count_seller_completions(chunk)
+
+    def _flush(self, events, dry_run):
+        if events and not dry_run:
+            TransactionEvent.objects.bulk_create(events, batch_size=BATCH_SIZE)
+
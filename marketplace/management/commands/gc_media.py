@@ -0,0 +1,90 @@
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.utils import timezone
+
+from marketplace.images import rendition_paths
+from marketplace.models import MediaBlob, ProductImage
+
+
+def referenced_names():
+    """DB から参照されているメディアのパスと参照数（全モデルの FileField + 商品画像のサイズ別画像）"""
+    refs = Counter()
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if not isinstance(field, models.FileField):
+                continue
+            names = (
+                model._default_manager.exclude(**{field.attname: ""})
+                .exclude(**{f"{field.attname}__isnull": True})
+                .values_list(field.attname, flat=True)
+            )
+            refs.update(names.iterator(chunk_size=2000))
+    for renditions in ProductImage.objects.exclude(renditions={}).values_list("renditions", flat=True).iterator(chunk_size=2000):
+        refs.update(rendition_paths(renditions))
+    return refs
+
+
+class Command(BaseCommand):
+    help = "参照されなくなったメディアファイルを削除する（内容ハッシュ名のファイル + 任意で旧形式のファイル）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="削除せずに対象だけ表示する")
+        parser.add_argument("--grace-hours", type=int, default=24,
+                            help="作成からこの時間以内のファイルは消さない（アップロード途中の保護）")
+        parser.add_argument("--untracked", action="store_true",
+                            help="MEDIA_ROOT 配下の、どこからも参照されていない旧形式のファイルも削除する")
+
+    def handle(self, *args, **opts):
+        dry_run = opts["dry_run"]
+        cutoff = timezone.now() - timedelta(hours=opts["grace_hours"])
+        refs = referenced_names()
+
+        # 参照数を DB の実態に合わせ（ずれの補正）、0 かつ猶予を過ぎたものを消す
+        to_fix, orphans = [], []
+        for blob in MediaBlob.objects.iterator(chunk_size=2000):
+            actual = refs.get(blob.name, 0)
+            if blob.ref_count != actual:
+                blob.ref_count = actual
+                to_fix.append(blob)
+            if actual == 0 and blob.created_at < cutoff:
+                orphans.append(blob)
+
+        freed = 0
+        for blob in orphans:
+            self.stdout.write(f"  orphan: {blob.name}")
+            freed += blob.size
+        if not dry_run:
+            MediaBlob.objects.bulk_update(to_fix, ["ref_count"], batch_size=500)
+            for blob in orphans:
+                default_storage.purge(blob.name)
+            MediaBlob.objects.filter(pk__in=[b.pk for b in orphans]).delete()
+
+        untracked = 0
+        if opts["untracked"]:
+            tracked = set(MediaBlob.objects.values_list("name", flat=True))
+            root = str(settings.MEDIA_ROOT)
+            for dirpath, _dirs, files in os.walk(root):
+                for filename in files:
+                    path = os.path.join(dirpath, filename)
+                    name = os.path.relpath(path, root).replace(os.sep, "/")
+                    if name in refs or name in tracked:
+                        continue
+                    if datetime.fromtimestamp(os.path.getmtime(path), tz=dt_timezone.utc) >= cutoff:
+                        continue
+                    self.stdout.write(f"  untracked: {name}")
+                    untracked += 1
+                    freed += os.path.getsize(path)
+                    if not dry_run:
+                        os.remove(path)
+
+        self.stdout.write(
+            f"{'[dry-run] ' if dry_run else ''}recounted={len(to_fix)} purged={len(orphans)} "
+            f"untracked={untracked} freed_bytes={freed}"
+        )
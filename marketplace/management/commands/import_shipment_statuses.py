@@ -0,0 +1,45 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.utils import STATUS_BATCH_SIZE, apply_status_rows, iter_status_rows
+
+
+class Command(BaseCommand):
+    help = "配送会社の CSV / JSONL から追跡番号で配送ステータスを一括更新する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="取り込むファイル（- で標準入力）")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="省略時は拡張子で判定（既定 csv）")
+        parser.add_argument("--dry-run", action="store_true", help="更新せずに件数だけ表示する")
+        parser.add_argument("--batch-size", type=int, default=STATUS_BATCH_SIZE)
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        fmt = opts["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        try:
+            stream = sys.stdin if path == "-" else open(path, encoding="utf-8-sig", newline="")
+        except OSError as e:
+            raise CommandError(str(e))
+
+        try:
+            report = apply_status_rows(
+                iter_status_rows(stream, fmt),
+                dry_run=opts["dry_run"],
+                batch_size=max(1, opts["batch_size"]),
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        t = report["transitions"]
+        self.stdout.write(
+            f"{'[dry-run] ' if opts['dry_run'] else ''}"
+            f"rows={report['rows']} matched={report['matched']} updated={report['updated']} "
+            f"unchanged={report['unchanged']} unknown={len(report['unknown'])} invalid={len(report['invalid'])} "
+            f"rental={t['rental']} purchase={t['purchase']} application={t['application']}"
+        )
+        for tracking in report["unknown"][:20]:
+            self.stdout.write(f"  unknown tracking_no: {tracking}")
+        for lineno in report["invalid"][:20]:
+            self.stdout.write(f"  invalid row: line {lineno}")
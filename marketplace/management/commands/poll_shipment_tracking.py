@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.tracking import load_carriers, poll_shipments
+
+
+class Command(BaseCommand):
+    help = "輸送中の配送を配送会社に照会し、ステータスを一括更新する（cron などから定期実行）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=200, help="1回で照会する最大件数")
+        parser.add_argument("--workers", type=int, default=4, help="照会の並列数")
+        parser.add_argument("--dry-run", action="store_true", help="更新せずに件数だけ表示する")
+        parser.add_argument("--no-advance", action="store_true", help="配達完了でも取引の状態は進めない")
+
+    def handle(self, *args, **opts):
+        carriers = load_carriers()
+        if not carriers:
+            raise CommandError("settings.SHIPMENT_CARRIERS に配送会社が設定されていません。")
+
+        report = poll_shipments(
+            carriers,
+            limit=max(1, opts["limit"]),
+            workers=opts["workers"],
+            dry_run=opts["dry_run"],
+            advance=not opts["no_advance"],
+        )
+        t = report["transitions"]
+        self.stdout.write(
+            f"{'[dry-run] ' if opts['dry_run'] else ''}"
+            f"polled={report['polled']} no_carrier={report['no_carrier']} no_answer={report['no_answer']} "
+            f"updated={report['updated']} unchanged={report['unchanged']} "
+            f"rental={t['rental']} purchase={t['purchase']} application={t['application']}"
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.images import process_product_image
+from marketplace.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = "既存の商品画像にサイズ別画像（thumb / card / detail）と寸法を付ける"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="生成済みのものも作り直す")
+        parser.add_argument("--limit", type=int, default=0, help="処理する最大件数（0 は無制限）")
+
+    def handle(self, *args, **opts):
+        qs = ProductImage.objects.exclude(image="").order_by("id")
+        if not opts["all"]:
+            qs = qs.filter(width__isnull=True)
+        if opts["limit"]:
+            qs = qs[:opts["limit"]]
+
+        done = failed = 0
+        for image in qs.iterator(chunk_size=200):
+            if process_product_image(image):
+                done += 1
+            else:
+                failed += 1
+                self.stderr.write(f"  failed: ProductImage #{image.pk} ({image.image.name})")
+        self.stdout.write(f"processed={done} failed={failed}")
@@ -0,0 +1,48 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from marketplace.models import Product, ProductFavorite, refresh_favorite_counts
+
+
+def trending_scores(now, half_life_days, window_days):
+    """お気に入り1件ごとに 0.5 ** (経過日数 / 半減期) を足した {product_id: score}。
+    窓より古いお気に入りはほぼ 0 なので読まない"""
+    scores = defaultdict(float)
+    rows = (
+        ProductFavorite.objects
+        .filter(created_at__gte=now - timedelta(days=window_days))
+        .values_list("product_id", "created_at")
+    )
+    for product_id, created_at in rows.iterator(chunk_size=2000):
+        age_days = max((now - created_at).total_seconds(), 0) / 86400
+        scores[product_id] += 0.5 ** (age_days / half_life_days)
+    return scores
+
+
+class Command(BaseCommand):
+    help = "商品の trending_score（時間減衰つきのお気に入り数）を計算し直す。cron などで定期実行する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--half-life-days", type=float, default=7.0,
+                            help="お気に入りの重みが半分になるまでの日数")
+        parser.add_argument("--window-days", type=int, default=60,
+                            help="この日数より前のお気に入りは数えない")
+        parser.add_argument("--recount", action="store_true",
+                            help="favorite_count も ProductFavorite の実数で数え直す（ずれの補正）")
+
+    def handle(self, *args, **opts):
+        now = timezone.now()
+        scores = trending_scores(now, opts["half_life_days"], opts["window_days"])
+
+        with transaction.atomic():
+            recounted = refresh_favorite_counts() if opts["recount"] else 0
+            # 窓から外れた商品は 0 に戻す
+            cleared = Product.objects.filter(trending_score__gt=0).exclude(pk__in=scores.keys()).update(trending_score=0)
+            products = [Product(pk=pk, trending_score=round(score, 6)) for pk, score in scores.items()]
+            Product.objects.bulk_update(products, ["trending_score"], batch_size=500)
+
+        self.stdout.write(f"scored={len(products)} cleared={cleared} recounted={recounted}")
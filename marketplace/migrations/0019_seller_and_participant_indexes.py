@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_seller(apps, schema_editor):
+    # 既存の Rental / Purchase に product.owner を seller として写す
+    Product = apps.get_model("marketplace", "Product")
+    owner_of_product = Subquery(
+        Product.objects.filter(pk=OuterRef("product_id")).values("owner_id")[:1]
+    )
+    for model_name in ("Rental", "Purchase"):
+        model = apps.get_model("marketplace", model_name)
+        model.objects.filter(seller__isnull=True).update(seller_id=owner_of_product)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0018_productcomment_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='seller',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_purchases', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='rental',
+            name='seller',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_rentals', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_seller, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['buyer', 'hidden_by_buyer', '-id'], name='marketplace_buyer_i_49cccc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['seller', 'hidden_by_seller', '-id'], name='marketplace_seller__f72637_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['renter', '-id'], name='marketplace_renter__fd7d0c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['seller', '-id'], name='marketplace_seller__817220_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalapplication',
+            index=models.Index(fields=['owner', 'hidden_by_owner', '-created_at'], name='marketplace_owner_i_bafbcf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalapplication',
+            index=models.Index(fields=['renter', 'hidden_by_renter', '-created_at'], name='marketplace_renter__067bef_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalapplication',
+            index=models.Index(fields=['owner', 'order_type', '-created_at'], name='marketplace_owner_i_746de8_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:26
+
+from django.db import migrations, models
+
+
+# 部分一致検索（icontains = UPPER(col) LIKE UPPER(%q%)）向けのトライグラム索引。
+# PostgreSQL のみ作成し、SQLite などでは何もしない。
+TRGM_COLUMNS = ("tracking_no", "from_name", "to_name")
+
+
+def create_trgm_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    table = apps.get_model("marketplace", "Shipment")._meta.db_table
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for col in TRGM_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS shipment_{col}_trgm '
+            f'ON "{table}" USING gin ((UPPER("{col}"::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trgm_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for col in TRGM_COLUMNS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS shipment_{col}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0019_seller_and_participant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['-created_at', '-id'], name='shipment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['status', '-created_at'], name='shipment_status_created_idx'),
+        ),
+        migrations.RunPython(create_trgm_indexes, drop_trgm_indexes),
+    ]
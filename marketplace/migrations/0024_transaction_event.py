@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0023_media_blob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('renter', '借り手'), ('buyer', '購入者'), ('seller', '出品者')], max_length=10)),
+                ('kind', models.CharField(choices=[('rental', 'レンタル'), ('purchase', '購入'), ('application', 'レンタル申請')], max_length=20)),
+                ('source_id', models.PositiveIntegerField()),
+                ('event', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='marketplace.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-occurred_at', '-id'], name='txevent_user_idx'), models.Index(fields=['user', 'event', '-occurred_at', '-id'], name='txevent_user_event_idx'), models.Index(fields=['kind', 'source_id'], name='txevent_source_idx')],
+            },
+        ),
+    ]
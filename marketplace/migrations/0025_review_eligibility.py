@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_review_eligibility(apps, schema_editor):
+    """既存の完了済み取引（借り手・購入者側。自分の商品は除く）から作る"""
+    ReviewEligibility = apps.get_model("marketplace", "ReviewEligibility")
+    sources = [
+        (apps.get_model("marketplace", "Purchase"), "buyer_id", ["完了", "COMPLETED", "completed"]),
+        (apps.get_model("marketplace", "Rental"), "renter_id", ["完了", "COMPLETED", "completed"]),
+        (apps.get_model("marketplace", "RentalApplication"), "renter_id", ["completed", "COMPLETED"]),
+    ]
+    seen = set()
+    for model, user_field, statuses in sources:
+        rows = (
+            model.objects
+            .filter(status__in=statuses)
+            .exclude(product__owner_id=F(user_field))
+            .values_list(user_field, "product_id", "created_at")
+        )
+        for user_id, product_id, created_at in rows.iterator():
+            if user_id and product_id and (user_id, product_id) not in seen:
+                seen.add((user_id, product_id))
+                ReviewEligibility.objects.get_or_create(
+                    user_id=user_id, product_id=product_id, defaults={"earned_at": created_at},
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0024_transaction_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewEligibility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('earned_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='marketplace.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'product'), name='review_eligibility_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_review_eligibility, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:06
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_favorite_count(apps, schema_editor):
+    Product = apps.get_model("marketplace", "Product")
+    ProductFavorite = apps.get_model("marketplace", "ProductFavorite")
+    counted = (
+        ProductFavorite.objects.filter(product_id=OuterRef("pk"))
+        .order_by().values("product_id").annotate(n=Count("id")).values("n")
+    )
+    Product.objects.update(favorite_count=Coalesce(Subquery(counted), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0026_comment_review_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-favorite_count', '-id'], name='product_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-trending_score', '-id'], name='product_trending_idx'),
+        ),
+        migrations.RunPython(backfill_favorite_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+# 配送管理のキーワード検索は product__title も icontains で見るので、0020 と同じトライグラム索引を商品名にも張る。
+# PostgreSQL のみ作成し、SQLite などでは何もしない。
+
+
+def create_title_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    table = apps.get_model("marketplace", "Product")._meta.db_table
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS product_title_trgm '
+        f'ON "{table}" USING gin ((UPPER("title"::text)) gin_trgm_ops)'
+    )
+
+
+def drop_title_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS product_title_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0027_product_popularity'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_title_trgm_index, drop_title_trgm_index),
+    ]
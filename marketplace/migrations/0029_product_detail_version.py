@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0028_product_title_trgm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='detail_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+
+# 0020 / 0028 のトライグラム索引は PostgreSQL 専用なので、SQLite では FTS5 の trigram トークナイザで
+# 配送（追跡番号・差出人・宛先）と商品名の全文索引を作る。外部コンテンツ表＋トリガで元の表と同期する。
+# FTS5（trigram は SQLite 3.34 以降）が使えない SQLite では何もせず、検索は icontains のままになる。
+SHIPMENT_FTS = "marketplace_shipment_fts"
+PRODUCT_FTS = "marketplace_product_title_fts"
+
+
+def _fts_targets(apps):
+    shipment = apps.get_model("marketplace", "Shipment")._meta.db_table
+    product = apps.get_model("marketplace", "Product")._meta.db_table
+    return [
+        (SHIPMENT_FTS, shipment, ("tracking_no", "from_name", "to_name")),
+        (PRODUCT_FTS, product, ("title",)),
+    ]
+
+
+def _trigram_available(schema_editor):
+    try:
+        schema_editor.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='trigram')")
+    except Exception:
+        return False
+    schema_editor.execute("DROP TABLE temp.fts_probe")
+    return True
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite" or not _trigram_available(schema_editor):
+        return
+    for fts, table, cols in _fts_targets(apps):
+        col_list = ", ".join(cols)
+        new_values = ", ".join(f"new.{c}" for c in cols)
+        old_values = ", ".join(f"old.{c}" for c in cols)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({col_list}, "
+            f"content='{table}', content_rowid='id', tokenize='trigram')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {col_list}) VALUES (new.id, {new_values}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {col_list} ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {fts}(rowid, {col_list}) VALUES (new.id, {new_values}); END"
+        )
+        schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for fts, table, cols in _fts_targets(apps):
+        for suffix in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0029_product_detail_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
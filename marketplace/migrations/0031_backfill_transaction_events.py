@@ -0,0 +1,75 @@
+from django.db import migrations
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Coalesce
+
+
+# 0024 より前からある取引の TransactionEvent を作る（backfill_transaction_events コマンドと同じ規則）。
+# 取引履歴はイベントだけを読むので、手で流し忘れても履歴が空にならないよう migrate で一度作っておく。
+# イベントが1件もない取引だけを対象にするので、コマンドを先に流していても重複しない。
+BATCH_SIZE = 500
+
+# Rental / Purchase の日本語の状態値 → 揃えた状態コード（marketplace.models.transaction_event_code と同じ）
+STATUS_CODES = {
+    "申請中": "requested",
+    "承認済み": "approved",
+    "発送済み": "shipped",
+    "レンタル中": "renting",
+    "返却発送済み": "return_shipped",
+    "返却済み": "returned",
+    "完了": "completed",
+    "キャンセル": "cancelled",
+}
+
+
+def _event_code(kind, status):
+    if kind != "application" and status in STATUS_CODES:
+        return STATUS_CODES[status]
+    return str(status or "").lower()
+
+
+def backfill_events(apps, schema_editor):
+    TransactionEvent = apps.get_model("marketplace", "TransactionEvent")
+    sources = [
+        # 完了日時は旧 profile_history と同じ優先順（完了日 → 返却日/発送日 → 作成日）
+        ("rental", "renter", apps.get_model("marketplace", "Rental").objects.annotate(
+            seller_or_owner=Coalesce("seller_id", "product__owner_id"),
+            done_at=Coalesce("completed_date", "returned_date", "created_at"),
+        ).values_list("id", "product_id", "renter_id", "seller_or_owner", "status", "done_at", "created_at")),
+        ("purchase", "buyer", apps.get_model("marketplace", "Purchase").objects.annotate(
+            done_at=Coalesce("completed_date", "shipped_at", "created_at"),
+        ).values_list("id", "product_id", "buyer_id", "seller_id", "status", "done_at", "created_at")),
+        ("application", "renter", apps.get_model("marketplace", "RentalApplication").objects.annotate(
+            done_at=F("created_at"),
+        ).values_list("id", "product_id", "renter_id", "owner_id", "status", "done_at", "created_at")),
+    ]
+    for kind, client_role, qs in sources:
+        recorded = TransactionEvent.objects.filter(kind=kind, source_id=OuterRef("pk"))
+        events = []
+        rows = qs.filter(~Exists(recorded)).order_by("id")
+        for source_id, product_id, client_id, seller_id, status, done_at, created_at in rows.iterator(chunk_size=BATCH_SIZE):
+            event = _event_code(kind, status)
+            parties = [(client_id, client_role)]
+            if seller_id and seller_id != client_id:
+                parties.append((seller_id, "seller"))
+            events.extend(
+                TransactionEvent(
+                    user_id=user_id, role=role, kind=kind, source_id=source_id, product_id=product_id,
+                    event=event, status=status, occurred_at=done_at if event == "completed" else created_at,
+                )
+                for user_id, role in parties if user_id
+            )
+            if len(events) >= BATCH_SIZE:
+                TransactionEvent.objects.bulk_create(events)
+                events = []
+        TransactionEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0030_sqlite_search_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_events, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,14 @@
 # marketplace/models.py
 
+from collections import defaultdict
+
 from django.conf import settings
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 User = settings.AUTH_USER_MODEL
@@ -14,10 +19,17 @@ class Product(models.Model):
     def __str__(self):
         return self.title
 
+    def _first_image(self):
+        # images を prefetch 済みならキャッシュから取り、追加クエリを出さない
+        cached = getattr(self, "_prefetched_objects_cache", {}).get("images")
+        if cached is not None:
+            return min(cached, key=lambda i: i.pk, default=None)
+        return self.images.order_by("id").first()
+
     @property
     def image_url(self):
         """一覧・詳細で使うメイン画像URL"""
-        first = self.images.first()
+        first = self._first_image()
         if first and first.image:
             try:
                 return first.image.url
@@ -25,6 +37,21 @@ class Product(models.Model):
                 return ""
         return ""
 
+    @property
+    def thumb_url(self):
+        first = self._first_image()
+        return first.thumb_url if first else ""
+
+    @property
+    def card_url(self):
+        first = self._first_image()
+        return first.card_url if first else ""
+
+    @property
+    def detail_url(self):
+        first = self._first_image()
+        return first.detail_url if first else ""
+
     @property
     def available_count(self):
         if self.available_quantity is None:
@@ -77,10 +104,37 @@ class Product(models.Model):
     status = models.IntegerField(choices=Status.choices, default=Status.LISTED)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # 人気順の並び替え用。favorite_count は ProductFavorite の増減で F() 更新、
+    # trending_score は refresh_product_popularity コマンドが定期的に計算し直す
+    favorite_count = models.PositiveIntegerField(default=0)
+    trending_score = models.FloatField(default=0)
+    # 詳細ページのキャッシュ（frontend.views._product_detail_bundle）の版。画像・コメント・レビューが変わると F() で +1
+    detail_version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "-favorite_count", "-id"], name="product_popular_idx"),
+            models.Index(fields=["status", "-trending_score", "-id"], name="product_trending_idx"),
+        ]
+
     def __str__(self):
         return self.title
     
 
+def _fill_seller(instance):
+    """product.owner を seller に写す（product がロード済みなら追加クエリ無し）"""
+    if instance.seller_id or not instance.product_id:
+        return
+    if type(instance).product.is_cached(instance):
+        instance.seller_id = instance.product.owner_id
+    else:
+        instance.seller_id = (
+            Product.objects.filter(pk=instance.product_id)
+            .values_list("owner_id", flat=True)
+            .first()
+        )
+
+
 class ProductFavorite(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="product_favorites")
     product = models.ForeignKey("marketplace.Product", on_delete=models.CASCADE, related_name="favorites")
@@ -94,11 +148,112 @@ class ProductFavorite(models.Model):
         return f"{self.user_id} ♥ {self.product_id}"
 
 
+def refresh_favorite_counts(product_ids=None):
+    """favorite_count を ProductFavorite の実数で数え直す（一括追加・削除の後やずれの補正用）"""
+    qs = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=product_ids)
+    counted = (
+        ProductFavorite.objects.filter(product_id=OuterRef("pk"))
+        .order_by().values("product_id").annotate(n=Count("id")).values("n")
+    )
+    return qs.update(favorite_count=Coalesce(Subquery(counted), 0))
+
+
+def set_favorite(user, product_id, favorited):
+    """お気に入りを指定の状態にする（冪等）。状態が変わったら True。
+    同時に2回来ても get_or_create が一意制約の衝突を吸収するので二重登録にならない"""
+    if favorited:
+        _, created = ProductFavorite.objects.get_or_create(user=user, product_id=product_id)
+        return created
+    deleted, _ = ProductFavorite.objects.filter(user=user, product_id=product_id).delete()
+    return bool(deleted)
+
+
+def apply_favorite_operations(user, operations):
+    """[(product_id, favorited), ...] を1トランザクションでまとめて反映する。同じ商品は後の操作が勝つ。
+    追加は bulk_create(ignore_conflicts=True) の1文で済ませ、シグナルを通らない分の favorite_count は
+    追加した商品だけまとめて数え直す。削除は通常の delete() なので、favorite_count は post_delete の
+    _uncount_favorite が1行ずつ減らす（件数は FAVORITE_BATCH_LIMIT まで）。
+    戻り値は {product_id: favorited}（存在しない商品は含まない）"""
+    wanted = dict(operations)
+    with transaction.atomic():
+        known = set(Product.objects.filter(pk__in=wanted).values_list("pk", flat=True))
+        adds = [pid for pid in known if wanted[pid]]
+        removes = [pid for pid in known if not wanted[pid]]
+        if adds:
+            ProductFavorite.objects.bulk_create(
+                [ProductFavorite(user=user, product_id=pid) for pid in adds],
+                ignore_conflicts=True,
+            )
+            refresh_favorite_counts(adds)
+        if removes:
+            ProductFavorite.objects.filter(user=user, product_id__in=removes).delete()
+    return {pid: wanted[pid] for pid in known}
+
+
+@receiver(post_save, sender=ProductFavorite)
+def _count_favorite(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Product.objects.filter(pk=instance.product_id).update(favorite_count=F("favorite_count") + 1)
+
+
+@receiver(post_delete, sender=ProductFavorite)
+def _uncount_favorite(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id, favorite_count__gt=0).update(
+        favorite_count=F("favorite_count") - 1
+    )
+
+
 
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="images")
     image = models.ImageField(upload_to="products/")
+    # 向き補正後の原本サイズと、サイズ別画像（marketplace/images.py で生成）
+    # renditions: {"source": 原本名, "thumb": {"jpeg": パス, "webp": パス, "width": .., "height": ..}, ...}
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    renditions = models.JSONField(default=dict, blank=True)
+
+    def rendition(self, name):
+        spec = (self.renditions or {}).get(name)
+        return spec if isinstance(spec, dict) else None
+
+    def rendition_url(self, name, fmt="jpeg"):
+        """サイズ別画像の URL。未生成なら原本の URL を返す"""
+        spec = self.rendition(name)
+        if spec and spec.get(fmt):
+            from django.core.files.storage import default_storage
+            return default_storage.url(spec[fmt])
+        try:
+            return self.image.url if self.image else ""
+        except Exception:
+            return ""
+
+    @property
+    def thumb_url(self):
+        return self.rendition_url("thumb")
+
+    @property
+    def card_url(self):
+        return self.rendition_url("card")
+
+    @property
+    def detail_url(self):
+        return self.rendition_url("detail")
+
+
+@receiver(post_save, sender=ProductImage)
+def build_product_image_renditions(sender, instance, raw=False, update_fields=None, **kwargs):
+    """原本が変わったとき（新規・差し替え）だけサイズ別画像を作る"""
+    if raw or not instance.image:
+        return
+    if update_fields is not None and "image" not in update_fields:
+        return
+    if (instance.renditions or {}).get("source") == instance.image.name:
+        return
+    from marketplace.images import process_on_upload, process_product_image
+    if process_on_upload():
+        process_product_image(instance)
 
 
 class ProductComment(models.Model):
@@ -110,6 +265,9 @@ class ProductComment(models.Model):
 
     class Meta:
         ordering = ("created_at",)
+        indexes = [
+            models.Index(fields=["product", "-created_at", "-id"], name="comment_product_created_idx"),
+        ]
 
 
 class Rental(models.Model):
@@ -137,6 +295,15 @@ class Rental(models.Model):
         related_name="rentals",
     )
 
+    # 貸し手（product.owner の冗長コピー。出品者側一覧で product を JOIN しないため）
+    seller = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="received_rentals",
+    )
+
     renter_email = models.EmailField(null=True, blank=True)
     owner_email  = models.EmailField(null=True, blank=True)
     product_title = models.CharField(max_length=255, null=True, blank=True)
@@ -185,6 +352,16 @@ class Rental(models.Model):
     # 支払い方法（クレカ / 現地払い とか）
     payment_method = models.CharField(max_length=50, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["renter", "-id"]),
+            models.Index(fields=["seller", "-id"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        _fill_seller(self)
+        super().save(*args, **kwargs)
+
     # 便利プロパティ（今後も "rental.xxx" で触りやすくする用）
 
     @property
@@ -195,6 +372,26 @@ class Rental(models.Model):
     def __str__(self):
         return f"{self.product_title} - {self.renter_email}"
 
+class PurchaseManager(models.Manager):
+    """Purchase の作成窓口。取得済みの product / buyer から冗長カラムを埋める"""
+
+    def build(self, product, buyer, **fields):
+        purchase = self.model(product=product, buyer=buyer, **fields)
+        purchase.fill_snapshot(product=product, buyer=buyer)
+        return purchase
+
+    def create_for(self, product, buyer, **fields):
+        purchase = self.build(product, buyer, **fields)
+        purchase.save(force_insert=True, using=self.db)
+        return purchase
+
+    def bulk_create_for(self, rows, batch_size=500):
+        """rows: (product, buyer, fields) の並び。product は owner を select_related 済みで渡すこと。
+        bulk_create のため post_save（チャットルーム作成）は発火しない。"""
+        objs = [self.build(product, buyer, **fields) for product, buyer, fields in rows]
+        return self.bulk_create(objs, batch_size=batch_size)
+
+
 class Purchase(models.Model):
     class Status(models.TextChoices):
         REQUESTED  = "申請中",  "申請中"
@@ -205,6 +402,8 @@ class Purchase(models.Model):
 
     product = models.ForeignKey("marketplace.Product", on_delete=models.CASCADE, related_name="purchases")
     buyer   = models.ForeignKey(User, on_delete=models.CASCADE, related_name="purchases")
+    # 出品者（product.owner の冗長コピー。出品者側一覧で product を JOIN しないため）
+    seller  = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name="received_purchases")
 
     # 参照を減らすための冗長カラム（テンプレの表示用）
     product_title  = models.CharField(max_length=255, blank=True)
@@ -248,12 +447,16 @@ class Purchase(models.Model):
     return_shipped_at   = models.DateTimeField(null=True, blank=True)
     return_received_at  = models.DateTimeField(null=True, blank=True)
 
+    objects = PurchaseManager()
+
     class Meta:
         ordering = ("-created_at",)
         indexes = [
             models.Index(fields=["status"]),
             models.Index(fields=["buyer_email"]),
             models.Index(fields=["seller_email"]),
+            models.Index(fields=["buyer", "hidden_by_buyer", "-id"]),
+            models.Index(fields=["seller", "hidden_by_seller", "-id"]),
         ]
 
     def __str__(self):
@@ -264,17 +467,28 @@ class Purchase(models.Model):
         # テンプレ側で created_date を参照しても落ちないようにする
         return self.created_at
 
-    def save(self, *args, **kwargs):
-        # 表示用の冗長カラムを自動補完
-        if self.product_id and not self.product_title:
-            self.product_title = getattr(self.product, "title", "") or ""
-        if self.product_id and not self.seller_email:
-            owner = getattr(self.product, "owner", None)
-            self.seller_email = getattr(owner, "email", "") if owner else ""
+    def fill_snapshot(self, product=None, buyer=None):
+        """表示用の冗長カラムを補完する。
+        product / buyer を渡せばそれを使い、未指定なら空欄があるときだけ関連を読む。"""
+        if self.product_id and (not self.product_title or not self.seller_email or not self.seller_id):
+            product = product or self.product
+            owner = getattr(product, "owner", None)
+            if not self.product_title:
+                self.product_title = getattr(product, "title", "") or ""
+            if not self.seller_email:
+                self.seller_email = getattr(owner, "email", "") if owner else ""
+            if not self.seller_id:
+                self.seller_id = getattr(product, "owner_id", None)
         if self.buyer_id and not self.buyer_email:
-            self.buyer_email = getattr(self.buyer, "email", "") or ""
+            buyer = buyer or self.buyer
+            self.buyer_email = getattr(buyer, "email", "") or ""
         if self.purchase_price is None:
             self.purchase_price = 0
+
+    def save(self, *args, **kwargs):
+        # update_fields 指定の部分更新では冗長カラムに触らない
+        if kwargs.get("update_fields") is None:
+            self.fill_snapshot()
         super().save(*args, **kwargs)
 
 
@@ -285,6 +499,33 @@ class Review(models.Model):
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["product", "-created_at", "-id"], name="review_product_created_idx"),
+        ]
+
+
+class ReviewEligibility(models.Model):
+    """レビューを書ける (ユーザー, 商品)。借り手・購入者として取引が完了した時点で作る
+    （record_transaction_events 参照）。判定はこの1行の有無だけで済む。"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    earned_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="review_eligibility_uniq"),
+        ]
+
+    def __str__(self):
+        return f"user={self.user_id} product={self.product_id}"
+
+    @classmethod
+    def allows(cls, user, product):
+        if not user or not product or not getattr(user, "id", None):
+            return False
+        return cls.objects.filter(user_id=user.id, product_id=product.id).exists()
+
 # --- RentalApplication（申請）モデル ここから追記 -------------------------
 
 class RentalApplication(models.Model):
@@ -345,6 +586,11 @@ class RentalApplication(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=["owner", "hidden_by_owner", "-created_at"]),
+            models.Index(fields=["renter", "hidden_by_renter", "-created_at"]),
+            models.Index(fields=["owner", "order_type", "-created_at"]),
+        ]
 
     def __str__(self):
         return f'{self.get_order_type_display()}申請: product={self.product_id}, by={self.renter_id}'
@@ -410,6 +656,9 @@ class Shipment(models.Model):
     to_address = models.CharField(max_length=255, blank=True, default="")
 
     tracking_no = models.CharField(max_length=100, blank=True, default="")
+    # 追跡ポーリング用: 配送会社（SHIPMENT_CARRIERS のキー。空なら "default"）と最終照会時刻
+    carrier = models.CharField(max_length=30, blank=True, default="")
+    tracking_checked_at = models.DateTimeField(null=True, blank=True)
     is_platform_intermediated = models.BooleanField(default=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
@@ -425,6 +674,10 @@ class Shipment(models.Model):
             models.Index(fields=["rental"]),
             models.Index(fields=["purchase"]),
             models.Index(fields=["application"]),  # ★追加
+            # 配送管理コンソール: 作成日の新しい順 + 状態での絞り込み
+            models.Index(fields=["-created_at", "-id"], name="shipment_created_idx"),
+            models.Index(fields=["status", "-created_at"], name="shipment_status_created_idx"),
+            models.Index(fields=["status", "tracking_checked_at"], name="shipment_poll_idx"),
         ]
         constraints = [
             # ★同じ取引(= rental/purchase/application) + direction は1件に固定
@@ -578,3 +831,425 @@ def _create_chat_for_application(sender, instance, created, **kwargs):
     )
 
 
+
+
+# ========= レンタル中フラグ（accounts.Profile.has_active_rental） =========
+
+def _is_active_rental(instance):
+    if isinstance(instance, Rental):
+        return instance.status == Rental.Status.RENTING
+    return (
+        instance.order_type == RentalApplication.OrderType.RENTAL
+        and str(instance.status or "").lower() == "renting"
+    )
+
+
+def active_rental_user_ids(user_ids):
+    """user_ids のうち、レンタル中の取引（Rental / RentalApplication）を持つユーザー"""
+    user_ids = {u for u in user_ids if u}
+    if not user_ids:
+        return set()
+    active = set(
+        Rental.objects
+        .filter(renter_id__in=user_ids, status=Rental.Status.RENTING)
+        .values_list("renter_id", flat=True)
+    )
+    active |= set(
+        RentalApplication.objects
+        .filter(renter_id__in=user_ids, order_type=RentalApplication.OrderType.RENTAL, status__iexact="renting")
+        .values_list("renter_id", flat=True)
+    )
+    return active
+
+
+def refresh_active_rental(user_ids):
+    """Profile.has_active_rental を取引の状態から付け直す。
+    queryset.update() で状態を変えたとき（シグナルが飛ばない）は呼び出し側でこれを呼ぶ。"""
+    from accounts.models import Profile
+
+    user_ids = {u for u in user_ids if u}
+    if not user_ids:
+        return
+    active = active_rental_user_ids(user_ids)
+    Profile.objects.filter(user_id__in=active, has_active_rental=False).update(has_active_rental=True)
+    Profile.objects.filter(user_id__in=user_ids - active, has_active_rental=True).update(has_active_rental=False)
+
+
+@receiver(post_init, sender=Rental)
+@receiver(post_init, sender=RentalApplication)
+def _remember_rental_state(sender, instance, **kwargs):
+    if not instance.pk:
+        instance._was_active_rental = (None, False)
+    elif {"renter_id", "status", "order_type"} & instance.get_deferred_fields():
+        instance._was_active_rental = None  # only() 等で読んでいない（ここで読むとクエリになる）
+    else:
+        instance._was_active_rental = (instance.renter_id, _is_active_rental(instance))
+
+
+@receiver(post_save, sender=Rental)
+@receiver(post_save, sender=RentalApplication)
+def _sync_active_rental_flag(sender, instance, raw=False, **kwargs):
+    """レンタル中になった / レンタル中でなくなったときだけ借り手のフラグを直す"""
+    if raw:
+        return
+    before = getattr(instance, "_was_active_rental", None)
+    now = (instance.renter_id, _is_active_rental(instance))
+    instance._was_active_rental = now
+    if before is None:
+        refresh_active_rental({now[0]})
+    elif before[1] != now[1] or (now[1] and before[0] != now[0]):
+        refresh_active_rental({before[0], now[0]})
+
+
+@receiver(post_delete, sender=Rental)
+@receiver(post_delete, sender=RentalApplication)
+def _clear_active_rental_flag(sender, instance, **kwargs):
+    if _is_active_rental(instance):
+        refresh_active_rental({instance.renter_id})
+
+
+# ========= 取引イベント（履歴・アクティビティの時系列） =========
+
+class TransactionEvent(models.Model):
+    """取引の状態遷移1回分を当事者ごとに1行ずつ積む（追記のみ・更新しない）。
+    履歴タブなどは元の Rental / Purchase / RentalApplication を集めず、これを user ごとに引く。"""
+
+    class Kind(models.TextChoices):
+        RENTAL      = "rental",      "レンタル"
+        PURCHASE    = "purchase",    "購入"
+        APPLICATION = "application", "レンタル申請"
+
+    class Role(models.TextChoices):
+        RENTER = "renter", "借り手"
+        BUYER  = "buyer",  "購入者"
+        SELLER = "seller", "出品者"
+
+    COMPLETED = "completed"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="transaction_events")
+    role = models.CharField(max_length=10, choices=Role.choices)
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    source_id = models.PositiveIntegerField()
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    # event は種類をまたいで揃えた状態コード（renting / completed など）、status は元の値そのまま
+    event = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    occurred_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-occurred_at", "-id"], name="txevent_user_idx"),
+            models.Index(fields=["user", "event", "-occurred_at", "-id"], name="txevent_user_event_idx"),
+            models.Index(fields=["kind", "source_id"], name="txevent_source_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}#{self.source_id} {self.event} (user={self.user_id})"
+
+    @property
+    def reviewable(self):
+        return self.role in (self.Role.RENTER, self.Role.BUYER)
+
+
+_TX_KINDS = {
+    Rental: TransactionEvent.Kind.RENTAL,
+    Purchase: TransactionEvent.Kind.PURCHASE,
+    RentalApplication: TransactionEvent.Kind.APPLICATION,
+}
+
+
+def transaction_event_code(kind, status):
+    """Rental / Purchase の日本語の状態値を RentalApplication と同じ英字コードに揃える"""
+    model = {TransactionEvent.Kind.RENTAL: Rental, TransactionEvent.Kind.PURCHASE: Purchase}.get(kind)
+    if model is not None:
+        for member in model.Status:
+            if member.value == status:
+                return "cancelled" if member.name == "CANCELED" else member.name.lower()
+    return str(status or "").lower()
+
+
+def _transaction_parties(kind, client_id, seller_id):
+    client_role = TransactionEvent.Role.BUYER if kind == TransactionEvent.Kind.PURCHASE else TransactionEvent.Role.RENTER
+    parties = [(client_id, client_role)]
+    if seller_id and seller_id != client_id:
+        parties.append((seller_id, TransactionEvent.Role.SELLER))
+    return [(u, r) for u, r in parties if u]
+
+
+def build_transaction_events(kind, rows, status, occurred_at):
+    """rows: (取引id, 商品id, 借り手/購入者id, 出品者id) の並び。当事者ごとの未保存の TransactionEvent を返す"""
+    event = transaction_event_code(kind, status)
+    return [
+        TransactionEvent(
+            user_id=user_id, role=role, kind=kind, source_id=source_id, product_id=product_id,
+            event=event, status=status, occurred_at=occurred_at,
+        )
+        for source_id, product_id, client_id, seller_id in rows
+        for user_id, role in _transaction_parties(kind, client_id, seller_id)
+    ]
+
+
+def record_transaction_events(kind, rows, status, occurred_at=None):
+    """queryset.update() で状態を変えたとき（シグナルが飛ばない）は呼び出し側でこれを呼ぶ"""
+    events = build_transaction_events(kind, rows, status, occurred_at or timezone.now())
+    if events:
+        TransactionEvent.objects.bulk_create(events, batch_size=500)
+        grant_review_eligibility(events)
+        count_seller_completions(events)
+    return events
+
+
+def grant_review_eligibility(events):
+    """借り手・購入者として完了したイベントから ReviewEligibility を作る（既にあれば何もしない）"""
+    grants = [
+        ReviewEligibility(user_id=ev.user_id, product_id=ev.product_id, earned_at=ev.occurred_at)
+        for ev in events
+        if ev.event == TransactionEvent.COMPLETED and ev.reviewable and ev.product_id
+    ]
+    if grants:
+        ReviewEligibility.objects.bulk_create(grants, batch_size=500, ignore_conflicts=True)
+
+
+def count_seller_completions(events):
+    """出品者側の完了イベントを Profile.completed_rentals / completed_purchases に足す"""
+    counts = defaultdict(int)
+    for ev in events:
+        if ev.event == TransactionEvent.COMPLETED and ev.role == TransactionEvent.Role.SELLER:
+            field = "completed_purchases" if ev.kind == TransactionEvent.Kind.PURCHASE else "completed_rentals"
+            counts[(ev.user_id, field)] += 1
+    for (user_id, field), n in counts.items():
+        _bump_profile(user_id, **{field: n})
+
+
+def _bump_profile(user_id, **deltas):
+    from accounts.models import Profile
+
+    deltas = {k: v for k, v in deltas.items() if v}
+    if user_id and deltas:
+        # 集計列は PositiveIntegerField。ずれていても減算で負にならないよう 0 で止める
+        Profile.objects.filter(user_id=user_id).update(
+            **{k: Greatest(F(k) + v, 0) if v < 0 else F(k) + v for k, v in deltas.items()}
+        )
+
+
+def _transaction_row(instance):
+    if isinstance(instance, Rental):
+        seller_id = instance.seller_id
+        if not seller_id and instance.product_id:
+            seller_id = Product.objects.filter(pk=instance.product_id).values_list("owner_id", flat=True).first()
+        return instance.pk, instance.product_id, instance.renter_id, seller_id
+    if isinstance(instance, Purchase):
+        return instance.pk, instance.product_id, instance.buyer_id, instance.seller_id
+    return instance.pk, instance.product_id, instance.renter_id, instance.owner_id
+
+
+@receiver(post_init, sender=Rental)
+@receiver(post_init, sender=Purchase)
+@receiver(post_init, sender=RentalApplication)
+def _remember_transaction_status(sender, instance, **kwargs):
+    if not instance.pk:
+        instance._tx_status = None
+    elif "status" in instance.get_deferred_fields():
+        instance._tx_status = False  # 読んでいないので比較できない（保存時に DB の値と比べる）
+    else:
+        instance._tx_status = instance.status
+
+
+@receiver(post_save, sender=Rental)
+@receiver(post_save, sender=Purchase)
+@receiver(post_save, sender=RentalApplication)
+def _record_transaction_transition(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """新規作成と状態の変化を TransactionEvent に積む"""
+    if raw:
+        return
+    before = getattr(instance, "_tx_status", None)
+    if not created and update_fields is not None and "status" not in update_fields:
+        return
+    if not created and before is False:
+        last = (
+            TransactionEvent.objects
+            .filter(kind=_TX_KINDS[sender], source_id=instance.pk)
+            .order_by("-occurred_at", "-id").values_list("status", flat=True).first()
+        )
+        before = last
+    instance._tx_status = instance.status
+    if not created and before == instance.status:
+        return
+    record_transaction_events(_TX_KINDS[sender], [_transaction_row(instance)], instance.status)
+
+
+
+# ========= 出品者の評価（accounts.Profile.review_count / rating_sum） =========
+
+def _product_owner_id(product_id, review=None):
+    """商品の出品者。review が同じ商品を読み込み済みなら（Review.objects.create(product=...) など）クエリを出さない"""
+    if review is not None and review.product_id == product_id and Review.product.is_cached(review):
+        return review.product.owner_id
+    return Product.objects.filter(pk=product_id).values_list("owner_id", flat=True).first() if product_id else None
+
+
+@receiver(post_init, sender=Review)
+def _remember_review_rating(sender, instance, **kwargs):
+    if instance.pk and not {"product_id", "rating"} & instance.get_deferred_fields():
+        instance._counted = (instance.product_id, instance.rating)
+    else:
+        instance._counted = None
+
+
+@receiver(post_save, sender=Review)
+def _count_review(sender, instance, created, raw=False, **kwargs):
+    """レビューの追加・評価の変更を出品者の集計に反映する（全商品を集計し直さない）"""
+    if raw:
+        return
+    before = getattr(instance, "_counted", None)
+    now = (instance.product_id, instance.rating or 0)
+    instance._counted = now
+    if created:
+        _bump_profile(_product_owner_id(now[0], instance), review_count=1, rating_sum=now[1])
+    elif before is not None and before != now:
+        if before[0] == now[0]:
+            _bump_profile(_product_owner_id(now[0], instance), rating_sum=now[1] - (before[1] or 0))
+        else:
+            _bump_profile(_product_owner_id(before[0]), review_count=-1, rating_sum=-(before[1] or 0))
+            _bump_profile(_product_owner_id(now[0], instance), review_count=1, rating_sum=now[1])
+
+
+@receiver(post_delete, sender=Review)
+def _uncount_review(sender, instance, **kwargs):
+    _bump_profile(_product_owner_id(instance.product_id, instance), review_count=-1, rating_sum=-(instance.rating or 0))
+
+
+
+# ========= 商品詳細キャッシュの版 =========
+# 詳細ページのまとめ（画像・コメント / レビューの1ページ目・評価集計）は Product.detail_version 入りのキーで
+# キャッシュする（frontend.views._product_detail_bundle）。版は DB の列なので、キャッシュがプロセスごとの
+# LocMem でも全ワーカーが同じ版を見る。中身が変わったら版を上げるだけで古いキーは参照されなくなり、期限切れで消える。
+
+def bump_product_detail_version(*product_ids):
+    product_ids = [pk for pk in product_ids if pk]
+    if product_ids:
+        Product.objects.filter(pk__in=product_ids).update(detail_version=F("detail_version") + 1)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductComment)
+@receiver(post_delete, sender=ProductComment)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def _invalidate_product_detail(sender, instance, raw=False, **kwargs):
+    """product_edit の画像差し替え、コメント投稿 / 削除、review_create などはすべてここを通る"""
+    if raw:
+        return
+    bump_product_detail_version(instance.product_id)
+
+
+@receiver(post_init, sender="accounts.Profile")
+def _remember_display_name(sender, instance, **kwargs):
+    if "display_name" not in instance.get_deferred_fields():
+        instance._original_display_name = instance.display_name
+
+
+@receiver(post_save, sender="accounts.Profile")
+def _invalidate_author_details(sender, instance, created, raw=False, **kwargs):
+    """コメント / レビューの投稿者名は表示名で出すので、表示名が変わったら書いた商品の版を上げる"""
+    if raw or created:
+        return
+    before = instance.__dict__.get("_original_display_name", instance.display_name)
+    instance._original_display_name = instance.display_name
+    if before == instance.display_name:
+        return
+    written = (
+        Q(pk__in=ProductComment.objects.filter(user_id=instance.user_id).values("product_id"))
+        | Q(pk__in=Review.objects.filter(user_id=instance.user_id).values("product_id"))
+    )
+    Product.objects.filter(written).update(detail_version=F("detail_version") + 1)
+
+# ========= メディアファイルの参照数（mura_share.storage.ContentAddressedStorage） =========
+
+class MediaBlob(models.Model):
+    """内容ハッシュ名で保存したファイル1つ分。ref_count が 0 のものは gc_media で削除される"""
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["ref_count", "created_at"])]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+_FILE_FIELDS = {}
+
+
+def _counted_file_fields(model):
+    """参照数を数えるストレージを使う FileField / ImageField の一覧（モデルごとにキャッシュ）"""
+    if model not in _FILE_FIELDS:
+        from mura_share.storage import ContentAddressedStorage
+        _FILE_FIELDS[model] = [
+            f for f in model._meta.concrete_fields
+            if isinstance(f, models.FileField) and isinstance(f.storage, ContentAddressedStorage)
+        ]
+    return _FILE_FIELDS[model]
+
+
+def _remember_stored_files(sender, instance, **kwargs):
+    """読み込んだ時点のファイル名を覚えておく。
+    ここから下のファイル参照数のレシーバは、MarketplaceConfig.ready で対象モデルにだけ接続する。
+    遅延読み込み（defer / only）の列は __dict__ に無いので覚えない"""
+    instance._stored_files = {
+        f.attname: instance.__dict__[f.attname]
+        for f in _counted_file_fields(sender) if f.attname in instance.__dict__
+    }
+
+
+def _file_name(value):
+    return getattr(value, "name", value) or ""
+
+
+def _remember_replaced_files(sender, instance, raw=False, update_fields=None, **kwargs):
+    """ファイルの差し替え（product_edit など）を検知し、保存後に古いファイルを手放す。
+    読み込み時（または前回の保存時）の名前と比べるので、ファイルが変わっていなければクエリは出さない"""
+    fields = _counted_file_fields(sender)
+    if raw or not fields:
+        return
+    fields = [f for f in fields if update_fields is None or f.name in update_fields]
+    if not fields:
+        return
+    stored = instance.__dict__.setdefault("_stored_files", {})
+    # 新しく割り当てたファイルはここで保存して、確定した名前で比べる（FileField.pre_save と同じ処理。保存時は2回目なので何もしない）
+    current = {f.attname: f.pre_save(instance, instance.pk is None).name for f in fields}
+    if instance.pk is not None:
+        replaced = [
+            (f, _file_name(stored[f.attname])) for f in fields
+            if f.attname in stored and _file_name(stored[f.attname]) not in ("", current[f.attname])
+        ]
+        unknown = [f for f in fields if f.attname not in stored]
+        if unknown:
+            # 読み込み時の名前が分からない列（defer した列など）だけ DB から引く
+            old = sender._default_manager.filter(pk=instance.pk).values(*[f.attname for f in unknown]).first() or {}
+            replaced += [
+                (f, old[f.attname]) for f in unknown
+                if old.get(f.attname) and old[f.attname] != current[f.attname]
+            ]
+        # post_save の中で同じインスタンスを保存し直すこともあるので、上書きせずに足していく
+        instance.__dict__.setdefault("_replaced_files", []).extend(replaced)
+    stored.update(current)
+
+
+def _release_replaced_files(sender, instance, **kwargs):
+    for field, name in instance.__dict__.pop("_replaced_files", []):
+        field.storage.delete(name)
+
+
+def _release_deleted_files(sender, instance, **kwargs):
+    for field in _counted_file_fields(sender):
+        name = getattr(instance, field.attname).name
+        if name:
+            field.storage.delete(name)
+    if sender is ProductImage and instance.renditions:
+        from marketplace.images import delete_renditions
+        delete_renditions(instance.renditions)
@@ -9,12 +9,19 @@ class ProductImageSerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     owner = serializers.StringRelatedField(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
+    seller_reputation = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = ["id", "title", "description", "category",
                   "price_per_day", "price_buy", "status",
-                  "owner", "images", "created_at"]
+                  "owner", "images", "seller_reputation", "favorite_count", "created_at"]
+        read_only_fields = ["favorite_count"]
+
+    def get_seller_reputation(self, obj):
+        # 集計済みの Profile の列を読むだけ（queryset 側で owner__profile を select_related しておく）
+        profile = getattr(obj.owner, "profile", None) if obj.owner_id else None
+        return profile.reputation() if profile else None
 
 class RentalSerializer(serializers.ModelSerializer):
     renter = serializers.StringRelatedField(read_only=True)
@@ -41,3 +48,19 @@ class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = ["id","product","user","rating","comment","created_at"]
+
+FAVORITE_BATCH_LIMIT = 500
+
+
+class FavoriteOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=["add", "remove"])
+    product = serializers.IntegerField(min_value=1)
+
+
+class FavoriteBatchSerializer(serializers.Serializer):
+    operations = FavoriteOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, value):
+        if len(value) > FAVORITE_BATCH_LIMIT:
+            raise serializers.ValidationError(f"一度に送れる操作は {FAVORITE_BATCH_LIMIT} 件までです。")
+        return value
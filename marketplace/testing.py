@@ -0,0 +1,48 @@
+"""各アプリのテストで共通に使う土台（出品者・借り手・商品と、取引ごとの配送）"""
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import Profile
+from marketplace.models import Product, Rental, Shipment
+
+User = get_user_model()
+
+
+class MarketplaceTestCase(TestCase):
+    """出品者（seller）・借り手（buyer）と商品（product）を1つずつ用意する"""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.buyer = User.objects.create_user("buyer", "b@example.com", "pw")
+        Profile.objects.filter(user=self.seller).update(address="Tokyo", display_name="Seller")
+        self.product = Product.objects.create(
+            owner=self.seller, title="Cam", category="その他", price_per_day=100, price_buy=5000,
+        )
+        self.today = timezone.localdate()
+
+    def make_rental(self, **kwargs):
+        values = {
+            "product": self.product,
+            "renter": self.buyer,
+            "start_date": self.today,
+            "end_date": self.today + datetime.timedelta(days=2),
+            "status": Rental.Status.REQUESTED,
+        }
+        values.update(kwargs)
+        return Rental.objects.create(**values)
+
+    def make_shipment(self, **kwargs):
+        """配送中（IN_TRANSIT）の往路の配送。rental を渡さなければ発送済みのレンタルを作って紐づける"""
+        values = {
+            "kind": Shipment.Kind.RENTAL,
+            "direction": Shipment.Direction.OUTBOUND,
+            "status": Shipment.Status.IN_TRANSIT,
+            "product": self.product,
+        }
+        values.update(kwargs)
+        if "rental" not in values:
+            values["rental"] = self.make_rental(status=Rental.Status.SHIPPED)
+        return Shipment.objects.create(**values)
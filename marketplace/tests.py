@@ -1,3 +1,406 @@
-from django.test import TestCase
+import datetime
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from accounts.models import Profile
+from marketplace.models import (
+    MediaBlob, Product, ProductFavorite, ProductImage, Purchase, Rental, Review, ReviewEligibility, Shipment,
+    TransactionEvent, apply_favorite_operations,
+)
+from marketplace.testing import MarketplaceTestCase
+from marketplace.tracking import CarrierAdapter, FileCarrierAdapter, RateLimiter, poll_shipments
+from marketplace.utils import apply_status_rows, iter_status_rows
+
+User = get_user_model()
+
+
+class PurchaseFactoryTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.select_related("owner").get(pk=self.product.pk)
+
+    def test_build_fills_snapshot_from_given_objects(self):
+        with self.assertNumQueries(0):
+            purchase = Purchase.objects.build(self.product, self.buyer, purchase_price=5000)
+        self.assertEqual(
+            (purchase.product_title, purchase.seller_email, purchase.buyer_email, purchase.seller_id),
+            ("Cam", "s@example.com", "b@example.com", self.seller.pk),
+        )
+
+    def test_bulk_create_for_fills_every_row(self):
+        other = User.objects.create_user("other", "o@example.com", "pw")
+        Purchase.objects.bulk_create_for([(self.product, self.buyer, {}), (self.product, other, {"quantity": 2})])
+        rows = Purchase.objects.order_by("buyer_email").values_list("buyer_email", "seller_email", "product_title", "quantity")
+        self.assertEqual(list(rows), [("b@example.com", "s@example.com", "Cam", 1), ("o@example.com", "s@example.com", "Cam", 2)])
+
+    def test_partial_save_leaves_snapshot_alone(self):
+        purchase = Purchase.objects.create_for(self.product, self.buyer)
+        purchase = Purchase.objects.get(pk=purchase.pk)
+        purchase.product_title = ""
+        purchase.save(update_fields=["product_title"])
+        self.assertEqual(Purchase.objects.get(pk=purchase.pk).product_title, "")
+        purchase.save()
+        self.assertEqual(Purchase.objects.get(pk=purchase.pk).product_title, "Cam")
+
+
+class StatusImportTests(MarketplaceTestCase):
+    def test_csv_rows_are_matched_by_tracking_number(self):
+        shipped = self.make_shipment(tracking_no="TN-1")
+        unchanged = self.make_shipment(tracking_no="TN-2")
+        stream = io.StringIO(
+            "tracking_number,status\n"
+            "TN-1,配達完了\n"
+            "TN-2,in_transit\n"
+            "TN-404,delivered\n"
+            ",delivered\n"
+            "TN-2,lost\n"
+        )
+        report = apply_status_rows(iter_status_rows(stream))
+
+        self.assertEqual(report["rows"], 5)
+        self.assertEqual((report["matched"], report["updated"], report["unchanged"]), (2, 1, 1))
+        self.assertEqual(report["unknown"], ["TN-404"])
+        self.assertEqual(report["invalid"], [5, 6])
+        self.assertEqual(report["transitions"]["rental"], 1)
+        shipped.refresh_from_db()
+        unchanged.refresh_from_db()
+        self.assertEqual(shipped.status, Shipment.Status.DELIVERED)
+        self.assertEqual(unchanged.status, Shipment.Status.IN_TRANSIT)
+
+    def test_jsonl_bad_lines_are_reported(self):
+        s = self.make_shipment(tracking_no="TN-1")
+        stream = io.StringIO('{"tracking_no": "TN-1", "status": "delivered"}\n\nnot json\n["TN-1"]\n42\n')
+        report = apply_status_rows(iter_status_rows(stream, "jsonl"), dry_run=True)
+        self.assertEqual(report["invalid"], [3, 4, 5])
+        self.assertEqual(report["updated"], 1)
+        s.refresh_from_db()
+        self.assertEqual(s.status, Shipment.Status.IN_TRANSIT)
+
+    def test_batches_share_one_report(self):
+        for i in range(5):
+            self.make_shipment(tracking_no=f"TN-{i}")
+        rows = [(i, f"TN-{i}", "delivered") for i in range(5)]
+        report = apply_status_rows(rows, batch_size=2)
+        self.assertEqual((report["rows"], report["updated"]), (5, 5))
+
+    def test_error_in_a_later_batch_rolls_back_earlier_batches(self):
+        s = self.make_shipment(tracking_no="TN-1")
+
+        def rows():
+            yield 2, "TN-1", "delivered"
+            for lineno in range(3, 603):
+                yield lineno, f"TN-X{lineno}", "delivered"
+            raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+        with self.assertRaises(UnicodeDecodeError):
+            apply_status_rows(rows())
+        s.refresh_from_db()
+        self.assertEqual(s.status, Shipment.Status.IN_TRANSIT)
+
+
+class TrackingPollTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        fd, self.path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"TN-1": "delivered", "TN-2": "配達完了"}, f)
+        self.addCleanup(os.remove, self.path)
+        self.carriers = {"default": (FileCarrierAdapter(self.path), RateLimiter(0))}
+
+    def test_carrier_adapter_requires_fetch(self):
+        with self.assertRaises(TypeError):
+            CarrierAdapter()
+
+    def test_file_adapter_normalizes_statuses(self):
+        adapter = FileCarrierAdapter(self.path)
+        self.assertEqual(adapter.fetch("TN-1"), Shipment.Status.DELIVERED)
+        self.assertEqual(adapter.fetch("TN-2"), Shipment.Status.DELIVERED)
+        self.assertEqual(adapter.fetch("missing"), "")
+
+    def test_poll_updates_only_polled_shipments(self):
+        polled = self.make_shipment(tracking_no="TN-1")
+        # 同じ追跡番号でも、照会していない配送（別の配送会社・作成済み）は書き換えない
+        other_carrier = self.make_shipment(tracking_no="TN-1", carrier="other")
+        not_in_transit = self.make_shipment(tracking_no="TN-1", status=Shipment.Status.CREATED)
+
+        report = poll_shipments(self.carriers, workers=2)
+
+        self.assertEqual(report["polled"], 1)
+        self.assertEqual(report["no_carrier"], 1)
+        self.assertEqual(report["updated"], 1)
+        polled.refresh_from_db()
+        self.assertEqual(polled.status, Shipment.Status.DELIVERED)
+        self.assertIsNotNone(polled.tracking_checked_at)
+        self.assertEqual(Rental.objects.get(pk=polled.rental_id).status, Rental.Status.RENTING)
+        for s in (other_carrier, not_in_transit):
+            before = s.status
+            s.refresh_from_db()
+            self.assertEqual(s.status, before)
+
+    def test_dry_run_and_unanswered(self):
+        s = self.make_shipment(tracking_no="TN-unknown")
+        report = poll_shipments(self.carriers, dry_run=True)
+        self.assertEqual(report["no_answer"], 1)
+        s.refresh_from_db()
+        self.assertEqual(s.status, Shipment.Status.IN_TRANSIT)
+        self.assertIsNone(s.tracking_checked_at)
+
+
+class ProductImageMetadataTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        override = override_settings(MEDIA_ROOT=media, PRODUCT_IMAGE_PROCESS_ON_UPLOAD=True)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, img, fmt="JPEG", **params):
+        buf = BytesIO()
+        img.save(buf, fmt, **params)
+        pi = ProductImage(product=self.product)
+        pi.image.save("photo.jpg" if fmt == "JPEG" else "photo.png", ContentFile(buf.getvalue()))
+        pi.refresh_from_db()
+        return pi
+
+    def test_exif_is_removed_from_original(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # 右に90度回転して表示
+        exif.get_ifd(0x8825)[2] = (35.0, 39.0, 0.0)  # GPSLatitude
+        pi = self.upload(Image.new("RGB", (40, 20), "red"), exif=exif.tobytes())
+
+        self.assertEqual(pi.renditions["source"], pi.image.name)
+        with pi.image.open("rb") as f:
+            stored = Image.open(f)
+            stored.load()
+        self.assertEqual(stored.size, (20, 40))
+        self.assertFalse(stored.getexif())
+        self.assertNotIn("exif", stored.info)
+        self.assertEqual((pi.width, pi.height), (20, 40))
+        # 差し替え前の原本は参照されなくなる
+        old = MediaBlob.objects.exclude(name=pi.image.name).filter(name__startswith="products/").exclude(
+            name__startswith="products/renditions/")
+        self.assertEqual(list(old.values_list("ref_count", flat=True)), [0])
+
+    def test_clean_original_is_kept(self):
+        pi = self.upload(Image.new("RGBA", (30, 30), (0, 0, 255, 128)), fmt="PNG")
+        self.assertEqual(pi.renditions["source"], pi.image.name)
+        self.assertEqual(MediaBlob.objects.get(name=pi.image.name).ref_count, 1)
+        self.assertFalse(MediaBlob.objects.filter(ref_count=0).exists())
+
+
+class ContentAddressedStorageTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        override = override_settings(MEDIA_ROOT=media, PRODUCT_IMAGE_PROCESS_ON_UPLOAD=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media = media
+
+    def test_concurrent_save_of_same_content_uses_existing_blob(self):
+        name = default_storage.save("products/a.txt", ContentFile(b"same"))
+        # exists() の後に別リクエストが同じ内容を書いた状況
+        with mock.patch.object(type(default_storage._wrapped), "exists", return_value=False):
+            again = default_storage.save("products/b.txt", ContentFile(b"same"))
+        self.assertEqual(again, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 2)
+        leftovers = [n for _d, _s, files in os.walk(self.media) for n in files if n.endswith(".part")]
+        self.assertEqual(leftovers, [])
+
+    def test_save_without_file_change_does_not_select(self):
+        pi = ProductImage(product=self.product)
+        pi.image.save("a.png", ContentFile(b"one"))
+        pi = ProductImage.objects.get(pk=pi.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            pi.save(update_fields=["width"])
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")])
+
+    def test_receivers_skip_models_without_counted_files(self):
+        shipment = self.make_shipment(tracking_no="TN-1")
+        with mock.patch("marketplace.models._counted_file_fields") as counted:
+            shipment.save()
+            shipment.delete()
+        counted.assert_not_called()
+
+    def test_replaced_file_is_released(self):
+        pi = ProductImage(product=self.product)
+        pi.image.save("a.png", ContentFile(b"one"))
+        first = pi.image.name
+        pi = ProductImage.objects.get(pk=pi.pk)
+        pi.image.save("b.png", ContentFile(b"two"))
+        self.assertEqual(MediaBlob.objects.get(name=first).ref_count, 0)
+        self.assertEqual(MediaBlob.objects.get(name=pi.image.name).ref_count, 1)
+        # 同じインスタンスでもう一度差し替えても、直前のファイルを手放す
+        second = pi.image.name
+        pi.image.save("c.png", ContentFile(b"three"))
+        self.assertEqual(MediaBlob.objects.get(name=second).ref_count, 0)
+
+
+class TransactionEventMigrationTests(MarketplaceTestCase):
+    def test_migration_backfill_matches_live_events(self):
+        for status in (Rental.Status.REQUESTED, Rental.Status.RETURNED, Rental.Status.COMPLETED):
+            self.make_rental(status=status)
+        Purchase.objects.create(product=self.product, buyer=self.buyer, seller=self.seller, status=Purchase.Status.CANCELED)
+        fields = ("user_id", "role", "kind", "source_id", "product_id", "event", "status")
+        live = sorted(TransactionEvent.objects.values_list(*fields))
+        TransactionEvent.objects.all().delete()
+
+        migration = importlib.import_module("marketplace.migrations.0031_backfill_transaction_events")
+        migration.backfill_events(apps, None)
+        self.assertEqual(sorted(TransactionEvent.objects.values_list(*fields)), live)
+        # 既にイベントがある取引には足さない
+        migration.backfill_events(apps, None)
+        self.assertEqual(TransactionEvent.objects.count(), len(live))
+
+
+class BackfillTransactionEventsTests(MarketplaceTestCase):
+    def test_backfill_rebuilds_events_eligibility_and_counts_idempotently(self):
+        self.make_rental(status=Rental.Status.COMPLETED)
+        Purchase.objects.create(product=self.product, buyer=self.buyer, seller=self.seller, status=Purchase.Status.COMPLETED)
+        # 履歴テーブル導入前の取引を再現する（イベントも資格も無く、件数はずれている）
+        TransactionEvent.objects.all().delete()
+        ReviewEligibility.objects.all().delete()
+        Profile.objects.filter(user=self.seller).update(completed_rentals=5, completed_purchases=0)
+
+        for _ in range(2):
+            call_command("backfill_transaction_events", stdout=io.StringIO())
+            self.assertEqual(TransactionEvent.objects.filter(event=TransactionEvent.COMPLETED).count(), 4)
+            self.assertTrue(ReviewEligibility.allows(self.buyer, self.product))
+            self.assertFalse(ReviewEligibility.allows(self.seller, self.product))
+            profile = Profile.objects.get(user=self.seller)
+            self.assertEqual((profile.completed_rentals, profile.completed_purchases), (1, 1))
+
+    def test_dry_run_writes_nothing(self):
+        self.make_rental(status=Rental.Status.COMPLETED)
+        TransactionEvent.objects.all().delete()
+        ReviewEligibility.objects.all().delete()
+        call_command("backfill_transaction_events", "--dry-run", stdout=io.StringIO())
+        self.assertFalse(TransactionEvent.objects.exists())
+        self.assertFalse(ReviewEligibility.objects.exists())
+
+
+class ReviewCounterTests(MarketplaceTestCase):
+    def profile(self):
+        return Profile.objects.get(user=self.seller)
+
+    def test_counts_follow_reviews(self):
+        review = Review.objects.create(product=self.product, user=self.buyer, rating=4)
+        self.assertEqual((self.profile().review_count, self.profile().rating_sum), (1, 4))
+        review.rating = 2
+        review.save()
+        self.assertEqual(self.profile().rating_sum, 2)
+        review.delete()
+        self.assertEqual((self.profile().review_count, self.profile().rating_sum), (0, 0))
+
+    def test_cached_product_skips_owner_query(self):
+        review = Review.objects.create(product=self.product, user=self.buyer, rating=4)
+        review.rating = 5
+        # 出品者は読み込み済みの product から取る（UPDATE だけで SELECT は出ない）
+        with CaptureQueriesContext(connection) as ctx:
+            review.save()
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")])
+
+    def test_decrement_stops_at_zero(self):
+        review = Review.objects.create(product=self.product, user=self.buyer, rating=5)
+        Profile.objects.filter(user=self.seller).update(review_count=0, rating_sum=1)
+        review.delete()
+        self.assertEqual((self.profile().review_count, self.profile().rating_sum), (0, 0))
+
+
+class PopularityTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user("other", "o@example.com", "pw")
+
+    def favorite_count(self):
+        return Product.objects.get(pk=self.product.pk).favorite_count
+
+    def test_favorites_keep_count(self):
+        fav = ProductFavorite.objects.create(user=self.buyer, product=self.product)
+        ProductFavorite.objects.create(user=self.other, product=self.product)
+        self.assertEqual(self.favorite_count(), 2)
+        fav.delete()
+        self.assertEqual(self.favorite_count(), 1)
+        Product.objects.filter(pk=self.product.pk).update(favorite_count=0)
+        ProductFavorite.objects.all().delete()
+        self.assertEqual(self.favorite_count(), 0)  # ずれていても負にならない
+
+    def test_refresh_scores_decay_and_recount(self):
+        tent = Product.objects.create(owner=self.seller, title="Tent", category="その他", price_per_day=50)
+        ProductFavorite.objects.create(user=self.buyer, product=self.product)
+        old = ProductFavorite.objects.create(user=self.buyer, product=tent)
+        ProductFavorite.objects.filter(pk=old.pk).update(created_at=timezone.now() - datetime.timedelta(days=7))
+        Product.objects.filter(pk=tent.pk).update(favorite_count=9)
+
+        call_command("refresh_product_popularity", "--recount", stdout=io.StringIO())
+        scores = dict(Product.objects.values_list("pk", "trending_score"))
+        self.assertAlmostEqual(scores[self.product.pk], 1.0, places=3)
+        self.assertAlmostEqual(scores[tent.pk], 0.5, places=3)
+        self.assertEqual(Product.objects.get(pk=tent.pk).favorite_count, 1)
+
+        data = APIClient().get(reverse("products-list"), {"ordering": "-trending_score"}).json()
+        items = data["results"] if isinstance(data, dict) else data
+        self.assertEqual([(p["id"], p["favorite_count"]) for p in items], [(self.product.pk, 1), (tent.pk, 1)])
+
+
+class FavoriteBatchTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Product.objects.create(owner=self.seller, title="Tent", category="その他", price_per_day=50)
+        self.api = APIClient()
+        self.api.force_authenticate(self.buyer)
+        self.url = reverse("products-favorites-batch")
+
+    def counts(self):
+        return dict(Product.objects.values_list("pk", "favorite_count"))
+
+    def test_batch_is_idempotent_and_keeps_counts(self):
+        ops = {"operations": [
+            {"op": "add", "product": self.product.pk},
+            {"op": "add", "product": self.other.pk},
+            {"op": "add", "product": 999999},
+        ]}
+        for _ in range(2):
+            r = self.api.post(self.url, ops, format="json")
+            self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["missing"], [999999])
+        self.assertEqual(self.counts(), {self.product.pk: 1, self.other.pk: 1})
+
+        r = self.api.post(self.url, {"operations": [
+            {"op": "remove", "product": self.product.pk},
+            {"op": "remove", "product": self.product.pk},
+        ]}, format="json")
+        self.assertEqual(r.json()["results"], [{"product": self.product.pk, "favorited": False, "favorite_count": 0}])
+        self.assertEqual(self.counts(), {self.product.pk: 0, self.other.pk: 1})
+        self.assertEqual(ProductFavorite.objects.count(), 1)
+
+    def test_last_operation_wins(self):
+        applied = apply_favorite_operations(self.buyer, [(self.product.pk, True), (self.product.pk, False)])
+        self.assertEqual(applied, {self.product.pk: False})
+        self.assertFalse(ProductFavorite.objects.exists())
+
+    def test_invalid_batch_is_rejected(self):
+        r = self.api.post(self.url, {"operations": [{"op": "toggle", "product": self.product.pk}]}, format="json")
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(ProductFavorite.objects.exists())
@@ -0,0 +1,146 @@
+"""配送会社の追跡ステータスを照会して Shipment に反映する（poll_shipment_tracking コマンドから使う）。
+
+配送会社ごとのアダプタは settings.SHIPMENT_CARRIERS で差し替える:
+
+    SHIPMENT_CARRIERS = {
+        "default": {
+            "ADAPTER": "marketplace.tracking.HttpCarrierAdapter",
+            "OPTIONS": {"url": "https://tracking.example.com/api/{tracking_no}"},
+            "RATE": 5,  # 1秒あたりの最大照会数
+        },
+    }
+
+HttpCarrierAdapter は requests を使う（README のインストール手順に含まれる）。
+"""
+import abc
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from marketplace.models import Shipment
+from marketplace.utils import normalize_status, apply_status_by_id
+
+
+DEFAULT_CARRIER = "default"
+
+
+class CarrierAdapter(abc.ABC):
+    """配送会社アダプタの基底。fetch() は追跡番号のステータス（Shipment.Status の値）を返す。
+    不明・照会失敗は空文字を返す。"""
+
+    @abc.abstractmethod
+    def fetch(self, tracking_no):
+        """追跡番号のステータスを返す"""
+
+
+class FileCarrierAdapter(CarrierAdapter):
+    """ローカルの JSON（{追跡番号: ステータス}）を配送会社の代わりに使う。開発・検証用"""
+
+    def __init__(self, path):
+        self.path = path
+        self._statuses = None
+
+    def fetch(self, tracking_no):
+        if self._statuses is None:
+            with open(self.path, encoding="utf-8") as f:
+                self._statuses = json.load(f)
+        return normalize_status(self._statuses.get(tracking_no))
+
+
+class HttpCarrierAdapter(CarrierAdapter):
+    """GET {url} の JSON レスポンスから status を読む。url には {tracking_no} を含める"""
+
+    def __init__(self, url, timeout=10, status_key="status"):
+        try:
+            import requests  # noqa: F401
+        except ImportError as exc:
+            # 照会のたびに全件失敗するより、load_carriers() の時点で設定ミスとして止める
+            raise ImproperlyConfigured("HttpCarrierAdapter には requests が必要です（pip install requests）") from exc
+        self.url = url
+        self.timeout = timeout
+        self.status_key = status_key
+
+    def fetch(self, tracking_no):
+        import requests
+
+        try:
+            res = requests.get(self.url.format(tracking_no=tracking_no), timeout=self.timeout)
+            res.raise_for_status()
+            return normalize_status(res.json().get(self.status_key))
+        except (requests.RequestException, ValueError, AttributeError):
+            return ""
+
+
+class RateLimiter:
+    """スレッド間で共有する、1秒あたり rate 回までの単純な間隔制御"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+def load_carriers():
+    """settings.SHIPMENT_CARRIERS から {キー: (アダプタ, RateLimiter)} を作る"""
+    carriers = {}
+    for key, conf in getattr(settings, "SHIPMENT_CARRIERS", {}).items():
+        adapter = import_string(conf["ADAPTER"])(**conf.get("OPTIONS", {}))
+        carriers[key] = (adapter, RateLimiter(conf.get("RATE", 0)))
+    return carriers
+
+
+def poll_shipments(carriers=None, limit=200, workers=4, dry_run=False, advance=True):
+    """輸送中の配送を照会の古い順に最大 limit 件取り、配送会社へ並列に問い合わせて反映する。
+    DB の読み書きは呼び出し元スレッドだけで行い、ワーカーは HTTP 等の照会だけを担当する。"""
+    carriers = load_carriers() if carriers is None else carriers
+    rows = list(
+        Shipment.objects
+        .filter(status=Shipment.Status.IN_TRANSIT)
+        .exclude(tracking_no="")
+        .order_by(F("tracking_checked_at").asc(nulls_first=True), "id")
+        .values_list("id", "tracking_no", "carrier")[:limit]
+    )
+    targets = [(sid, tn, carriers.get(carrier or DEFAULT_CARRIER)) for sid, tn, carrier in rows]
+    skipped = sum(1 for t in targets if t[2] is None)
+    targets = [t for t in targets if t[2] is not None]
+
+    def check(target):
+        sid, tracking_no, (adapter, limiter) = target
+        limiter.wait()
+        try:
+            return sid, adapter.fetch(tracking_no)
+        except Exception:
+            return sid, ""
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(check, targets))
+
+    # 照会できたもの（ステータスが返ってきたもの）だけを、照会した配送の id に対して一括更新する
+    report = apply_status_by_id(
+        {sid: status for sid, status in results if status},
+        dry_run=dry_run,
+        advance=advance,
+    )
+    if not dry_run and targets:
+        Shipment.objects.filter(id__in=[t[0] for t in targets]).update(tracking_checked_at=timezone.now())
+    report["polled"] = len(targets)
+    report["no_carrier"] = skipped
+    report["no_answer"] = sum(1 for _sid, status in results if not status)
+    return report
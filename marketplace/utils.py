@@ -0,0 +1,253 @@
+import csv
+import json
+from collections import defaultdict
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from marketplace.models import (
+    Purchase, Rental, RentalApplication, Shipment, TransactionEvent,
+    record_transaction_events, refresh_active_rental,
+)
+
+
+STATUS_BATCH_SIZE = 500
+
+
+def normalize_status(value):
+    """値（delivered）でも表示名（配達完了）でも受け付ける。不正なら空文字"""
+    value = str(value or "").strip()
+    for code, label in Shipment.Status.choices:
+        if value.lower() == code or value == str(label):
+            return code
+    return ""
+
+
+def iter_status_rows(stream, fmt="csv"):
+    """CSV / JSONL を1行ずつ読み、(行番号, 追跡番号, ステータス) を返す。
+    CSV は tracking_no（または tracking_number）と status の列を持つこと。"""
+    if fmt == "jsonl":
+        for lineno, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                yield lineno, "", ""
+                continue
+            if not isinstance(data, dict):  # 配列や数値だけの行も不正な行として数える
+                yield lineno, "", ""
+                continue
+            yield lineno, str(data.get("tracking_no") or data.get("tracking_number") or "").strip(), data.get("status")
+        return
+
+    reader = csv.DictReader(stream)
+    for row in reader:
+        tracking = (row.get("tracking_no") or row.get("tracking_number") or "").strip()
+        yield reader.line_num, tracking, row.get("status")
+
+
+def _empty_report():
+    return {
+        "rows": 0,
+        "matched": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "unknown": [],
+        "invalid": [],
+        "transitions": {"rental": 0, "purchase": 0, "application": 0},
+    }
+
+
+def _merge_report(total, part):
+    for key in ("rows", "matched", "updated", "unchanged"):
+        total[key] += part[key]
+    total["unknown"].extend(part["unknown"])
+    total["invalid"].extend(part["invalid"])
+    for key, n in part["transitions"].items():
+        total["transitions"][key] += n
+    return total
+
+
+def _apply(rows, target_of, report, dry_run, advance=True):
+    """取得済みの Shipment 行(values)に対して、状態ごとに UPDATE を1本ずつ発行する"""
+    delivered = getattr(Shipment.Status, "DELIVERED", "delivered")
+    outbound = getattr(Shipment.Direction, "OUTBOUND", "outbound")
+    ids_by_status = defaultdict(list)
+    arrived = []
+    for r in rows:
+        report["matched"] += 1
+        target = target_of(r)
+        if r["status"] == target:
+            report["unchanged"] += 1
+            continue
+        ids_by_status[target].append(r["id"])
+        if target == delivered and r["direction"] == outbound:
+            arrived.append(r)
+    report["updated"] += sum(len(ids) for ids in ids_by_status.values())
+
+    with transaction.atomic():
+        if not dry_run:
+            now = timezone.now()
+            for status, ids in ids_by_status.items():
+                # update() は auto_now を更新しないので updated_at も明示する
+                Shipment.objects.filter(id__in=ids).update(status=status, updated_at=now)
+        transitions = _advance_arrived(arrived, dry_run) if advance else {}
+    for key, n in transitions.items():
+        report["transitions"][key] += n
+    return report
+
+
+def _advance_arrived(rows, dry_run=False):
+    """往路が配達完了になった取引を、受取完了と同じ状態へまとめて進める。
+    取引ごとの画面操作（受取完了ボタン）と同じく、発送済みのものだけが対象。"""
+    rental_ids = [r["rental_id"] for r in rows if r["rental_id"]]
+    purchase_ids = [r["purchase_id"] for r in rows if r["purchase_id"]]
+    app_ids = [r["application_id"] for r in rows if r["application_id"]]
+
+    rentals = Rental.objects.filter(id__in=rental_ids, status=Rental.Status.SHIPPED)
+    purchases = Purchase.objects.filter(id__in=purchase_ids, status=Purchase.Status.SHIPPED)
+    apps = RentalApplication.objects.filter(id__in=app_ids, status=RentalApplication.Status.SHIPPED)
+    if dry_run:
+        return {"rental": rentals.count(), "purchase": purchases.count(), "application": apps.count()}
+
+    rental_rows = list(rentals.values_list("id", "seller_id", "product_title", "renter_id", "product_id"))
+    purchase_rows = list(purchases.values_list("id", "seller_id", "product_id", "buyer_id", "product_title"))
+    app_rows = list(apps.values_list("id", "owner_id", "product__title", "renter_id", "product_id"))
+
+    now = timezone.now()
+    Rental.objects.filter(id__in=[r[0] for r in rental_rows]).update(
+        status=Rental.Status.RENTING, received_date_by_renter=now, rental_start_date=now,
+    )
+    Purchase.objects.filter(id__in=[p[0] for p in purchase_rows]).update(
+        status=Purchase.Status.COMPLETED, completed_date=now,
+    )
+    # 購入が完了した商品について、同じ購入者のレンタル中の取引を閉じる（_close_active_rental_for_purchase の一括版）
+    closed_rentals, closed_apps = [], []
+    pairs = {(p[2], p[3]) for p in purchase_rows}
+    if pairs:
+        same_item = reduce(or_, (Q(product_id=prod, renter_id=buyer) for prod, buyer in pairs))
+        closed_rentals = list(
+            Rental.objects.filter(same_item, status=Rental.Status.RENTING)
+            .values_list("id", "product_id", "renter_id", "seller_id")
+        )
+        Rental.objects.filter(id__in=[r[0] for r in closed_rentals]).update(
+            status=Rental.Status.COMPLETED, completed_date=now,
+        )
+        closed_apps = list(
+            RentalApplication.objects.filter(
+                same_item,
+                order_type=RentalApplication.OrderType.RENTAL,
+                status__in=["renting", "received"],
+            ).values_list("id", "product_id", "renter_id", "owner_id")
+        )
+        RentalApplication.objects.filter(id__in=[a[0] for a in closed_apps]).update(
+            status=RentalApplication.Status.COMPLETED,
+        )
+    RentalApplication.objects.filter(id__in=[a[0] for a in app_rows]).update(status="renting")
+
+    # update() はシグナルを飛ばさないので、取引イベントと借り手のレンタル中フラグはここで直す
+    Kind = TransactionEvent.Kind
+    record_transaction_events(Kind.RENTAL, [(r[0], r[4], r[3], r[1]) for r in rental_rows], Rental.Status.RENTING, now)
+    record_transaction_events(Kind.PURCHASE, [(p[0], p[2], p[3], p[1]) for p in purchase_rows], Purchase.Status.COMPLETED, now)
+    record_transaction_events(Kind.RENTAL, closed_rentals, Rental.Status.COMPLETED, now)
+    record_transaction_events(Kind.APPLICATION, closed_apps, RentalApplication.Status.COMPLETED, now)
+    record_transaction_events(Kind.APPLICATION, [(a[0], a[4], a[3], a[1]) for a in app_rows], "renting", now)
+    refresh_active_rental({r[3] for r in rental_rows} | {p[3] for p in purchase_rows} | {a[3] for a in app_rows})
+
+    _notify_arrivals(rental_rows, purchase_rows, app_rows)
+    return {"rental": len(rental_rows), "purchase": len(purchase_rows), "application": len(app_rows)}
+
+
+def _notify_arrivals(rental_rows, purchase_rows, app_rows):
+    try:
+        from notifications.models import Notification
+    except Exception:
+        return
+
+    notes = []
+    for _id, seller_id, title, _renter_id, _product_id in rental_rows:
+        if seller_id:
+            notes.append(Notification(user_id=seller_id, kind="rental",
+                body=f"商品受け取り完了 - 「{title}」が借り手に届き、レンタルが開始されました。"))
+    for _id, seller_id, _product_id, _buyer_id, title in purchase_rows:
+        if seller_id:
+            notes.append(Notification(user_id=seller_id, kind="purchase",
+                body=f"商品受け取り完了 - 「{title}」が購入者に届きました。"))
+    for _id, owner_id, title, _renter_id, _product_id in app_rows:
+        notes.append(Notification(user_id=owner_id, kind="rental",
+            body=f"レンタル開始 - 「{title}」のレンタルが開始されました。"))
+    if notes:
+        Notification.objects.bulk_create(notes, batch_size=STATUS_BATCH_SIZE)
+
+
+SHIPMENT_ROW_FIELDS = ("id", "tracking_no", "status", "direction", "rental_id", "purchase_id", "application_id")
+
+
+def set_shipment_status(ids, status, dry_run=False):
+    """管理画面の一括操作: 選択した配送をまとめて同じ状態にする"""
+    report = _empty_report()
+    status = normalize_status(status)
+    ids = [int(i) for i in ids if str(i).isdigit()]
+    report["rows"] = len(ids)
+    if not status:
+        report["invalid"] = ids
+        return report
+    rows = list(Shipment.objects.filter(id__in=ids).values(*SHIPMENT_ROW_FIELDS))
+    found = {r["id"] for r in rows}
+    report["unknown"] = [i for i in ids if i not in found]
+    return _apply(rows, lambda r: status, report, dry_run)
+
+
+def apply_status_rows(rows, dry_run=False, batch_size=STATUS_BATCH_SIZE, advance=True):
+    """(行番号, 追跡番号, ステータス) の並びを batch_size 行ずつ取り込み、集計レポートを返す。
+    追跡番号で照合し、1バッチにつき SELECT 1本 + 状態ごとの UPDATE で反映する。
+    全体を1トランザクションで包むので、途中で読み込みエラーが起きたら先行バッチも含めて何も反映しない。"""
+    total = _empty_report()
+    rows = iter(rows)
+    with transaction.atomic():
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                return total
+            _merge_report(total, _apply_chunk(chunk, dry_run, advance))
+
+
+def apply_status_by_id(statuses, dry_run=False, advance=True):
+    """{Shipment の id: ステータス} をそのまま反映する（配送会社への照会結果用）。
+    追跡番号で照合すると同じ番号の別の配送まで書き換えてしまうので、照会した行だけに当てる。"""
+    report = _empty_report()
+    wanted = {}
+    for sid, status in statuses.items():
+        report["rows"] += 1
+        code = normalize_status(status)
+        if code:
+            wanted[sid] = code
+        else:
+            report["invalid"].append(sid)
+    rows = list(Shipment.objects.filter(id__in=list(wanted)).values(*SHIPMENT_ROW_FIELDS))
+    found = {r["id"] for r in rows}
+    report["unknown"] = [sid for sid in wanted if sid not in found]
+    return _apply(rows, lambda r: wanted[r["id"]], report, dry_run, advance)
+
+
+def _apply_chunk(chunk, dry_run, advance=True):
+    report = _empty_report()
+    wanted = {}
+    for lineno, tracking, status in chunk:
+        report["rows"] += 1
+        code = normalize_status(status)
+        if not tracking or not code:
+            report["invalid"].append(lineno)
+            continue
+        wanted[tracking] = code  # 同じ追跡番号が複数行あれば後勝ち
+
+    rows = list(Shipment.objects.filter(tracking_no__in=list(wanted)).values(*SHIPMENT_ROW_FIELDS))
+    found = {r["tracking_no"] for r in rows}
+    report["unknown"] = [t for t in wanted if t not in found]
+    return _apply(rows, lambda r: wanted[r["tracking_no"]], report, dry_run, advance)
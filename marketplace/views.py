@@ -4,9 +4,12 @@ from django.shortcuts import render
 from rest_framework import viewsets, permissions, decorators, response, status, parsers
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from .models import Product, ProductImage, Rental, Purchase, Review
+from .models import Product, ProductImage, Rental, Purchase, Review, apply_favorite_operations, set_favorite
 
-from .serializers import ProductSerializer, ProductImageSerializer, RentalSerializer, PurchaseSerializer, ReviewSerializer
+from .serializers import (
+    ProductSerializer, ProductImageSerializer, RentalSerializer, PurchaseSerializer, ReviewSerializer,
+    FavoriteBatchSerializer,
+)
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -23,17 +26,43 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         return False
 
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.select_related("owner").prefetch_related("images")
+    queryset = Product.objects.select_related("owner", "owner__profile").prefetch_related("images")
     serializer_class = ProductSerializer
     permission_classes = [IsOwnerOrReadOnly]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ["category","status","owner"]
     search_fields = ["title","description","category"]
-    ordering_fields = ["created_at","price_per_day","price_buy"]
+    ordering_fields = ["created_at","price_per_day","price_buy","favorite_count","trending_score"]
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    @decorators.action(detail=True, methods=["put", "delete"], permission_classes=[permissions.IsAuthenticated])
+    def favorite(self, request, pk=None):
+        """PUT で登録、DELETE で解除。何度呼んでも結果は同じ（冪等）"""
+        product = self.get_object()
+        favorited = request.method == "PUT"
+        set_favorite(request.user, product.pk, favorited)
+        count = Product.objects.filter(pk=product.pk).values_list("favorite_count", flat=True).first() or 0
+        return response.Response({"product": product.pk, "favorited": favorited, "favorite_count": count})
+
+    @decorators.action(detail=False, methods=["post"], url_path="favorites/batch",
+                       permission_classes=[permissions.IsAuthenticated])
+    def favorites_batch(self, request):
+        """{"operations": [{"op": "add" | "remove", "product": id}, ...]} を1トランザクションで反映する"""
+        serializer = FavoriteBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ops = [(o["product"], o["op"] == "add") for o in serializer.validated_data["operations"]]
+        applied = apply_favorite_operations(request.user, ops)
+        counts = dict(Product.objects.filter(pk__in=applied).values_list("pk", "favorite_count"))
+        return response.Response({
+            "results": [
+                {"product": pid, "favorited": fav, "favorite_count": counts.get(pid, 0)}
+                for pid, fav in applied.items()
+            ],
+            "missing": sorted({pid for pid, _ in ops} - set(applied)),
+        })
+
 class ProductImageViewSet(viewsets.ModelViewSet):
     serializer_class = ProductImageSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -0,0 +1,134 @@
+"""メディア / 静的ファイルの配信。
+
+- MEDIA_SENDFILE が "x-accel" / "x-sendfile" なら、ファイル本体は前段の nginx / Apache に任せ、
+  Django はヘッダだけ返す（ワーカーを画像転送で占有しない）。
+- それ以外は Django が返すが、ETag / Last-Modified / Range と Cache-Control を付ける。
+  内容ハッシュ名（mura_share.storage）のメディアとハッシュ付き静的ファイルは中身が変わらないので1年キャッシュ。
+  Django が本体を返すのは開発時（DEBUG）だけの想定で、本番のメディアは MEDIA_SENDFILE で前段に任せる
+  （どちらでもなければ URL 自体を登録しない。mura_share/urls.py 参照）。
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+DEFAULT_MAX_AGE = 60 * 60
+
+# <sha256先頭2桁>/<sha256>.ext（メディア） / name.<12桁のハッシュ>.ext（静的ファイル）
+_IMMUTABLE_NAME = re.compile(r"(?:^|/)[0-9a-f]{2}/[0-9a-f]{64}\.\w+$|\.[0-9a-f]{12}\.\w+$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+def _cache_control(name):
+    if _IMMUTABLE_NAME.search(name):
+        return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return f"public, max-age={DEFAULT_MAX_AGE}"
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _read_range(path, start, length):
+    """start から length バイトを RANGE_CHUNK_SIZE ずつ返す（範囲全体をメモリに載せない）"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def _serve_file(request, root, name, encodings=()):
+    try:
+        fullpath = safe_join(root, name)
+    except Exception:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    content_type = content_type or "application/octet-stream"
+
+    # 圧縮済みファイル（.br / .gz）があり、ブラウザが受け付けるならそちらを返す
+    encoding = None
+    accept = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    for enc, ext in encodings:
+        if enc in accept and os.path.isfile(fullpath + ext):
+            fullpath, encoding = fullpath + ext, enc
+            break
+
+    stat = os.stat(fullpath)
+    etag = _etag(stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": _cache_control(name),
+        "Accept-Ranges": "bytes",
+    }
+    if encodings:
+        headers["Vary"] = "Accept-Encoding"
+
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if_modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE") or "")
+    if (if_none_match and etag in if_none_match) or (
+        not if_none_match and if_modified_since and int(stat.st_mtime) <= if_modified_since
+    ):
+        response = HttpResponseNotModified()
+        for k, v in headers.items():
+            response[k] = v
+        return response
+
+    sendfile = getattr(settings, "MEDIA_SENDFILE", "")
+    if sendfile and not encoding:
+        response = HttpResponse(content_type=content_type)
+        if sendfile == "x-accel":
+            # nginx: location ^~ /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+            response["X-Accel-Redirect"] = getattr(settings, "MEDIA_ACCEL_PREFIX", "/protected-media/") + name
+        else:
+            response["X-Sendfile"] = fullpath
+        for k, v in headers.items():
+            response[k] = v
+        return response
+
+    size = stat.st_size
+    match = _RANGE.match(request.META.get("HTTP_RANGE", "")) if not encoding else None
+    if match and (match.group(1) or match.group(2)):
+        start, end = match.groups()
+        if start:
+            start, end = int(start), min(int(end) if end else size - 1, size - 1)
+        else:
+            start, end = max(size - int(end), 0), size - 1
+        if start > end or start >= size:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        response = StreamingHttpResponse(
+            _read_range(fullpath, start, end - start + 1), status=206, content_type=content_type
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        response = FileResponse(open(fullpath, "rb"), content_type=content_type)
+        if encoding:
+            response["Content-Encoding"] = encoding
+    for k, v in headers.items():
+        response[k] = v
+    return response
+
+
+def serve_media(request, path):
+    return _serve_file(request, str(settings.MEDIA_ROOT), path)
+
+
+def serve_static(request, path):
+    """collectstatic 済みの STATIC_ROOT から返す（前段に nginx を置かない構成用）"""
+    return _serve_file(request, str(settings.STATIC_ROOT), path, encodings=(("br", ".br"), ("gzip", ".gz")))
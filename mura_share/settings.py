@@ -59,6 +59,13 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# ログイン済みユーザーの読み込みで profile も JOIN する（accounts/backends.py）。
+# ModelBackend は切り替え前のセッション用（ログインし直すと ProfileModelBackend に移る）
+AUTHENTICATION_BACKENDS = [
+    "accounts.backends.ProfileModelBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+
 ROOT_URLCONF = "mura_share.urls"
 
 TEMPLATES = [
@@ -90,6 +97,8 @@ DATABASES = {
         "NAME": BASE_DIR / "db.sqlite3",
     }
 }
+# 配送管理のキーワード検索の索引: SQLite では marketplace 0030 の FTS5 trigram 表（3文字以上の語に効く）、
+# PostgreSQL では 0020 / 0028 の pg_trgm GIN 索引を使う。FTS5 が無い SQLite では索引なしの LIKE 検索になる。
 # 例：PostgreSQL にする場合
 # DATABASES = {
 #     "default": {
@@ -102,6 +111,43 @@ DATABASES = {
 #     }
 # }
 
+# ─────────────────────────────────────────────────────────
+# キャッシュ / セッション
+# ─────────────────────────────────────────────────────────
+# REDIS_URL があれば Redis（複数台構成。要 redis パッケージ）。無ければ1台構成向けに、
+# default はプロセス内メモリ、セッションはプロセス間・再起動後も共有できるファイルキャッシュ
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL},
+        "sessions": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "session",
+        },
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "sessions": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / ".cache" / "sessions",
+            "OPTIONS": {"MAX_ENTRIES": 100000},
+        },
+    }
+
+# セッションの保存先。"cache"（既定）/ "signed_cookies" ではページ表示ごとの django_session への
+# SELECT / UPDATE が無くなる。"cached_db" / "db" は従来どおり DB に書く。
+# 期限切れの掃除は python manage.py cleanup_sessions（cron 等で定期実行）
+SESSION_MODE = os.getenv("SESSION_MODE", "cache")
+SESSION_ENGINE = {
+    "cache": "django.contrib.sessions.backends.cache",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "db": "django.contrib.sessions.backends.db",
+}[SESSION_MODE]
+SESSION_CACHE_ALIAS = "sessions"
+
 # ─────────────────────────────────────────────────────────
 # パスワードバリデータ（デフォルト）
 # ─────────────────────────────────────────────────────────
@@ -131,6 +177,21 @@ STATIC_ROOT = BASE_DIR / "staticfiles"  # collectstatic 用（本番）
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# アップロードは内容ハッシュ名で保存し、同じ内容は1ファイルにまとめる（参照が無くなったものは gc_media で削除）
+STORAGES = {
+    "default": {"BACKEND": "mura_share.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+if not DEBUG:
+    # 本番: collectstatic でハッシュ付きファイル名 + .gz/.br を作る（要 collectstatic）
+    STORAGES["staticfiles"]["BACKEND"] = "mura_share.storage.CompressedManifestStaticFilesStorage"
+
+# メディア配信（mura_share/serving.py）。"x-accel"（nginx）/ "x-sendfile"（Apache）で前段に転送を任せる
+MEDIA_SENDFILE = os.getenv("MEDIA_SENDFILE", "")
+MEDIA_ACCEL_PREFIX = "/protected-media/"
+# 前段サーバーを置かずに Django から STATIC_ROOT を配信する場合は 1
+SERVE_STATIC = os.getenv("SERVE_STATIC", "") == "1"
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # ─────────────────────────────────────────────────────────
@@ -148,7 +209,7 @@ CORS_ALLOW_ALL_ORIGINS = True
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
@@ -166,8 +227,13 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
+    # username / 表示名 / スタッフ権限をトークンに入れる（accounts/authentication.py）
+    "TOKEN_OBTAIN_SERIALIZER": "accounts.authentication.ClaimsTokenObtainPairSerializer",
 }
 
+# API 認証で読み込んだ User / Profile をプロセス内で使い回す秒数（User / Profile の保存で即破棄）
+JWT_USER_CACHE_TTL = 30
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "MURAシェア API",
     "DESCRIPTION": "Graduation Project API (Django + DRF)",
@@ -190,3 +256,14 @@ LOGOUT_REDIRECT_URL = '/login/'
 STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_DIRS = [BASE_DIR / "static"]  # ← 追加
+
+# 配送追跡のポーリング（python manage.py poll_shipment_tracking）。書式は marketplace/tracking.py を参照
+SHIPMENT_CARRIERS = {}
+
+# 商品画像のサイズ別画像をアップロード時に作る（False なら process_product_images コマンドでまとめて作る）
+PRODUCT_IMAGE_PROCESS_ON_UPLOAD = True
+
+# 商品詳細ページの共通部分（画像・評価・コメント / レビューの1ページ目）のキャッシュ秒数。
+# 画像・コメント・レビュー・投稿者の表示名が変われば版番号（Product.detail_version。DB の列なので
+# 全ワーカーで共有）が上がるので、期限は古い版を掃除するためのもの
+PRODUCT_DETAIL_CACHE_TIMEOUT = 600
@@ -0,0 +1,112 @@
+"""アップロードファイルを内容のハッシュ名で保存するストレージ（同じ内容は1ファイルだけ持つ）。
+
+保存先は upload_to のディレクトリ配下の <sha256先頭2桁>/<sha256><拡張子>。
+参照数は marketplace.MediaBlob に持ち、save で +1、delete で -1 するだけで実ファイルは消さない。
+参照が 0 になったファイルは gc_media コマンドがまとめて削除する。
+
+静的ファイル用の圧縮済みファイル付きストレージも末尾に置いている。
+"""
+import gzip
+import hashlib
+import os
+import uuid
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # 実際の名前は _save で内容から決めるので、ここでは重複回避の改名をしない
+        return name
+
+    def _save(self, name, content):
+        digest = content_hash(content)
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest[:2], digest + ext).replace("\\", "/")
+        if not self.exists(name):
+            self._publish(name, content)
+        self._retain(name, digest, content.size)
+        return name
+
+    def _publish(self, name, content):
+        """一時名で書き切ってから本来の名前に置く。同じ内容を同時に保存した別リクエストが
+        先に置いていれば（FileExistsError）、そのファイルを保存済みとして使う"""
+        temp_name = super()._save(f"{name}.{uuid.uuid4().hex}.part", content)
+        temp_path = self.path(temp_name)
+        try:
+            os.link(temp_path, self.path(name))
+        except FileExistsError:
+            pass
+        except OSError:
+            # ハードリンクを作れないファイルシステム。中身は同じなので上書きしてよい
+            os.replace(temp_path, self.path(name))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def delete(self, name):
+        # 他の行が同じ内容を参照しているかもしれないので、参照数を減らすだけにする
+        if name:
+            self._release(name)
+
+    def purge(self, name):
+        """実ファイルを削除する（gc_media 専用）"""
+        super().delete(name)
+
+    def _retain(self, name, digest, size):
+        from marketplace.models import MediaBlob
+
+        blob, created = MediaBlob.objects.get_or_create(
+            name=name, defaults={"sha256": digest, "size": size or 0, "ref_count": 1}
+        )
+        if not created:
+            MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") + 1)
+
+    def _release(self, name):
+        from marketplace.models import MediaBlob
+
+        MediaBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F("ref_count") - 1)
+
+
+# ========= 静的ファイル =========
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".html", ".map", ".xml")
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """collectstatic でハッシュ付きファイル名にし、テキスト系は .gz（brotli があれば .br も）を並べて置く。
+    配信側（nginx の gzip_static / brotli_static、または serving.serve_static）が圧縮済みをそのまま返せる。"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not dry_run and isinstance(hashed_name, str) and hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self._write_compressed(hashed_name)
+            yield name, hashed_name, processed
+
+    def _write_compressed(self, name):
+        path = self.path(name)
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        try:
+            import brotli
+        except ImportError:
+            return
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data))
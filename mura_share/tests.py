@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from mura_share import serving
+from mura_share.serving import serve_media
+
+CONTENT = bytes(range(256)) * 1024  # 256KiB（RANGE_CHUNK_SIZE より大きい）
+
+
+class ServeMediaTests(SimpleTestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        override = override_settings(MEDIA_ROOT=media, MEDIA_SENDFILE="")
+        override.enable()
+        self.addCleanup(override.disable)
+        self.name = "products/ab/" + "a" * 64 + ".jpg"
+        os.makedirs(os.path.join(media, "products", "ab"))
+        with open(os.path.join(media, self.name), "wb") as f:
+            f.write(CONTENT)
+        self.factory = RequestFactory()
+
+    def get(self, name=None, **headers):
+        return serve_media(self.factory.get("/media/x", **headers), name or self.name)
+
+    def test_full_response_has_cache_headers(self):
+        r = self.get()
+        self.assertEqual(r.status_code, 200)
+        self.assertIn("immutable", r["Cache-Control"])
+        self.assertEqual(r["Accept-Ranges"], "bytes")
+        self.assertEqual(b"".join(r.streaming_content), CONTENT)
+
+    def test_conditional_requests_get_304(self):
+        etag = self.get()["ETag"]
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        last_modified = self.get()["Last-Modified"]
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_ranges_are_streamed_in_chunks(self):
+        r = self.get(HTTP_RANGE="bytes=0-")
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(r["Content-Range"], f"bytes 0-{len(CONTENT) - 1}/{len(CONTENT)}")
+        chunks = list(r.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(c) <= serving.RANGE_CHUNK_SIZE for c in chunks))
+        self.assertEqual(b"".join(chunks), CONTENT)
+
+        r = self.get(HTTP_RANGE="bytes=10-19")
+        self.assertEqual((r["Content-Length"], b"".join(r.streaming_content)), ("10", CONTENT[10:20]))
+        r = self.get(HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(r.streaming_content), CONTENT[-5:])
+
+    def test_unsatisfiable_range_is_416(self):
+        r = self.get(HTTP_RANGE=f"bytes={len(CONTENT)}-")
+        self.assertEqual(r.status_code, 416)
+        self.assertEqual(r["Content-Range"], f"bytes */{len(CONTENT)}")
+
+    def test_sendfile_returns_headers_only(self):
+        with self.settings(MEDIA_SENDFILE="x-accel"):
+            r = self.get()
+        self.assertEqual(r["X-Accel-Redirect"], "/protected-media/" + self.name)
+        self.assertEqual(r.content, b"")
+        self.assertIn("ETag", r)
+
+    def test_paths_outside_media_root_are_404(self):
+        for name in ("../settings.py", "products/missing.jpg"):
+            with self.subTest(name=name), self.assertRaises(Http404):
+                self.get(name)
@@ -1,5 +1,4 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
@@ -10,7 +9,8 @@ from marketplace.views import ProductViewSet, ProductImageViewSet, RentalViewSet
 from chat.views import ChatRoomViewSet, ChatMessageViewSet
 from notifications.views import NotificationViewSet
 from accounts.views import RegisterView, MeView
-from django.urls import path, include
+from django.urls import path, include, re_path
+from mura_share.serving import serve_media, serve_static
 router = routers.DefaultRouter()
 router.register(r"products", ProductViewSet, basename="products")
 router.register(r"rentals", RentalViewSet, basename="rentals")
@@ -43,8 +43,20 @@ urlpatterns = [
     path("api/v1/auth/me/", MeView.as_view(), name="me"),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
-    
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+# メディア（ETag / Range / Cache-Control 付き）。本番（DEBUG=False）で Django にファイル本体を流させないよう、
+# 開発時か MEDIA_SENDFILE（前段の nginx / Apache に転送）を設定したときだけ登録する。
+# どちらでもなければ前段サーバーが MEDIA_ROOT を直接配信する
+if settings.DEBUG or settings.MEDIA_SENDFILE:
+    urlpatterns.append(
+        re_path(r"^%s(?P<path>.+)$" % settings.MEDIA_URL.lstrip("/"), serve_media, name="media")
+    )
+
+if settings.SERVE_STATIC:
+    urlpatterns.append(
+        re_path(r"^%s(?P<path>.+)$" % settings.STATIC_URL.lstrip("/"), serve_static, name="static")
+    )
 
 # 既存の urlpatterns の下など、モジュール直下にこれを追加
 handler403 = "frontend.views.error_403"
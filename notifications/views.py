@@ -10,7 +10,8 @@ class NotificationViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user).order_by("-created_at")
+        # id はトークンから取れるので User を読み込まない
+        return Notification.objects.filter(user_id=self.request.user.id).order_by("-created_at")
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)